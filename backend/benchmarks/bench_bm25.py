@@ -0,0 +1,100 @@
+"""
+Benchmark de latencia de bm25_score sobre términos frecuentes y raros:
+implementación original (un SELECT de longitud por posting, copiada
+abajo) frente a la actual. Comprueba además que ambos rankings coinciden.
+
+Uso:
+    python backend/benchmarks/bench_bm25.py [n_docs] [repeticiones]
+"""
+import math
+import os
+import sys
+import tempfile
+import time
+
+import synthetic
+from app.index.bm25 import bm25_score
+from app.index.indexer import index_documents
+from app.index.storage import get_connection
+
+
+def bm25_score_per_posting(query_terms, k1=1.5, b=0.75, topk=10):
+    """
+    Implementación original de bm25_score.
+    """
+    con = get_connection()
+    cur = con.cursor()
+
+    row = cur.execute("SELECT value FROM meta WHERE key='N'").fetchone()
+    N = row[0] if row else 0
+    row = cur.execute("SELECT value FROM meta WHERE key='avgdl'").fetchone()
+    avgdl = row[0] if row else 1
+
+    qtf = {}
+    for t in query_terms:
+        qtf[t] = qtf.get(t, 0) + 1
+
+    scores = {}
+    for term in qtf.keys():
+        row = cur.execute("SELECT term_id, df FROM terms WHERE term=?", (term,)).fetchone()
+        if not row:
+            continue
+        term_id, df = row[0], float(row[1])
+        idf = math.log(1 + (N - df + 0.5) / (df + 0.5))
+
+        for doc_id, tf in cur.execute("SELECT doc_id, tf FROM postings WHERE term_id=?", (term_id,)).fetchall():
+            row = cur.execute("SELECT length FROM docs WHERE doc_id=?", (doc_id,)).fetchone()
+            dl = row[0] if row else 0.0
+            denom = tf + k1 * (1 - b + b * (dl / avgdl))
+            score = idf * ((tf * (k1 + 1)) / denom if denom > 0 else 0)
+            scores[doc_id] = scores.get(doc_id, 0.0) + score
+
+    ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:topk]
+    con.close()
+    return ranked
+
+
+def timed(fn, queries, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for q in queries:
+            fn(q)
+    return (time.perf_counter() - t0) / (repeat * len(queries)) * 1000
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, "raw")
+        synthetic.make_corpus(raw_dir, n_docs=n_docs)
+        synthetic.use_db(os.path.join(tmp, "ri_index.db"))
+        with synthetic.quiet():
+            index_documents(raw_dir, bulk=True)
+
+        con = get_connection()
+        common = [t for (t,) in con.execute("SELECT term FROM terms ORDER BY df DESC LIMIT 3")]
+        rare = [t for (t,) in con.execute("SELECT term FROM terms WHERE df <= 3 LIMIT 3")]
+        con.close()
+
+        workloads = {
+            "frecuente": [[t] for t in common],
+            "raro": [[t] for t in rare],
+            "multitérmino": [common + rare],
+        }
+
+        print(f"Índice sintético: {n_docs} documentos")
+        print(f"{'consulta':<14}{'original ms':>14}{'actual ms':>12}{'mismo top-k':>14}")
+        for label, queries in workloads.items():
+            same = all(
+                sorted(bm25_score_per_posting(q, topk=50)) == sorted(bm25_score(q, topk=50))
+                for q in queries
+            )
+            t_old = timed(lambda q: bm25_score_per_posting(q, topk=10), queries, repeat)
+            t_new = timed(lambda q: bm25_score(q, topk=10), queries, repeat)
+            print(f"{label:<14}{t_old:>14.2f}{t_new:>12.2f}{str(same):>14}")
+
+
+if __name__ == "__main__":
+    main()
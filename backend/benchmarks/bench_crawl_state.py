@@ -0,0 +1,75 @@
+"""
+Estado persistente del crawler (crawl_state.db):
+- arranque: recorrer raw_dir (scan_raw_dir, lo que hacía simple_crawl en
+  cada inicio) frente a abrir crawl_state.db ya inicializado
+- reanudación: un crawl cortado por max_pages y continuado con
+  resume=True no repite URLs y sigue la numeración
+
+Uso:
+    python backend/benchmarks/bench_crawl_state.py [docs_en_raw] [páginas_por_tramo]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import local_site
+import synthetic
+from app.core import crawler
+from app.core.crawler import open_crawl_state, scan_raw_dir, simple_crawl
+from app.core.rawstore import parse_store_key
+from app.index.indexer import read_raw_document
+
+
+def startup(raw_dir):
+    t0 = time.perf_counter()
+    scan_raw_dir(raw_dir)
+    t_scan = time.perf_counter() - t0
+
+    open_crawl_state(raw_dir).close()  # primera vez: inicializa con un recorrido
+
+    t0 = time.perf_counter()
+    state = open_crawl_state(raw_dir)
+    t_state = time.perf_counter() - t0
+    stats = state.stats()
+    state.close()
+    return t_scan, t_state, stats
+
+
+def crawled_urls(saved):
+    return [read_raw_document(key)[1]["url"] for key in saved]
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    step = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, "raw")
+        synthetic.make_corpus(raw_dir, n_docs=n_docs, words_per_doc=200)
+
+        t_scan, t_state, stats = startup(raw_dir)
+        print(f"raw_dir con {n_docs} documentos")
+        print(f"  recorrer raw_dir:       {t_scan * 1000:9.1f} ms")
+        print(f"  abrir crawl_state.db:   {t_state * 1000:9.1f} ms  (último doc_id {stats['last_doc_id']})")
+
+    with local_site.serve_sites(n_hosts=4, pages=step * 3, latency=0.01) as seeds:
+        with tempfile.TemporaryDirectory() as raw_dir:
+            crawler.robots_cache.clear()
+            with synthetic.quiet():
+                first = simple_crawl(seeds, raw_dir, max_pages=step, max_depth=1000)
+                second = simple_crawl([], raw_dir, max_pages=step, max_depth=1000, resume=True)
+
+            urls = crawled_urls(first) + crawled_urls(second)
+            numbers = sorted(parse_store_key(key)[1] for key in first + second)
+            state = open_crawl_state(raw_dir)
+            stats = state.stats()
+            state.close()
+            print(f"Reanudación: {len(first)} + {len(second)} páginas, "
+                  f"URLs repetidas: {len(urls) - len(set(urls))}, "
+                  f"numeración continua: {numbers == list(range(1, len(numbers) + 1))}, "
+                  f"frontera guardada: {stats['frontier']}")
+
+
+if __name__ == "__main__":
+    main()
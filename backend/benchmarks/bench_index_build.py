@@ -0,0 +1,56 @@
+"""
+Benchmark de construcción del índice: camino actual (un INSERT por
+posting con todos los índices activos) frente al modo bulk.
+
+Uso:
+    python backend/benchmarks/bench_index_build.py [n_docs] [workers]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import synthetic
+from app.index.indexer import index_documents
+from app.index.storage import get_connection
+
+
+def run(raw_dir: str, db_path: str, **kwargs) -> dict:
+    synthetic.use_db(db_path)
+    t0 = time.perf_counter()
+    with synthetic.quiet():
+        stats = index_documents(raw_dir, **kwargs)
+    elapsed = time.perf_counter() - t0
+
+    con = get_connection()
+    n_postings = con.execute("SELECT COUNT(*) FROM postings").fetchone()[0]
+    con.close()
+
+    return {
+        "seconds": elapsed,
+        "docs": stats["indexed_docs"],
+        "postings": n_postings,
+    }
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, "raw")
+        synthetic.make_corpus(raw_dir, n_docs=n_docs)
+
+        print(f"Corpus sintético: {n_docs} documentos, workers={workers}")
+        print(f"{'modo':<10}{'segundos':>10}{'docs/s':>12}{'postings/s':>14}")
+        for label, bulk in (("actual", False), ("bulk", True)):
+            r = run(raw_dir, os.path.join(tmp, f"{label}.db"), workers=workers, bulk=bulk)
+            print(
+                f"{label:<10}{r['seconds']:>10.2f}"
+                f"{r['docs'] / r['seconds']:>12.1f}"
+                f"{r['postings'] / r['seconds']:>14.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
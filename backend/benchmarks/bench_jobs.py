@@ -0,0 +1,142 @@
+"""
+Trabajos en segundo plano (app/core/jobs.py) a través de la API:
+- cuánto tarda en responder POST /index frente a lo que dura la
+  indexación que lanza
+- progreso visto desde GET /jobs/{job_id} mientras se indexa
+  (documentos/s, ETA) y eventos de /jobs/{job_id}/events
+- 409 al lanzar una segunda indexación sobre la misma BD
+- cuánto tarda en cancelarse una indexación y un crawl en curso
+  (POST /jobs/{job_id}/cancel), que la indexación cancelada deja el
+  índice anterior intacto y que el crawl cancelado guarda su frontera
+  para reanudarse
+
+jobs.db, el índice y el raw_dir van a un directorio temporal.
+
+Uso:
+    python backend/benchmarks/bench_jobs.py [n_docs]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import local_site
+import synthetic
+from app.api.routes_crawl import run_crawl
+from app.core import jobs
+from app.core.crawler import open_crawl_state
+
+
+def wait_job(client, job_id, samples=None, timeout=600):
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < timeout:
+        job = client.get(f"/jobs/{job_id}").json()
+        if samples is not None and job["progress"]:
+            samples.append(job["progress"])
+        if job["status"] in jobs.FINAL_STATUSES:
+            return job
+        time.sleep(0.2)
+    raise TimeoutError(job_id)
+
+
+def wait_progress(client, job_id, phase):
+    while True:
+        job = client.get(f"/jobs/{job_id}").json()
+        if (job["progress"] or {}).get("phase") == phase or job["status"] in jobs.FINAL_STATUSES:
+            return job
+        time.sleep(0.05)
+
+
+def read_events(client, job_id):
+    events = []
+    with client.stream("GET", f"/jobs/{job_id}/events") as response:
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                events.append(line[len("event: "):])
+    return events
+
+
+def bench_index(client, raw_dir, n_docs):
+    t0 = time.perf_counter()
+    response = client.post("/index", json={"raw_dir": raw_dir})
+    t_post = time.perf_counter() - t0
+    job_id = response.json()["job_id"]
+
+    conflict = client.post("/index", json={"raw_dir": raw_dir})
+    samples = []
+    job = wait_job(client, job_id, samples)
+    t_job = job["finished_at"] - job["created_at"]
+
+    print(f"POST /index: {response.status_code} en {t_post * 1000:.0f} ms; "
+          f"el trabajo dura {t_job:.1f}s ({job['status']}, {job['result']['indexed']['indexed_docs']} documentos)")
+    print(f"segundo POST /index sobre la misma BD: {conflict.status_code} ({conflict.json()['detail']})")
+    index_samples = [p for p in samples if p["phase"] == "index" and p["done"]]
+    for p in index_samples[::max(1, len(index_samples) // 4)]:
+        print(f"  progreso: {p['done']}/{p['total']} documentos, {p['rate']:.0f} docs/s, "
+              f"ETA {p['eta_s']}s, indexados {p['indexed_docs']}")
+    print(f"  fases vistas: {list(dict.fromkeys(p['phase'] for p in samples))}")
+
+    # eventos SSE de una indexación incremental (sin cambios: corta)
+    job_id = client.post("/index", json={"raw_dir": raw_dir, "incremental": True}).json()["job_id"]
+    events = read_events(client, job_id)
+    print(f"  /events (incremental): {len(events)} eventos, último '{events[-1]}'")
+
+    # cancelación a mitad de la primera pasada: /search sigue igual
+    query = {"query": "sistema información", "topk": 50, "page_size": 50, "use_cache": False}
+    before = client.post("/search", json=query).json()["results"]
+    job_id = client.post("/index", json={"raw_dir": raw_dir}).json()["job_id"]
+    job = wait_progress(client, job_id, "index")
+    t0 = time.perf_counter()
+    client.post(f"/jobs/{job_id}/cancel")
+    job = wait_job(client, job_id)
+    print(f"cancelar indexación en {job['progress']['done']}/{n_docs}: "
+          f"{job['status']} en {time.perf_counter() - t0:.2f}s")
+    after = client.post("/search", json=query).json()["results"]
+    print(f"  índice anterior intacto tras cancelar: {bool(before) and after == before} "
+          f"({len(after)} resultados de /search)")
+
+
+def bench_crawl(tmp, pages_per_host=300, n_hosts=2):
+    raw_dir = os.path.join(tmp, "crawl_raw")
+    params = {"seed_urls": [], "max_pages": 10 * pages_per_host * n_hosts, "max_depth": 50,
+              "concurrency": 32, "per_host": 8, "resume": False, "raw_dir": raw_dir}
+    with local_site.serve_sites(n_hosts=n_hosts, pages=pages_per_host, latency=0.02) as seeds:
+        for engine in ("threads", "async"):
+            job = jobs.start_job("crawl", run_crawl, {**params, "seed_urls": seeds, "engine": engine},
+                                 lock_key=f"crawl:{raw_dir}")
+            time.sleep(2)
+            progress = jobs.get_job(job["job_id"])["progress"]
+            t0 = time.perf_counter()
+            jobs.cancel_job(job["job_id"])
+            while jobs.get_job(job["job_id"])["status"] in jobs.ACTIVE_STATUSES:
+                time.sleep(0.05)
+            t_cancel = time.perf_counter() - t0
+
+            state = open_crawl_state(raw_dir)
+            frontier = state.stats()["frontier"]
+            state.close()
+            print(f"crawl ({engine}) a los 2s: {progress['done']} páginas, {progress['rate']:.0f} páginas/s, "
+                  f"frontera {progress['frontier']}; cancelado en {t_cancel:.2f}s, "
+                  f"frontera guardada para reanudar: {frontier} URLs")
+            params["resume"] = True
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs.JOBS_DIR = os.path.join(tmp, "jobs")
+        jobs.JOBS_DB_PATH = os.path.join(jobs.JOBS_DIR, "jobs.db")
+        synthetic.use_db(os.path.join(tmp, "ri_index.db"))
+
+        from fastapi.testclient import TestClient
+        from app.main import app
+        client = TestClient(app)
+
+        raw_dir = os.path.join(tmp, "raw")
+        synthetic.make_corpus(raw_dir, n_docs=n_docs)
+        bench_index(client, raw_dir, n_docs)
+        bench_crawl(tmp)
+
+
+if __name__ == "__main__":
+    main()
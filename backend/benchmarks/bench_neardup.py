@@ -0,0 +1,259 @@
+"""
+Detección de casi duplicados (SimHash) en la indexación: corpus sintético
+con variantes de una parte de las páginas bajo otra URL, como las que
+normalize_url no unifica:
+- vista para imprimir (?printable=yes): otra cabecera y otro pie
+- host móvil (es.m.example.org): otra navegación
+- revisión con unas pocas palabras cambiadas
+
+Mide cuántas variantes se detectan, si alguna página original se toma
+por duplicada, lo que se ahorra (documentos, postings, bytes de texto) y
+el coste de la huella por documento. Comprueba también que los enlaces
+hacia una variante cuentan para su página original.
+
+La indexación incremental (update_index) debe dejar lo mismo que una
+completa (documentos, casi duplicados, enlaces y df, comparados por URL)
+tras añadir variantes y tras borrar originales que las tienen.
+
+Después crawlea (con los dos motores) sitios locales que enlazan desde
+cada página a su versión para imprimir (local_site, printable=True):
+cuántas páginas se descartan antes de guardarlas y los bytes que se
+ahorran, y que el índice asocia esas URLs a la página guardada.
+
+Uso:
+    python backend/benchmarks/bench_neardup.py [n_docs] [fracción_variantes]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import local_site
+import synthetic
+from app.core.async_crawler import async_crawl
+from app.core.crawler import simple_crawl
+from app.core.pageparse import parse_page
+from app.core.simhash import text_simhash
+from app.index import storage
+from app.index.incremental import update_index
+from app.index.indexer import index_documents
+
+
+def make_variant(kind, html, rnd, vocab):
+    if kind == "imprimir":
+        return html.replace("<body>", "<body><header>Versión para imprimir · Volver</header>").replace(
+            "</body>", "<footer>Página impresa desde es.example.org</footer></body>")
+    if kind == "móvil":
+        return html.replace("<nav>", "<nav><a href=\"/\">Portada</a> <a href=\"/buscar\">Buscar</a> ")
+    # revisión: 1-3 palabras del texto cambiadas
+    head, main = html.split("<main>", 1)
+    main, tail = main.split("</main>", 1)
+    words = main.split(" ")
+    for _ in range(rnd.randint(1, 3)):
+        i = rnd.randrange(1, len(words) - 1)
+        words[i] = rnd.choice(vocab)
+    return head + "<main>" + " ".join(words) + "</main>" + tail
+
+
+def variant_url(kind, n, k):
+    if kind == "imprimir":
+        return f"https://es.example.org/wiki/Doc_{n}?printable=yes"
+    if kind == "móvil":
+        return f"https://es.m.example.org/wiki/Doc_{n}"
+    return f"https://es.example.org/wiki/Doc_{n}?oldid={k}"
+
+
+def bench_index(n_docs, fraction):
+    rnd = random.Random(5)
+    vocab = synthetic.make_vocabulary()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, "raw")
+        pages = list(synthetic.iter_pages(n_docs))
+        for n, title, html in pages:
+            synthetic.write_page(raw_dir, n, title, html, f"https://es.example.org/wiki/Doc_{n}")
+
+        # variantes después de los originales (numeración a continuación)
+        variants = {}
+        k = n_docs
+        for n, title, html in rnd.sample(pages, int(n_docs * fraction)):
+            k += 1
+            kind = rnd.choice(("imprimir", "móvil", "revisión"))
+            url = variant_url(kind, n, k)
+            synthetic.write_page(raw_dir, k, title, make_variant(kind, html, rnd, vocab), url)
+            variants[url] = (n, kind)
+
+        # una página que enlaza a una variante de cada tipo
+        linked = {kind: url for url, (_, kind) in variants.items()}
+        k += 1
+        links = " ".join(f'<a href="{url}">v</a>' for url in linked.values())
+        body = " ".join(rnd.choices(vocab, k=200))
+        synthetic.write_page(raw_dir, k, "Enlaces", f"<html><body><main><p>{body}</p></main>{links}</body></html>",
+                             "https://es.example.org/wiki/Enlaces")
+
+        db_path = os.path.join(tmp, "ri_index.db")
+        synthetic.use_db(db_path)
+        t0 = time.perf_counter()
+        with synthetic.quiet():
+            stats = index_documents(raw_dir)
+        t_index = time.perf_counter() - t0
+
+        # coste de la huella: text_simhash sobre el texto visible de cada página
+        texts = [parse_page(html, "https://es.example.org/")["text"] for _, _, html in pages[:1000]]
+        t0 = time.perf_counter()
+        for text in texts:
+            text_simhash(text)
+        t_simhash = (time.perf_counter() - t0) / len(texts)
+
+        con = sqlite3.connect(db_path)
+        dups = dict(con.execute("SELECT url, doc_id FROM near_duplicates"))
+        doc_urls = dict(con.execute("SELECT doc_id, url FROM docs"))
+        postings = con.execute("SELECT COUNT(*) FROM postings").fetchone()[0]
+        text_bytes = con.execute("SELECT SUM(LENGTH(text)) FROM doc_text").fetchone()[0]
+        links_to = {
+            doc_urls[to]
+            for (to,) in con.execute(
+                "SELECT l.to_doc_id FROM links l JOIN docs d ON d.doc_id = l.from_doc_id WHERE d.url = ?",
+                ("https://es.example.org/wiki/Enlaces",)
+            )
+        }
+        con.close()
+
+        detected = {kind: 0 for kind in ("imprimir", "móvil", "revisión")}
+        total = dict.fromkeys(detected, 0)
+        wrong = 0
+        for url, (n, kind) in variants.items():
+            total[kind] += 1
+            if url in dups:
+                detected[kind] += 1
+                wrong += doc_urls.get(dups[url]) != f"https://es.example.org/wiki/Doc_{n}"
+        false_positives = sum(1 for url in dups if url not in variants)
+
+        print(f"{n_docs} páginas + {len(variants)} variantes ({t_index:.1f}s de indexación, "
+              f"huella {t_simhash * 1000:.2f} ms/documento)")
+        for kind in detected:
+            print(f"  {kind:<10} detectadas {detected[kind]}/{total[kind]}")
+        print(f"  asociadas a otra página: {wrong}  originales tomadas por duplicadas: {false_positives}")
+        print(f"  documentos indexados: {stats['indexed_docs']}  descartados: {stats['near_duplicates']}")
+        print(f"  postings ahorrados: {stats['near_duplicate_postings']} "
+              f"({stats['near_duplicate_postings'] / (postings + stats['near_duplicate_postings']):.1%})  "
+              f"bytes de doc_text ahorrados: {stats['near_duplicate_bytes']} "
+              f"({stats['near_duplicate_bytes'] / (text_bytes + stats['near_duplicate_bytes']):.1%})")
+        canonical = {f"https://es.example.org/wiki/Doc_{variants[url][0]}" for url in linked.values() if url in dups}
+        print(f"  enlaces a variantes resueltos a su original: {canonical <= links_to}")
+
+
+def snapshot(db_path):
+    """
+    Documentos, casi duplicados, enlaces y df expresados por URL y
+    término (independientes de la numeración de doc_id).
+    """
+    con = sqlite3.connect(db_path)
+    urls = dict(con.execute("SELECT doc_id, url FROM docs"))
+    result = {
+        "documentos": set(urls.values()),
+        "casi duplicados": {(url, urls.get(doc_id)) for url, doc_id in con.execute(
+            "SELECT url, doc_id FROM near_duplicates")},
+        "enlaces": {(urls.get(a), urls.get(b)) for a, b in con.execute(
+            "SELECT from_doc_id, to_doc_id FROM links")},
+        "df": set(con.execute("SELECT term, df FROM terms WHERE df > 0")),
+    }
+    con.close()
+    return result
+
+
+def compare_incremental(label, raw_dir, inc_db, full_db):
+    """
+    Actualiza inc_db con update_index, construye full_db desde cero y
+    compara. Devuelve el número de diferencias.
+    """
+    storage.DB_PATH = inc_db
+    with synthetic.quiet():
+        update_index(raw_dir)
+    synthetic.use_db(full_db)
+    with synthetic.quiet():
+        index_documents(raw_dir)
+    inc, full = snapshot(inc_db), snapshot(full_db)
+    different = [name for name in full if inc[name] != full[name]]
+    print(f"  incremental = completa {label}: "
+          f"{'sí' if not different else 'NO (' + ', '.join(different) + ')'} "
+          f"({len(full['documentos'])} documentos, {len(full['casi duplicados'])} casi duplicados)")
+    return len(different)
+
+
+def bench_incremental(n_docs, fraction):
+    rnd = random.Random(8)
+    vocab = synthetic.make_vocabulary()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, "raw")
+        pages = list(synthetic.iter_pages(n_docs))
+        paths = {}
+        for n, title, html in pages:
+            paths[n] = synthetic.write_page(raw_dir, n, title, html, f"https://es.example.org/wiki/Doc_{n}")
+        inc_db = os.path.join(tmp, "incremental.db")
+        synthetic.use_db(inc_db)
+        with synthetic.quiet():
+            index_documents(raw_dir)
+
+        # variantes y una página que enlaza a ellas
+        originals = []
+        k = n_docs
+        for n, title, html in rnd.sample(pages, int(n_docs * fraction)):
+            k += 1
+            kind = rnd.choice(("imprimir", "móvil", "revisión"))
+            synthetic.write_page(raw_dir, k, title, make_variant(kind, html, rnd, vocab), variant_url(kind, n, k))
+            originals.append(n)
+        k += 1
+        links = " ".join(f'<a href="https://es.example.org/wiki/Doc_{n}?printable=yes">v</a>' for n in originals[:50])
+        body = " ".join(rnd.choices(vocab, k=200))
+        synthetic.write_page(raw_dir, k, "Enlaces", f"<html><body><main><p>{body}</p></main>{links}</body></html>",
+                             "https://es.example.org/wiki/Enlaces")
+
+        print(f"Incremental frente a completa: {n_docs} páginas + {len(originals)} variantes")
+        failures = compare_incremental("tras añadir variantes", raw_dir, inc_db, os.path.join(tmp, "full.db"))
+
+        # borrar la mitad de los originales con variante: la variante pasa a indexarse
+        for n in originals[::2]:
+            os.remove(paths[n])
+            os.remove(paths[n][:-len(".txt")] + ".meta.json")
+        failures += compare_incremental("tras borrar originales", raw_dir, inc_db, os.path.join(tmp, "full2.db"))
+        return failures
+
+
+def bench_crawl(pages_per_host=150, n_hosts=2):
+    with local_site.serve_sites(n_hosts=n_hosts, pages=pages_per_host, latency=0.005, printable=True) as seeds:
+        for engine, crawl in (("threads", simple_crawl), ("async", async_crawl)):
+            with tempfile.TemporaryDirectory() as tmp:
+                raw_dir = os.path.join(tmp, "raw")
+                stats = {}
+                with synthetic.quiet():
+                    saved = crawl(seeds, raw_dir, max_pages=10 * pages_per_host * n_hosts, max_depth=50, stats=stats)
+
+                db_path = os.path.join(tmp, "ri_index.db")
+                synthetic.use_db(db_path)
+                with synthetic.quiet():
+                    index_documents(raw_dir)
+                con = sqlite3.connect(db_path)
+                aliases = con.execute("SELECT COUNT(*) FROM near_duplicates WHERE path IS NULL").fetchone()[0]
+                con.close()
+
+                print(f"crawl ({engine}): {stats['fetched']} descargadas, {len(saved)} guardadas, "
+                      f"{stats['near_duplicates']} casi duplicadas descartadas "
+                      f"({stats['near_duplicate_bytes']} bytes sin guardar); "
+                      f"URLs descartadas asociadas en el índice: {aliases}")
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    fraction = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    bench_index(n_docs, fraction)
+    failures = bench_incremental(min(n_docs, 1500), fraction)
+    bench_crawl()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
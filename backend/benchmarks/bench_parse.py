@@ -0,0 +1,124 @@
+"""
+Tiempo de parseo por página: funciones actuales con BeautifulSoup
+(crawler: extract_metadata + extract_links; indexador:
+extract_visible_text + extract_links) frente a una sola pasada con
+pageparse.parse_page, y equivalencia de los resultados (metadatos,
+enlaces y texto visible) página a página.
+
+Páginas: artículos con la estructura de Wikipedia (infobox, índice,
+referencias, navbox, cabecera y pie) y las páginas genéricas del corpus
+sintético.
+
+Uso:
+    python backend/benchmarks/bench_parse.py [páginas_por_tipo]
+"""
+import random
+import sys
+import time
+
+import synthetic
+from app.core.crawler import extract_links, extract_metadata
+from app.core.pageparse import parse_page
+from app.index.indexer import extract_visible_text, extract_visible_text_wikipedia
+
+
+def make_wiki_page(n, rnd, vocab):
+    words = lambda k: " ".join(rnd.choices(vocab, k=k))
+    link = lambda: f'<a href="/wiki/{rnd.choice(vocab).capitalize()}_{rnd.randrange(500)}" title="x">{words(2)}</a>'
+    ref = lambda: f'<sup id="cite_ref-{rnd.randrange(99)}" class="reference"><a href="#cite_note-1">[{rnd.randrange(1, 40)}]</a></sup>'
+    para = lambda: "<p>" + " ".join(
+        f"{words(rnd.randint(3, 12))} {link()}{ref() if rnd.random() < 0.3 else ''}" for _ in range(rnd.randint(4, 9))
+    ) + "</p>\n"
+
+    title = f"Artículo {n}: {words(3)}"
+    infobox = "".join(f"<tr><th>{words(1)}</th><td>{words(3)} {link()}</td></tr>" for _ in range(12))
+    toc = "".join(f'<li class="toclevel-1"><a href="#s{i}"><span class="tocnumber">{i}</span> {words(2)}</a></li>' for i in range(8))
+    sections = ""
+    for i in range(8):
+        sections += (
+            f'<h2><span class="mw-headline" id="s{i}">{words(rnd.randint(1, 4))}</span>'
+            f'<span class="mw-editsection"><span class="mw-editsection-bracket">[</span><a href="/w/index.php?action=edit&amp;section={i}">editar</a>]</span></h2>\n'
+            + "".join(para() for _ in range(rnd.randint(2, 5)))
+            + "<ul>" + "".join(f"<li>{words(rnd.randint(2, 8))} {link()}</li>" for _ in range(rnd.randint(0, 6))) + "</ul>\n"
+            + (f'<h3><span class="mw-headline">{words(3)}</span></h3>\n' + para() if rnd.random() < 0.5 else "")
+        )
+    refs = "".join(f'<li id="cite_note-{i}"><span class="reference-text">{words(8)} {link()}</span></li>' for i in range(30))
+    navbox = "".join(link() + " · " for _ in range(40))
+    return (
+        '<!DOCTYPE html>\n<html lang="es"><head><meta charset="UTF-8"><title>' + title + ' - Wikipedia, la enciclopedia libre</title>'
+        '<script>var wgPageName="x";</script><style>.mw-body{color:#202122}</style>'
+        '<meta property="og:title" content="' + title + '"></head>\n'
+        '<body class="skin-vector"><header class="vector-header"><nav>' + link() + link() + '</nav></header>'
+        '<main id="content"><h1 id="firstHeading" class="firstHeading"><span class="mw-page-title-main">' + title + '</span></h1>'
+        '<div id="bodyContent"><div id="mw-content-text" class="mw-body-content"><div class="mw-parser-output">\n'
+        '<table class="infobox">' + infobox + '</table>\n' + para() + para()
+        + '<div id="toc" class="toc"><ul>' + toc + '</ul></div>\n' + sections
+        + '<!-- NewPP limit report -->\n<div class="reflist"><ol class="references">' + refs + '</ol></div>\n'
+        '<div class="navbox"><table><tr><td>' + navbox + '</td></tr></table></div>'
+        '</div></div></div></main>'
+        '<footer id="footer"><ul><li>Esta página se editó por última vez hace poco.</li></ul></footer>'
+        '<script>RLQ.push(function(){});</script></body></html>'
+    )
+
+
+def make_pages(n):
+    rnd = random.Random(3)
+    vocab = synthetic.make_vocabulary()
+    wiki = [(f"https://es.wikipedia.org/wiki/Articulo_{i}", make_wiki_page(i, rnd, vocab)) for i in range(n)]
+    generic = []
+    for i, html in enumerate(synthetic.make_html_pages(n, words_per_doc=800)):
+        generic.append((f"https://es.example.org/wiki/Doc_{i + 1}", html))
+    return wiki, generic
+
+
+def old_crawler(html, url):
+    return extract_metadata(html), extract_links(html, url)
+
+
+def old_indexer(html, url):
+    if "wikipedia.org" in url:
+        text = extract_visible_text_wikipedia(html)
+    else:
+        text = extract_visible_text(html)
+    return text, extract_links(html, url)
+
+
+def per_page_ms(fn, pages):
+    t0 = time.perf_counter()
+    for url, html in pages:
+        fn(html, url)
+    return (time.perf_counter() - t0) / len(pages) * 1000
+
+
+def differences(pages):
+    diff = {"metadatos": 0, "enlaces": 0, "texto": 0}
+    for url, html in pages:
+        page = parse_page(html, url)
+        meta, links = old_crawler(html, url)
+        text, _ = old_indexer(html, url)
+        diff["metadatos"] += {k: page[k] for k in meta} != meta
+        diff["enlaces"] += page["links"] != links
+        diff["texto"] += page["text"] != text
+    return diff
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    wiki, generic = make_pages(n)
+
+    for label, pages in (("Wikipedia", wiki), ("genéricas", generic)):
+        size = sum(len(html) for _, html in pages) / len(pages) / 1024
+        print(f"{label}: {len(pages)} páginas de {size:.0f} KiB de media")
+        crawler_old = per_page_ms(old_crawler, pages)
+        crawler_new = per_page_ms(lambda html, url: parse_page(html, url, text=False), pages)
+        indexer_old = per_page_ms(old_indexer, pages)
+        indexer_new = per_page_ms(parse_page, pages)
+        print(f"  crawler   (metadatos + enlaces): {crawler_old:7.2f} ms → {crawler_new:6.2f} ms  ({crawler_old / crawler_new:4.1f}x)")
+        print(f"  indexador (texto + enlaces):     {indexer_old:7.2f} ms → {indexer_new:6.2f} ms  ({indexer_old / indexer_new:4.1f}x)")
+        print(f"  total por página:                {crawler_old + indexer_old:7.2f} ms → "
+              f"{crawler_new + indexer_new:6.2f} ms  ({(crawler_old + indexer_old) / (crawler_new + indexer_new):4.1f}x)")
+        print(f"  páginas con resultado distinto: {differences(pages)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Almacén de segmentos (rawstore) frente a un fichero por página:
+- ficheros y espacio en disco del corpus antes y después de migrarlo
+  (migrate_buckets)
+- recorrer y leer todo el corpus, como hace el indexador
+- acceso aleatorio por doc_id
+- equivalencia: mismos metadatos y HTML, y el índice construido sobre
+  los buckets no cambia al migrar (relocate_documents + update_index no
+  reanaliza nada)
+
+Uso:
+    python backend/benchmarks/bench_rawstore.py [n_docs] [palabras_por_doc]
+"""
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import synthetic
+from app.core.rawstore import RawStore, migrate_buckets
+from app.index.incremental import relocate_documents, update_index
+from app.index.indexer import index_documents, list_raw_documents, read_raw_document
+
+
+def disk_usage(raw_dir):
+    files, used = 0, 0
+    for root, _, names in os.walk(raw_dir):
+        for name in names:
+            files += 1
+            used += os.stat(os.path.join(root, name)).st_blocks * 512
+    return files, used
+
+
+def read_corpus(raw_dir):
+    # lo que hace el indexador: listar y leer cada documento (HTML + metadatos)
+    t0 = time.perf_counter()
+    digests = {}
+    for path in list_raw_documents(raw_dir):
+        raw_text, meta = read_raw_document(path)
+        digests[meta["url"]] = hashlib.sha1(
+            (json.dumps(meta, sort_keys=True) + raw_text).encode("utf-8")
+        ).hexdigest()
+    return digests, time.perf_counter() - t0
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    words = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, "raw")
+        synthetic.make_corpus(raw_dir, n_docs=n_docs, words_per_doc=words)
+        synthetic.use_db(os.path.join(tmp, "ri_index.db"))
+        with synthetic.quiet():
+            indexed = index_documents(raw_dir)["indexed_docs"]
+
+        files_before, bytes_before = disk_usage(raw_dir)
+        before, t_files = read_corpus(raw_dir)
+
+        t0 = time.perf_counter()
+        moved = migrate_buckets(raw_dir)
+        t_migrate = time.perf_counter() - t0
+
+        files_after, bytes_after = disk_usage(raw_dir)
+        after, t_store = read_corpus(raw_dir)
+
+        # acceso aleatorio por doc_id con un lector recién abierto
+        store = RawStore(raw_dir)
+        ids = random.Random(1).choices(store.doc_ids(), k=2000)
+        t0 = time.perf_counter()
+        for doc_id in ids:
+            store.read(doc_id)
+        t_random = (time.perf_counter() - t0) / len(ids)
+        store.close()
+
+        relocated = relocate_documents(moved)
+        with synthetic.quiet():
+            update = update_index(raw_dir)
+
+        print(f"{n_docs} documentos sintéticos de {words} palabras (migración en {t_migrate:.1f}s)")
+        print(f"  {'':<12}{'ficheros':>10}{'disco MiB':>11}{'leer todo':>11}")
+        print(f"  {'buckets':<12}{files_before:>10}{bytes_before / 2**20:>11.1f}{t_files:>10.2f}s")
+        print(f"  {'segmentos':<12}{files_after:>10}{bytes_after / 2**20:>11.1f}{t_store:>10.2f}s")
+        print(f"  acceso aleatorio por doc_id: {t_random * 1e6:.0f} µs")
+        print(f"  mismo contenido: {before == after}  "
+              f"rutas reubicadas en el índice: {relocated}/{indexed}  "
+              f"update_index: sin cambios {update['unchanged']}, "
+              f"reanalizados {update['added'] + update['updated']}, borrados {update['removed']}")
+
+
+if __name__ == "__main__":
+    main()
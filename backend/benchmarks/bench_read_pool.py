@@ -0,0 +1,79 @@
+"""
+Coste de abrir conexión por consulta frente al pool de lectura:
+- "nueva": get_connection() (PRAGMAs incluidos) + N/avgdl + MAX(rank)
+  + bm25_score en cada consulta, como hacía /search
+- "pool": get_read_connection() con estadísticas precargadas
+Mide también /search completo sin caché de resultados.
+
+Uso:
+    python backend/benchmarks/bench_read_pool.py [n_docs] [consultas]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+import synthetic
+from app.api.routes_search import SearchRequest, search_endpoint
+from app.index.bm25 import bm25_score, load_collection_stats
+from app.index.indexer import index_documents
+from app.index.pagerank import run_pagerank
+from app.index.storage import get_connection, get_read_connection
+
+
+def per_query_connection(q):
+    con = get_connection()
+    N, avgdl = load_collection_stats(con.cursor())
+    con.execute("SELECT MAX(rank) FROM pagerank").fetchone()
+    ranked = bm25_score(q, con=con, stats=(N, avgdl))
+    con.close()
+    return ranked
+
+
+def pooled(q):
+    reader = get_read_connection()
+    return bm25_score(q, con=reader.con, stats=(reader.stats["N"], reader.stats["avgdl"]))
+
+
+def timed(fn, queries):
+    t0 = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - t0) / len(queries) * 1000
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    rnd = random.Random(3)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, "raw")
+        synthetic.make_corpus(raw_dir, n_docs=n_docs)
+        synthetic.use_db(os.path.join(tmp, "ri_index.db"))
+        with synthetic.quiet():
+            index_documents(raw_dir, bulk=True)
+            run_pagerank()
+
+        con = get_connection()
+        # términos poco frecuentes: el coste fijo por consulta domina
+        vocab = [t for (t,) in con.execute("SELECT term FROM terms WHERE df BETWEEN 2 AND 20 LIMIT 2000")]
+        con.close()
+        queries = [rnd.sample(vocab, 2) for _ in range(n_queries)]
+
+        same = all(per_query_connection(q) == pooled(q) for q in queries[:50])
+        t_new = timed(per_query_connection, queries)
+        t_pool = timed(pooled, queries)
+        print(f"Índice sintético: {n_docs} documentos, {n_queries} consultas de 2 términos")
+        print(f"  bm25 con conexión nueva: {t_new:.3f} ms/consulta")
+        print(f"  bm25 con pool:           {t_pool:.3f} ms/consulta (mismo ranking: {same})")
+
+        t_search = timed(
+            lambda q: search_endpoint(SearchRequest(query=" ".join(q), use_cache=False)), queries
+        )
+        print(f"  /search sin caché:       {t_search:.3f} ms/consulta")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Re-crawl con GET condicional y conexiones keep-alive: se crawlea un
+conjunto de sitios locales (con ETag / Last-Modified) y se vuelve a
+crawlear desde las mismas semillas sobre el mismo raw_dir. Para cada
+motor se muestran los contadores del crawl (new_crawl_stats): bytes
+bajados y ahorrados por los 304 y conexiones reutilizadas.
+
+Uso:
+    python backend/benchmarks/bench_recrawl.py [páginas] [hosts] [latencia_s]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import local_site
+import synthetic
+from app.core import crawler
+from app.core.async_crawler import async_crawl
+from app.core.crawler import simple_crawl
+
+
+def run(label, fn, seeds, raw_dir, max_pages):
+    crawler.robots_cache.clear()
+    stats = {}
+    t0 = time.perf_counter()
+    with synthetic.quiet():
+        saved = fn(seeds, raw_dir, max_pages=max_pages, max_depth=1000, stats=stats)
+    elapsed = time.perf_counter() - t0
+    print(
+        f"  {label:<18} {elapsed:6.2f}s  guardadas {len(saved):>5}  304 {stats['not_modified']:>5}  "
+        f"bajados {stats['bytes_downloaded'] / 2**20:6.2f} MiB  ahorrados {stats['bytes_saved'] / 2**20:6.2f} MiB  "
+        f"peticiones {stats['requests']:>5} / conexiones {stats['connections']:>4}"
+    )
+
+
+def main():
+    max_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    n_hosts = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.02
+
+    with local_site.serve_sites(n_hosts=n_hosts, pages=max_pages, latency=latency) as seeds:
+        print(f"{n_hosts} hosts locales, latencia {latency * 1000:.0f} ms, {max_pages} páginas")
+        for label, fn in (("hilos", simple_crawl), ("asyncio", async_crawl)):
+            with tempfile.TemporaryDirectory() as tmp:
+                raw_dir = os.path.join(tmp, "raw")
+                run(f"{label} (1º)", fn, seeds, raw_dir, max_pages)
+                run(f"{label} (re-crawl)", fn, seeds, raw_dir, max_pages)
+
+
+if __name__ == "__main__":
+    main()
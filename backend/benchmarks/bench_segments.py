@@ -0,0 +1,91 @@
+"""
+Segmentos binarios frente a SQLite:
+- tamaño en disco (ri_index.db con WAL integrado frente al directorio
+  del segmento) y tiempo de conversión
+- latencia de bm25_score con source="sqlite" y source="segments" para
+  términos frecuentes, raros y consultas multitérmino
+- comprueba que ambos orígenes devuelven exactamente el mismo top-k
+
+Uso:
+    python backend/benchmarks/bench_segments.py [n_docs] [repeticiones]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import synthetic
+from app.index import storage
+from app.index.bm25 import bm25_score
+from app.index.indexer import index_documents
+from app.index.segments import convert_db_to_segments, get_segment_reader, varint_decode, varint_encode
+from app.index.storage import get_connection
+
+
+def timed(fn, queries, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for q in queries:
+            fn(q)
+    return (time.perf_counter() - t0) / (repeat * len(queries)) * 1000
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    # ida y vuelta del codificador con valores de varios bytes
+    values = np.random.default_rng(1).integers(0, 1 << 40, size=10000)
+    assert (varint_decode(np.frombuffer(varint_encode(values), dtype=np.uint8)) == values).all()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, "raw")
+        synthetic.make_corpus(raw_dir, n_docs=n_docs)
+        synthetic.use_db(os.path.join(tmp, "ri_index.db"))
+        with synthetic.quiet():
+            index_documents(raw_dir, bulk=True)
+
+        con = get_connection()
+        con.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+        common = [t for (t,) in con.execute("SELECT term FROM terms ORDER BY df DESC LIMIT 3")]
+        rare = [t for (t,) in con.execute("SELECT term FROM terms WHERE df <= 3 LIMIT 3")]
+        con.close()
+
+        result = convert_db_to_segments()
+        reader = get_segment_reader()
+        db_bytes = os.path.getsize(storage.DB_PATH)
+        print(f"Índice sintético: {n_docs} documentos, {result['postings']} postings, {result['terms']} términos")
+        print(f"  ri_index.db (todas las tablas): {db_bytes / 1e6:.1f} MB")
+        print(
+            f"  segmento:                      {result['bytes'] / 1e6:.1f} MB "
+            f"({db_bytes / result['bytes']:.1f}x menor, conversión {result['seconds']:.1f}s)"
+        )
+
+        workloads = {
+            "frecuente": [[t] for t in common],
+            "raro": [[t] for t in rare],
+            "multitérmino": [common + rare],
+        }
+
+        con = get_connection()
+        failures = 0
+        print(f"{'consulta':<14}{'sqlite ms':>12}{'segmentos ms':>15}{'mismo top-k':>14}")
+        for label, queries in workloads.items():
+            same = all(
+                bm25_score(q, topk=50, con=con) == bm25_score(q, topk=50, con=con, source="segments")
+                for q in queries
+            )
+            failures += not same
+            t_sql = timed(lambda q: bm25_score(q, topk=10, con=con), queries, repeat)
+            t_seg = timed(lambda q: bm25_score(q, topk=10, con=con, source="segments"), queries, repeat)
+            print(f"{label:<14}{t_sql:>12.2f}{t_seg:>15.2f}{str(same):>14}")
+        con.close()
+        reader.release()
+
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Índice por shards (app/index/shards.py) frente al índice único:
+
+- construcción: índice único frente a N shards con un proceso por
+  núcleo (tiempo total y del shard más lento, que es lo que tarda la
+  construcción con un núcleo libre por shard)
+- el corpus lleva variantes y URLs repetidas de páginas de los primeros
+  buckets al final, para que caigan en otro shard: N, avgdl, documentos
+  y casi duplicados deben coincidir tras reconcile_shards
+- y una cadena de casi duplicados A → X → Y (SimHash no es transitivo):
+  A en el primer bucket; X e Y al final, X a <= 6 bits de A, Y a <= 6
+  bits de X pero no de A. El shard de X descarta Y; al quitar X, Y tiene
+  que indexarse, como en el índice único
+- mismas puntuaciones: top-k de bm25_score con source="shards" frente
+  al índice único (por URL, exhaustivo y WAND), PageRank por URL y
+  /search con source="shards" frente a "sqlite"
+- latencia de bm25_score en los dos índices
+
+Uso:
+    python backend/benchmarks/bench_shards.py [n_docs] [n_shards] [n_consultas]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import synthetic
+from bench_neardup import make_variant, variant_url
+from app.core.simhash import SIMHASH_MAX_DISTANCE, hamming
+from app.index import storage
+from app.index.bm25 import bm25_score
+from app.index.indexer import analyze_document, index_documents
+from app.index.pagerank import run_pagerank
+from app.index.shards import build_shards, bm25_score_shards, run_shards_pagerank, shard_paths
+
+
+def make_corpus(raw_dir, n_docs, n_variants, rnd):
+    """
+    Escribe el corpus y devuelve las URLs (A, X, Y) de la cadena de casi duplicados.
+    """
+    vocab = synthetic.make_vocabulary()
+    pages = list(synthetic.iter_pages(n_docs))
+    for n, title, html in pages:
+        synthetic.write_page(raw_dir, n, title, html, f"https://es.example.org/wiki/Doc_{n}")
+    # variantes y copias con la misma URL de páginas del primer bucket, al final del corpus
+    k = n_docs
+    sampled = rnd.sample(pages[:900], n_variants + 1)
+    for n, title, html in sampled[1:]:
+        k += 1
+        kind = rnd.choice(("imprimir", "móvil", "revisión", "misma URL"))
+        if kind == "misma URL":
+            synthetic.write_page(raw_dir, k, title, html, f"https://es.example.org/wiki/Doc_{n}")
+        else:
+            synthetic.write_page(raw_dir, k, title, make_variant(kind, html, rnd, vocab), variant_url(kind, n, k))
+
+    n, title, html = sampled[0]
+    x_html, y_html = make_chain(os.path.join(os.path.dirname(raw_dir), "chain"), html, rnd, vocab)
+    x_url, y_url = variant_url("revisión", n, k + 1), variant_url("revisión", n, k + 2)
+    synthetic.write_page(raw_dir, k + 1, title, x_html, x_url)
+    synthetic.write_page(raw_dir, k + 2, title, y_html, y_url)
+    return f"https://es.example.org/wiki/Doc_{n}", x_url, y_url
+
+
+def page_simhash(scratch_dir, html):
+    path = synthetic.write_page(scratch_dir, 1, "", html, "https://es.example.org/wiki/Borrador")
+    return analyze_document(path)["simhash"]
+
+
+def revise(html, rnd, vocab):
+    """
+    Cambia una palabra del texto principal.
+    """
+    head, main = html.split("<main>", 1)
+    main, tail = main.split("</main>", 1)
+    words = main.split(" ")
+    words[rnd.randrange(1, len(words) - 1)] = rnd.choice(vocab)
+    return head + "<main>" + " ".join(words) + "</main>" + tail
+
+
+def make_chain(scratch_dir, a_html, rnd, vocab):
+    """
+    (X, Y): X a <= SIMHASH_MAX_DISTANCE bits de A; Y a <= SIMHASH_MAX_DISTANCE
+    de X y a más de A. Se cambian palabras de una en una hasta conseguirlo.
+    """
+    limit = SIMHASH_MAX_DISTANCE
+    a = page_simhash(scratch_dir, a_html)
+    for _ in range(200):
+        x_html = a_html
+        while hamming(page_simhash(scratch_dir, x_html), a) < limit - 1:
+            x_html = revise(x_html, rnd, vocab)
+        x = page_simhash(scratch_dir, x_html)
+        if hamming(x, a) > limit:
+            continue
+        y_html = x_html
+        while hamming(page_simhash(scratch_dir, y_html), a) <= limit:
+            y_html = revise(y_html, rnd, vocab)
+            if hamming(page_simhash(scratch_dir, y_html), x) > limit:
+                break
+        y = page_simhash(scratch_dir, y_html)
+        if hamming(y, x) <= limit < hamming(y, a):
+            return x_html, y_html
+    raise RuntimeError("No se encontró una cadena A → X → Y de casi duplicados")
+
+
+def urls(db_paths):
+    result = {}
+    for path in db_paths:
+        con = sqlite3.connect(path)
+        result.update(con.execute("SELECT doc_id, url FROM docs"))
+        con.close()
+    return result
+
+
+def table(db_paths, sql):
+    rows = set()
+    for path in db_paths:
+        con = sqlite3.connect(path)
+        rows.update(con.execute(sql))
+        con.close()
+    return rows
+
+
+def by_url(ranked, doc_urls):
+    return [(doc_urls[doc_id], score) for doc_id, score in ranked]
+
+
+def timed(fn, queries):
+    t0 = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - t0) / len(queries) * 1000
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    n_shards = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    n_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    rnd = random.Random(11)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, "raw")
+        chain = make_corpus(raw_dir, n_docs, n_variants=60, rnd=rnd)
+
+        # --- índice único ---
+        single_db = os.path.join(tmp, "ri_index.db")
+        synthetic.use_db(single_db)
+        t0 = time.perf_counter()
+        with synthetic.quiet():
+            single = index_documents(raw_dir, bulk=True, positions=True)
+            run_pagerank()
+        t_single = time.perf_counter() - t0
+
+        # --- shards ---
+        processes = min(n_shards, os.cpu_count() or 1)
+        t0 = time.perf_counter()
+        with synthetic.quiet():
+            sharded = build_shards(raw_dir, n_shards, processes=processes, positions=True)
+            run_shards_pagerank(shard_paths())
+        t_sharded = time.perf_counter() - t0
+        paths = shard_paths()
+
+        print(f"{n_docs} páginas + 60 variantes/copias del primer bucket y una cadena A → X → Y al final, "
+              f"{os.cpu_count()} núcleos")
+        print(f"índice único: {t_single:.1f}s, {single['indexed_docs']} documentos, "
+              f"{single['near_duplicates']} casi duplicados")
+        slowest = max(shard["seconds"] for shard in sharded["shards"])
+        print(f"{len(paths)} shards ({processes} procesos): {t_sharded:.1f}s, shard más lento {slowest:.1f}s, "
+              f"{sharded['indexed_docs']} documentos, {sharded['near_duplicates']} casi duplicados "
+              f"({sharded['cross_shard_duplicates']} entre shards, "
+              f"{sharded['restored_near_duplicates']} vueltos a indexar)")
+        for shard in sharded["shards"]:
+            print(f"  {os.path.basename(shard['path'])}: buckets {shard['buckets'][0]}-{shard['buckets'][1]}, "
+                  f"desde doc_id {shard['first_doc_id']}, {shard['indexed_docs']} documentos, {shard['seconds']:.1f}s")
+
+        # --- mismo contenido ---
+        checks = {
+            "N y avgdl": (single["indexed_docs"], single["avgdl"]) == (sharded["indexed_docs"], sharded["avgdl"]),
+            "URLs indexadas": set(urls([single_db]).values()) == set(urls(paths).values()),
+            "casi duplicados": near_duplicate_pairs([single_db]) == near_duplicate_pairs(paths),
+            "df": table([single_db], "SELECT term, df FROM terms") == merged_df(paths),
+            "cadena A → X → Y (X casi duplicado de A, Y indexado)": all(
+                (chain[1], chain[0]) in near_duplicate_pairs(db_paths)
+                and chain[2] in set(urls(db_paths).values())
+                for db_paths in ([single_db], paths)
+            ),
+        }
+        single_pr = {url: rank for url, rank in table(
+            [single_db], "SELECT d.url, p.rank FROM pagerank p JOIN docs d USING(doc_id)")}
+        sharded_pr = {url: rank for url, rank in table(
+            paths, "SELECT d.url, p.rank FROM pagerank p JOIN docs d USING(doc_id)")}
+        checks["PageRank (por URL, 1e-12)"] = single_pr.keys() == sharded_pr.keys() and all(
+            abs(single_pr[url] - sharded_pr[url]) < 1e-12 for url in single_pr)
+        for name, ok in checks.items():
+            print(f"  {name}: {'igual' if ok else 'DISTINTO'}")
+
+        # --- mismas puntuaciones ---
+        con = sqlite3.connect(single_db)
+        by_df = [t for (t,) in con.execute("SELECT term FROM terms ORDER BY df DESC")]
+        con.close()
+        queries = [
+            rnd.sample(by_df[:50], 1) + rnd.sample(by_df[50:5000], rnd.randint(0, 2))
+            for _ in range(n_queries)
+        ]
+        single_urls, sharded_urls = urls([single_db]), urls(paths)
+        storage.DB_PATH = single_db
+        mismatches = 0
+        for algorithm in ("exhaustive", "wand"):
+            for q in queries:
+                expected = by_url(bm25_score(q, topk=20, algorithm=algorithm), single_urls)
+                got = by_url(bm25_score(q, topk=20, algorithm=algorithm, source="shards"), sharded_urls)
+                mismatches += expected != got
+        print(f"  top-20 idéntico (URL y puntuación): {2 * len(queries) - mismatches}/{2 * len(queries)} consultas")
+
+        from fastapi.testclient import TestClient
+        from app.main import app
+        client = TestClient(app)
+        same_search = 0
+        search_queries = queries[:50]
+        for q in search_queries:
+            body = {"query": " ".join(q), "topk": 20, "page_size": 20, "use_cache": False}
+            a = client.post("/search", json=body).json()["results"]
+            b = client.post("/search", json={**body, "source": "shards"}).json()["results"]
+            strip = lambda results: [(r["title"], r["score"], r["snippet"]) for r in results]
+            same_search += strip(a) == strip(b)
+        print(f"  /search idéntico (título, puntuación, snippet): {same_search}/{len(search_queries)} consultas")
+
+        # --- latencia ---
+        from app.index.storage import get_connection
+        con = get_connection()
+        print(f"{'algoritmo':<12}{'único ms':>10}{'shards ms':>11}")
+        for algorithm in ("exhaustive", "wand"):
+            t_one = timed(lambda q: bm25_score(q, topk=10, con=con, algorithm=algorithm), queries)
+            t_sh = timed(lambda q: bm25_score_shards(q, topk=10, algorithm=algorithm), queries)
+            print(f"{algorithm:<12}{t_one:>10.2f}{t_sh:>11.2f}")
+        con.close()
+
+        sys.exit(0 if all(checks.values()) and not mismatches else 1)
+
+
+def near_duplicate_pairs(db_paths):
+    """
+    (url, url canónica) de los casi duplicados; en los shards el
+    documento canónico puede estar en otro shard.
+    """
+    doc_urls = urls(db_paths)
+    return {
+        (url, doc_urls.get(doc_id))
+        for url, doc_id in table(db_paths, "SELECT url, doc_id FROM near_duplicates")
+    }
+
+
+def merged_df(db_paths):
+    df = {}
+    for path in db_paths:
+        con = sqlite3.connect(path)
+        for term, doc_freq in con.execute("SELECT term, df FROM terms"):
+            df[term] = df.get(term, 0) + doc_freq
+        con.close()
+    return set(df.items())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Memoria de index_documents según el tamaño del corpus: pico de RSS con
+el presupuesto de memoria SPIMI (runs ordenados en disco) frente a
+memory_budget=None (todo en memoria hasta el final). Cada indexación se
+hace en un proceso aparte para medir su propio pico (ru_maxrss).
+
+Uso:
+    python backend/benchmarks/bench_spimi.py [presupuesto_MiB] [n_docs,n_docs,...]
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthetic
+from app.index.indexer import index_documents
+
+
+def child(raw_dir, db_path, budget):
+    synthetic.use_db(db_path)
+    t0 = time.perf_counter()
+    with synthetic.quiet():
+        stats = index_documents(raw_dir, bulk=True, memory_budget=budget)
+    elapsed = time.perf_counter() - t0
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(stats["indexed_docs"], elapsed, peak_kib)
+
+
+def run(raw_dir, db_path, budget):
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", raw_dir, db_path, str(budget)],
+        check=True, capture_output=True, text=True,
+    ).stdout.split()
+    return int(out[0]), float(out[1]), int(out[2]) / 1024
+
+
+def main():
+    budget_mib = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    sizes = [int(n) for n in sys.argv[2].split(",")] if len(sys.argv) > 2 else [2000, 4000, 8000]
+
+    print(f"{'docs':>6} {'sin límite':>22} {f'presupuesto {budget_mib} MiB':>26}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_docs in sizes:
+            raw_dir = os.path.join(tmp, f"raw{n_docs}")
+            synthetic.make_corpus(raw_dir, n_docs=n_docs)
+            row = f"{n_docs:>6}"
+            for budget in (None, budget_mib * 1024 * 1024):
+                docs, elapsed, peak = run(raw_dir, os.path.join(tmp, "ri_index.db"), budget)
+                row += f"   {peak:7.1f} MiB pico {elapsed:6.1f}s"
+            print(row)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        budget = None if sys.argv[4] == "None" else int(sys.argv[4])
+        child(sys.argv[2], sys.argv[3], budget)
+    else:
+        main()
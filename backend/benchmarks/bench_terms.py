@@ -0,0 +1,211 @@
+"""
+Diccionario de términos (terms + postings por term_id, WITHOUT ROWID)
+frente al esquema anterior (postings, positions y df con el término en
+texto en cada fila, más idx_postings_term):
+
+- tamaño por tabla (dbstat, índices incluidos) y total tras VACUUM
+- migración: se deriva una copia con el esquema anterior, se migra con
+  init_db (migrate_term_dictionary) y se comprueba que queda igual que
+  el índice construido directamente; tiempo de la migración
+- latencia de df + lectura de postings para términos frecuentes,
+  medios y raros con las consultas SQL anteriores (por texto) y las
+  actuales (lookup_terms + fetch_postings), y de bm25_score
+
+Uso:
+    python backend/benchmarks/bench_terms.py [n_docs] [repeticiones]
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import synthetic
+from app.index import storage
+from app.index.bm25 import bm25_score, fetch_postings, lookup_terms
+from app.index.indexer import index_documents
+from app.index.storage import get_connection
+
+LEGACY_SCHEMA = """
+CREATE TABLE postings_old(
+    term TEXT,
+    doc_id INTEGER,
+    tf INTEGER,
+    PRIMARY KEY (term, doc_id)
+);
+INSERT INTO postings_old SELECT t.term, p.doc_id, p.tf FROM postings p JOIN terms t ON t.term_id = p.term_id;
+CREATE TABLE positions_old(
+    term TEXT,
+    doc_id INTEGER,
+    data BLOB,
+    PRIMARY KEY (term, doc_id)
+);
+INSERT INTO positions_old SELECT t.term, p.doc_id, p.data FROM positions p JOIN terms t ON t.term_id = p.term_id;
+CREATE TABLE df(
+    term TEXT PRIMARY KEY,
+    doc_freq INTEGER,
+    max_score REAL
+);
+INSERT INTO df SELECT term, df, max_score FROM terms;
+DROP TABLE postings;
+DROP TABLE positions;
+DROP TABLE terms;
+ALTER TABLE postings_old RENAME TO postings;
+ALTER TABLE positions_old RENAME TO positions;
+CREATE INDEX idx_postings_term ON postings(term);
+CREATE INDEX idx_postings_doc  ON postings(doc_id);
+CREATE INDEX idx_positions_doc ON positions(doc_id);
+"""
+
+LEGACY_DF = "SELECT doc_freq FROM df WHERE term=?"
+LEGACY_POSTINGS = """
+    SELECT p.doc_id, p.tf, IFNULL(d.length, 0)
+    FROM postings p LEFT JOIN docs d ON d.doc_id = p.doc_id
+    WHERE p.term=?
+    ORDER BY p.doc_id
+"""
+
+TABLES = ("terms", "df", "postings", "positions")
+
+
+def table_sizes(db_path):
+    """
+    {tabla: bytes} de las tablas del diccionario y sus índices.
+    """
+    con = sqlite3.connect(db_path)
+    owner = dict(con.execute("SELECT name, tbl_name FROM sqlite_master WHERE type IN ('table', 'index')"))
+    sizes = {}
+    for name, size in con.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"):
+        table = owner.get(name, name)
+        sizes[table] = sizes.get(table, 0) + size
+    con.close()
+    return sizes
+
+
+def snapshot(db_path):
+    """
+    Contenido del diccionario expresado por término (independiente de term_id).
+    """
+    con = sqlite3.connect(db_path)
+    result = (
+        con.execute("SELECT term, df, max_score FROM terms ORDER BY term").fetchall(),
+        con.execute("""
+            SELECT t.term, p.doc_id, p.tf FROM postings p JOIN terms t ON t.term_id = p.term_id
+            ORDER BY t.term, p.doc_id
+        """).fetchall(),
+        con.execute("""
+            SELECT t.term, p.doc_id, p.data FROM positions p JOIN terms t ON t.term_id = p.term_id
+            ORDER BY t.term, p.doc_id
+        """).fetchall(),
+        con.execute("SELECT term, term_id FROM terms ORDER BY term_id").fetchall(),
+    )
+    con.close()
+    return result
+
+
+def vacuum(db_path):
+    con = sqlite3.connect(db_path)
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    con.execute("PRAGMA journal_mode=DELETE;")
+    con.execute("VACUUM;")
+    con.close()
+    return os.path.getsize(db_path)
+
+
+def timed(fn, terms, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for term in terms:
+            fn(term)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(terms) * 1e6
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, "raw")
+        synthetic.make_corpus(raw_dir, n_docs=n_docs)
+        new_db = os.path.join(tmp, "ri_index.db")
+        synthetic.use_db(new_db)
+        with synthetic.quiet():
+            index_documents(raw_dir, bulk=True, positions=True)
+
+        # --- copia con el esquema anterior ---
+        legacy_db = os.path.join(tmp, "legacy.db")
+        con = get_connection()
+        con.execute("VACUUM INTO ?", (legacy_db,))
+        con.close()
+        con = sqlite3.connect(legacy_db)
+        con.executescript(LEGACY_SCHEMA)
+        con.close()
+        new_size, legacy_size = vacuum(new_db), vacuum(legacy_db)
+
+        new_tables, legacy_tables = table_sizes(new_db), table_sizes(legacy_db)
+        print(f"Índice sintético: {n_docs} documentos con posiciones")
+        print(f"{'tabla (+índices)':<20}{'anterior MB':>14}{'term_id MB':>13}")
+        for table in TABLES:
+            print(f"{table:<20}{legacy_tables.get(table, 0) / 1e6:>14.2f}{new_tables.get(table, 0) / 1e6:>13.2f}")
+        old_dict = sum(legacy_tables.get(t, 0) for t in TABLES)
+        new_dict = sum(new_tables.get(t, 0) for t in TABLES)
+        print(f"{'diccionario':<20}{old_dict / 1e6:>14.2f}{new_dict / 1e6:>13.2f}  ({1 - new_dict / old_dict:.0%} menos)")
+        print(f"{'fichero completo':<20}{legacy_size / 1e6:>14.2f}{new_size / 1e6:>13.2f}  ({1 - new_size / legacy_size:.0%} menos)")
+
+        # --- migración de una copia del índice anterior ---
+        migrated_db = os.path.join(tmp, "migrated.db")
+        shutil.copy(legacy_db, migrated_db)
+        storage.DB_PATH = migrated_db
+        t0 = time.perf_counter()
+        with synthetic.quiet():
+            storage.init_db()
+        t_migrate = time.perf_counter() - t0
+        same = snapshot(migrated_db) == snapshot(new_db)
+        print(f"migración (init_db): {t_migrate:.1f}s, {vacuum(migrated_db) / 1e6:.2f} MB tras VACUUM, "
+              f"igual al índice construido: {same}")
+
+        # --- latencia: df + postings de un término ---
+        storage.DB_PATH = new_db
+        new_con = get_connection()
+        legacy_con = sqlite3.connect(legacy_db)
+        by_df = [t for (t,) in new_con.execute("SELECT term FROM terms ORDER BY df DESC")]
+        workloads = {
+            "frecuente": by_df[:20],
+            "medio": by_df[len(by_df) // 20:len(by_df) // 20 + 200],
+            "raro": by_df[-500:],
+        }
+
+        def legacy_lookup(term):
+            cur = legacy_con.cursor()
+            if cur.execute(LEGACY_DF, (term,)).fetchone():
+                return cur.execute(LEGACY_POSTINGS, (term,)).fetchall()
+
+        def new_lookup(term):
+            cur = new_con.cursor()
+            found = lookup_terms(cur, [term])
+            if term in found:
+                return fetch_postings(cur, found[term][0])
+
+        failures = 0
+        print(f"{'términos':<12}{'anterior µs':>13}{'term_id µs':>12}{'exhaustivo µs':>15}{'wand µs':>10}{'iguales':>9}")
+        for label, terms in workloads.items():
+            ok = all(
+                [tuple(c) for c in zip(*new_lookup(t))] == legacy_lookup(t) for t in terms
+            )
+            failures += not ok
+            t_old = timed(legacy_lookup, terms, repeat)
+            t_new = timed(new_lookup, terms, repeat)
+            t_bm25 = timed(lambda t: bm25_score([t], topk=10, con=new_con), terms, repeat)
+            t_wand = timed(lambda t: bm25_score([t], topk=10, con=new_con, algorithm="wand"), terms, repeat)
+            print(f"{label:<12}{t_old:>13.0f}{t_new:>12.0f}{t_bm25:>15.0f}{t_wand:>10.0f}{str(ok):>9}")
+        new_con.close()
+        legacy_con.close()
+
+        sys.exit(1 if failures or not same else 0)
+
+
+if __name__ == "__main__":
+    main()
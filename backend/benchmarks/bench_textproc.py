@@ -0,0 +1,100 @@
+"""
+Analizador de texto: FastAnalyzer frente a NltkAnalyzer (normalize_text
++ word_tokenize), los dos de app/core/textproc.py.
+
+1) Equivalencia: los dos deben dar exactamente los mismos tokens (antes
+   y después de quitar stopwords) sobre el texto visible de las páginas
+   sintéticas y sobre textos aleatorios con puntuación, comillas,
+   apóstrofos, URLs, espacios Unicode, mayúsculas acentuadas y las
+   contracciones inglesas que separa Treebank.
+2) Rendimiento: MB/s de texto analizado (tokens sin stopwords) por cada
+   analizador, documento a documento y con analyze_batch.
+
+Uso:
+    python backend/benchmarks/bench_textproc.py [n_docs] [n_aleatorios]
+"""
+import random
+import sys
+import time
+
+import synthetic
+from app.core.pageparse import parse_page
+from app.core.textproc import CONTRACTIONS, FastAnalyzer, NltkAnalyzer
+
+TRICKY = [
+    "http", "https://es.wikipedia.org/wiki/Árbol_(informática)", "httpx", "(http://a.b)", "www.ejemplo.es",
+    "cannot", "CANNOT", "gonna", "Wanna", "gotta", "lemme", "gimme", "can't", "don't", "'tis", "more'n",
+    "d'ye", "Ñandú", "ÁRBOL", "İstanbul", "Straße", "ﬁn", "3,14", "1.000", "A.B.C.", "e-mail",
+    "«cita»", "“comillas”", "‘simples’", "``", "''", '"', "...", "--", "—", "¿qué?", "¡sí!", "@#$%&*",
+    " ", " ", "\t", "\n", "\x1c", "​", "́", "á", "ü", "ºª", "²", "٣", "_", "x_y",
+]
+
+
+def random_text(rnd, vocab, words=60):
+    parts = []
+    for _ in range(words):
+        kind = rnd.random()
+        if kind < 0.6:
+            word = rnd.choice(vocab)
+            parts.append(word.upper() if rnd.random() < 0.1 else word)
+        elif kind < 0.9:
+            parts.append(rnd.choice(TRICKY))
+        else:
+            parts.append(rnd.choice(vocab) + rnd.choice(TRICKY) + rnd.choice(vocab))
+        parts.append(rnd.choice([" ", " ", " ", "", ". ", ", ", "\n", "  "]))
+    return "".join(parts)
+
+
+def check_equivalence(texts, fast, reference):
+    mismatches = 0
+    for text in texts:
+        tokens = reference.tokens(text)
+        if fast.tokens(text) != tokens or fast.filter(tokens) != reference.filter(tokens):
+            mismatches += 1
+            if mismatches <= 3:
+                print(f"  DISTINTO: {text[:80]!r}")
+    if fast.analyze_batch(texts) != reference.analyze_batch(texts):
+        mismatches += 1
+        print("  DISTINTO: analyze_batch")
+    return mismatches
+
+
+def throughput(analyze, texts, megabytes, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        analyze(texts)
+        best = min(best, time.perf_counter() - t0)
+    return megabytes / best
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_random = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    rnd = random.Random(3)
+    vocab = synthetic.make_vocabulary() + list(CONTRACTIONS)
+
+    pages = [parse_page(html, "https://es.example.org/")["text"] for _, _, html in synthetic.iter_pages(n_docs)]
+    randoms = [random_text(rnd, vocab) for _ in range(n_random)]
+
+    fast, reference = FastAnalyzer(), NltkAnalyzer()
+    print(f"equivalencia sobre {len(pages)} páginas: {check_equivalence(pages, fast, reference)} diferencias")
+    print(f"equivalencia sobre {len(randoms)} textos aleatorios: "
+          f"{check_equivalence(randoms, fast, reference)} diferencias")
+
+    megabytes = sum(len(text.encode("utf-8")) for text in pages) / 1e6
+    rows = [
+        ("nltk (analyze)", lambda texts: [reference.analyze(t) for t in texts]),
+        ("fast (analyze)", lambda texts: [fast.analyze(t) for t in texts]),
+        ("fast (analyze_batch)", fast.analyze_batch),
+    ]
+    print(f"rendimiento sobre {megabytes:.1f} MB de texto visible:")
+    base = None
+    for name, analyze in rows:
+        mbps = throughput(analyze, pages, megabytes)
+        base = base or mbps
+        print(f"  {name:<22} {mbps:7.2f} MB/s  (x{mbps / base:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Memoria por URL del conjunto de visitados: set de str frente a URLSeen
+(filtro de Bloom escalable), con la tasa de falsos positivos medida
+sobre URLs que nunca se insertaron y el coste de add().
+
+Uso:
+    python backend/benchmarks/bench_urlseen.py [urls] [fp_rate]
+"""
+import random
+import sys
+import time
+import tracemalloc
+
+import synthetic  # noqa: F401  (añade backend/src al PYTHONPATH)
+from app.core.urlseen import URLSeen
+
+
+def make_urls(n, seed):
+    rnd = random.Random(seed)
+    hosts = ["https://es.wikipedia.org", "https://developer.mozilla.org", "https://docs.python.org"]
+    return [
+        f"{rnd.choice(hosts)}/wiki/Artículo_{i}_{rnd.getrandbits(32):08x}?oldid={rnd.randrange(10**8)}"
+        for i in range(n)
+    ]
+
+
+def measure(build):
+    # tiempo sin tracemalloc (lo ralentiza todo) y memoria en otra pasada
+    t0 = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - t0
+
+    tracemalloc.start()
+    obj = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size, elapsed
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    fp_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0.001
+
+    # Las URLs se crean fuera de la medición: el set las guarda tal cual
+    # (se copian al insertarlas: cada URL del crawler es un str propio)
+    urls = make_urls(n, seed=1)
+    unseen = make_urls(n // 10, seed=2)
+
+    def build_set():
+        visited = set()
+        for url in urls:
+            visited.add(url.encode().decode())
+        return visited
+
+    def build_seen():
+        seen = URLSeen(capacity=n // 4, fp_rate=fp_rate)
+        for url in urls:
+            seen.add(url)
+        return seen
+
+    visited, set_bytes, t_set = measure(build_set)
+    del visited
+    seen, seen_bytes, t_seen = measure(build_seen)
+
+    false_positives = sum(url in seen for url in unseen)
+    print(f"{n} URLs (media {sum(map(len, urls)) / n:.0f} caracteres), fp_rate objetivo {fp_rate}")
+    print(f"  set de str: {set_bytes / 2**20:8.1f} MiB  {set_bytes / n:7.1f} bytes/URL  {t_set / n * 1e6:5.2f} µs/add")
+    print(f"  URLSeen:    {seen_bytes / 2**20:8.1f} MiB  {seen_bytes / n:7.1f} bytes/URL  {t_seen / n * 1e6:5.2f} µs/add"
+          f"  ({len(seen.filters)} filtros)")
+    print(f"  falsos positivos medidos: {false_positives}/{len(unseen)} = {false_positives / len(unseen):.5f}")
+
+
+if __name__ == "__main__":
+    main()
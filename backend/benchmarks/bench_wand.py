@@ -0,0 +1,125 @@
+"""
+Equivalencia y coste de WAND (poda dinámica MaxScore) frente a la
+evaluación exhaustiva.
+
+Para consultas aleatorias (2 términos frecuentes + 1 de frecuencia
+media, y 3 frecuentes) comprueba que bm25_score(algorithm="wand") devuelve exactamente
+el mismo top-k que el modo exhaustivo, y mide latencia, postings leídos
+y documentos puntuados. Falla si los postings leídos no quedan por
+debajo de MAX_READ de los postings de las consultas: la poda tiene que
+evitar de verdad leer las listas. Repite la comprobación tras una
+actualización incremental (cotas con deriva de avgdl).
+
+Uso:
+    python backend/benchmarks/bench_wand.py [n_docs] [consultas]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+import synthetic
+from app.index.bm25 import (
+    bm25_score, load_collection_stats, term_upper_bounds, wand_score, BM25_K1, BM25_B
+)
+from app.index.incremental import update_index
+from app.index.indexer import index_documents
+from app.index.storage import get_connection
+
+# Fracción máxima de los postings de las consultas que puede leer WAND
+MAX_READ = {"mixtas": 0.5, "frecuentes": 0.75}
+
+
+def check(queries, topk, max_read):
+    con = get_connection()
+    cur = con.cursor()
+    N, avgdl = load_collection_stats(cur)
+
+    mismatches = 0
+    t_exh = t_wand = 0.0
+    postings_total = postings_read = scored = 0
+
+    for q in queries:
+        t0 = time.perf_counter()
+        exhaustive = bm25_score(q, topk=topk, con=con)
+        t1 = time.perf_counter()
+        wand = bm25_score(q, topk=topk, con=con, algorithm="wand")
+        t2 = time.perf_counter()
+        t_exh += t1 - t0
+        t_wand += t2 - t1
+        if exhaustive != wand:
+            mismatches += 1
+
+        stats = {}
+        wand_score(cur, term_upper_bounds(cur, q, N, avgdl), BM25_K1, BM25_B, avgdl, topk, stats)
+        postings_read += stats.get("postings_read", 0)
+        scored += stats["docs_scored"]
+        postings_total += sum(
+            cur.execute("SELECT IFNULL(MAX(df), 0) FROM terms WHERE term=?", (t,)).fetchone()[0] for t in q
+        )
+
+    con.close()
+    n = len(queries)
+    print(f"  top-{topk}: {n - mismatches}/{n} consultas idénticas")
+    print(f"  latencia media: exhaustivo {t_exh / n * 1000:.2f} ms, wand {t_wand / n * 1000:.2f} ms")
+    print(
+        f"  postings: {postings_total} en total, {postings_read} leídos "
+        f"({postings_read / postings_total:.0%}, máximo {max_read:.0%}), "
+        f"{scored} documentos puntuados por WAND"
+    )
+    if postings_read > max_read * postings_total:
+        print("  WAND lee demasiados postings")
+        return mismatches + 1
+    return mismatches
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    rnd = random.Random(11)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, "raw")
+        synthetic.make_corpus(raw_dir, n_docs=n_docs)
+        synthetic.use_db(os.path.join(tmp, "ri_index.db"))
+        with synthetic.quiet():
+            index_documents(raw_dir, bulk=True)
+
+        con = get_connection()
+        frequent = [t for (t,) in con.execute("SELECT term FROM terms ORDER BY df DESC LIMIT 50")]
+        medium = [t for (t,) in con.execute(
+            "SELECT term FROM terms WHERE df BETWEEN ? AND ? LIMIT 300", (n_docs // 500 + 2, n_docs // 50 + 10)
+        )]
+        con.close()
+        workloads = {
+            "mixtas": [rnd.sample(frequent, 2) + rnd.sample(medium, 1) for _ in range(n_queries)],
+            "frecuentes": [rnd.sample(frequent, 3) for _ in range(n_queries)],
+        }
+
+        print(f"Índice sintético: {n_docs} documentos, {n_queries} consultas por tipo")
+        failures = 0
+        for label, queries in workloads.items():
+            print(f"Consultas {label}:")
+            failures += check(queries, topk=10, max_read=MAX_READ[label])
+
+        # actualización incremental: documentos más largos (avgdl crece)
+        synthetic.make_corpus(os.path.join(tmp, "extra"), n_docs=n_docs + n_docs // 10, words_per_doc=900, seed=2)
+        for n in range(n_docs + 1, n_docs + n_docs // 10 + 1):
+            for ext in (".txt", ".meta.json"):
+                src = os.path.join(tmp, "extra", "%06d-%06d" % ((n // 1000) * 1000, (n // 1000) * 1000 + 999), f"{n:06d}{ext}")
+                dst_dir = os.path.join(raw_dir, os.path.basename(os.path.dirname(src)))
+                os.makedirs(dst_dir, exist_ok=True)
+                os.replace(src, os.path.join(dst_dir, f"{n:06d}{ext}"))
+        with synthetic.quiet():
+            update_index(raw_dir)
+
+        for label, queries in workloads.items():
+            print(f"Consultas {label} tras indexación incremental:")
+            failures += check(queries, topk=10, max_read=MAX_READ[label])
+
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Sitios web sintéticos locales para los benchmarks del crawler.
+
+serve_sites() arranca, en un proceso aparte, n_hosts servidores HTTP en
+127.0.0.1 (un puerto por "host"). Cada uno sirve:
+- /robots.txt (con Crawl-delay opcional, en todos los hosts o solo en
+  los `delayed_hosts` primeros)
+- /p/<i> para i en 0..pages-1: HTML con título, descripción, unos
+  párrafos de texto y enlaces a la página siguiente y a otras al azar,
+  con ETag y Last-Modified (responde 304 a los GET condicionales)
+- con printable=True, /p/<i>?printable=yes: la misma página con otra
+  cabecera (casi duplicada), enlazada desde cada página
+- /__stats: peticiones a /p/ recibidas, cuántas llegaron antes de que
+  pasara el Crawl-delay desde la anterior y el menor intervalo visto
+  (con ?reset=1 se ponen a cero)
+La latencia de cada respuesta simula la red.
+
+Uso desde un benchmark:
+    with local_site.serve_sites(n_hosts=8, pages=300, latency=0.05) as seeds:
+        simple_crawl(seeds, raw_dir, max_pages=500, max_depth=50)
+"""
+import contextlib
+import json
+import multiprocessing
+import random
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+
+import synthetic
+
+
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+class SiteServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # cientos de conexiones simultáneas desde el motor asíncrono
+    request_queue_size = 1024
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.last_request = None
+        self.requests = 0
+        self.violations = 0
+        self.min_gap = None
+
+    def record_request(self, crawl_delay: Optional[float]):
+        # un 10% de margen para el jitter entre despacho y llegada
+        with self.stats_lock:
+            now = time.monotonic()
+            if self.last_request is not None:
+                gap = now - self.last_request
+                self.min_gap = gap if self.min_gap is None else min(self.min_gap, gap)
+                if crawl_delay and gap < crawl_delay * 0.9:
+                    self.violations += 1
+            self.last_request = now
+            self.requests += 1
+
+
+def make_handler(pages: int, latency: float, crawl_delay: Optional[float], seed: int,
+                 printable: bool = False):
+    vocab = synthetic.make_vocabulary(3000)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_body(self, status: int, body: bytes, content_type: str, headers: Optional[Dict] = None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.startswith("/__stats"):
+                with self.server.stats_lock:
+                    stats = {
+                        "requests": self.server.requests,
+                        "violations": self.server.violations,
+                        "min_gap": self.server.min_gap,
+                    }
+                    if "reset=1" in self.path:
+                        self.server.reset_stats()
+                return self.send_body(200, json.dumps(stats).encode(), "application/json")
+
+            if self.path.startswith("/p/"):
+                self.server.record_request(crawl_delay)
+            time.sleep(latency)
+
+            if self.path == "/robots.txt":
+                rules = "User-agent: *\nAllow: /\n"
+                if crawl_delay:
+                    # urllib.robotparser solo entiende segundos enteros
+                    rules += f"Crawl-delay: {crawl_delay:g}\n"
+                return self.send_body(200, rules.encode(), "text/plain; charset=utf-8")
+
+            path, _, query = self.path.partition("?")
+            if not path.startswith("/p/") or not path[3:].isdigit() or query not in ("", "printable=yes"):
+                return self.send_body(404, b"not found", "text/plain")
+            if query and not printable:
+                return self.send_body(404, b"not found", "text/plain")
+
+            i = int(path[3:])
+            if i >= pages:
+                return self.send_body(404, b"not found", "text/plain")
+
+            # las páginas no cambian: mismo ETag siempre
+            etag = f'"{seed}-{i}{"-p" if query else ""}"'
+            if self.headers.get("If-None-Match") == etag or self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            rnd = random.Random(seed * 1_000_003 + i)
+            words = [rnd.choice(vocab) for _ in range(300)]
+            links = {(i + 1) % pages} | {rnd.randrange(pages) for _ in range(8)}
+            body = (
+                "<html><head><meta charset='utf-8'>"
+                f"<title>Página {i}</title>"
+                f"<meta name='description' content='Descripción de la página {i}'>"
+                "</head><body>"
+                + ("<div>Versión para imprimir de la página</div>" if query else "")
+                + f"<h1>Página {i}</h1>"
+                + "".join(f"<p>{' '.join(words[k:k + 50])}</p>" for k in range(0, 300, 50))
+                + "<ul>" + "".join(f"<li><a href='/p/{j}'>enlace {j}</a></li>" for j in sorted(links))
+                + (f"<li><a href='/p/{i}?printable=yes'>imprimir</a></li>" if printable else "") + "</ul>"
+                + "</body></html>"
+            ).encode("utf-8")
+            self.send_body(200, body, "text/html; charset=utf-8", {"ETag": etag, "Last-Modified": LAST_MODIFIED})
+
+    return Handler
+
+
+def _serve(n_hosts, pages, latency, crawl_delay, delayed_hosts, printable, ports_queue):
+    servers = []
+    for h in range(n_hosts):
+        delay = crawl_delay if delayed_hosts is None or h < delayed_hosts else None
+        server = SiteServer(("127.0.0.1", 0), make_handler(pages, latency, delay, seed=h, printable=printable))
+        servers.append(server)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    ports_queue.put([s.server_address[1] for s in servers])
+    threading.Event().wait()
+
+
+@contextlib.contextmanager
+def serve_sites(n_hosts: int = 8, pages: int = 300, latency: float = 0.05,
+                crawl_delay: Optional[float] = None,
+                delayed_hosts: Optional[int] = None,
+                printable: bool = False) -> Iterator[List[str]]:
+    """
+    Arranca los sitios y devuelve una URL semilla por host.
+    """
+    ports_queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(
+        target=_serve, args=(n_hosts, pages, latency, crawl_delay, delayed_hosts, printable, ports_queue),
+        daemon=True,
+    )
+    proc.start()
+    try:
+        ports = ports_queue.get(timeout=30)
+        yield [f"http://127.0.0.1:{port}/p/0" for port in ports]
+    finally:
+        proc.terminate()
+        proc.join()
+
+
+def politeness_stats(seeds: List[str], reset: bool = True) -> List[Dict]:
+    """
+    /__stats de cada host (en el orden de las semillas).
+    """
+    stats = []
+    for seed in seeds:
+        base = seed.split("/p/")[0]
+        with urllib.request.urlopen(f"{base}/__stats{'?reset=1' if reset else ''}") as res:
+            stats.append(json.loads(res.read()))
+    return stats
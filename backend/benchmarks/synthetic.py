@@ -0,0 +1,137 @@
+"""
+Utilidades compartidas por los benchmarks:
+- generar un corpus sintético en el formato de buckets (BUCKET_SIZE,
+  NNNNNN.txt + NNNNNN.meta.json), que el indexador sigue leyendo y que
+  rawstore.migrate_buckets pasa al almacén de segmentos
+- apuntar el índice a una base de datos temporal
+- silenciar los prints de depuración del indexador
+
+Uso desde un benchmark:
+    import synthetic
+    synthetic.make_corpus(raw_dir, n_docs=2000)
+    synthetic.use_db(os.path.join(tmp, "ri_index.db"))
+"""
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+
+# Asegurarse de que backend/src está en el PYTHONPATH (igual que run.py)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_PATH = os.path.join(os.path.dirname(BASE_DIR), "src")
+if SRC_PATH not in sys.path:
+    sys.path.insert(0, SRC_PATH)
+
+from app.core.crawler import get_bucket_dir
+from app.index import storage
+
+# Vocabulario base; se completa con términos sintéticos para tener cola larga
+BASE_WORDS = [
+    "sistema", "información", "recuperación", "buscador", "índice", "consulta",
+    "documento", "término", "ranking", "enlace", "página", "algoritmo", "datos",
+    "red", "neuronal", "inteligencia", "artificial", "aprendizaje", "máquina",
+    "lenguaje", "programación", "computadora", "memoria", "procesador", "archivo",
+    "de", "la", "el", "que", "en", "los", "del", "las", "por", "con", "una", "para",
+]
+
+
+def make_vocabulary(size: int = 20000, seed: int = 7) -> list:
+    """
+    Devuelve un vocabulario de `size` palabras: primero las de BASE_WORDS
+    y después palabras sintéticas pronunciables.
+    """
+    rnd = random.Random(seed)
+    syllables = ["ca", "de", "li", "mo", "ne", "ra", "si", "to", "vu", "ña", "ción", "tér"]
+    vocab = list(BASE_WORDS)
+    seen = set(vocab)
+    while len(vocab) < size:
+        word = "".join(rnd.choice(syllables) for _ in range(rnd.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            vocab.append(word)
+    return vocab
+
+
+def iter_pages(n_docs: int, words_per_doc: int = 400, seed: int = 1):
+    """
+    Genera (n, título, HTML) de n_docs páginas sintéticas (distribución
+    de términos tipo Zipf y enlaces internos).
+    """
+    rnd = random.Random(seed)
+    vocab = make_vocabulary()
+    weights = [1.0 / (rank + 1) for rank in range(len(vocab))]
+
+    for n in range(1, n_docs + 1):
+        words = rnd.choices(vocab, weights=weights, k=words_per_doc)
+        paragraphs = [
+            "<p>" + " ".join(words[i:i + 40]) + ".</p>"
+            for i in range(0, len(words), 40)
+        ]
+        targets = rnd.sample(range(1, n_docs + 1), min(n_docs, rnd.randint(0, 12)))
+        links = " ".join(f'<a href="/wiki/Doc_{t}">Doc {t}</a>' for t in targets)
+        title = f"Documento {n} sobre {words[0]}"
+        html = (
+            f"<html><head><title>{title}</title></head><body>"
+            f"<h1>{title}</h1><main>{''.join(paragraphs)}</main>"
+            f"<nav>{links}</nav></body></html>"
+        )
+        yield n, title, html
+
+
+def make_html_pages(n_docs: int, words_per_doc: int = 400, seed: int = 1) -> list:
+    """
+    HTML de las páginas de iter_pages, sin escribirlas.
+    """
+    return [html for _, _, html in iter_pages(n_docs, words_per_doc, seed)]
+
+
+def write_page(raw_dir: str, n: int, title: str, html: str, url: str) -> str:
+    """
+    Escribe una página como documento n de raw_dir (bucket con .txt y
+    .meta.json). Devuelve la ruta .txt.
+    """
+    bucket_dir = get_bucket_dir(n, raw_dir)
+    os.makedirs(bucket_dir, exist_ok=True)
+    html_path = os.path.join(bucket_dir, f"{n:06d}.txt")
+    with open(html_path, "w", encoding="utf-8") as f:
+        f.write(html)
+    with open(os.path.join(bucket_dir, f"{n:06d}.meta.json"), "w", encoding="utf-8") as mf:
+        json.dump({
+            "title": title,
+            "h1": title,
+            "description": "",
+            "url": url,
+        }, mf, ensure_ascii=False)
+    return html_path
+
+
+def make_corpus(raw_dir: str, n_docs: int = 1000, words_per_doc: int = 400, seed: int = 1) -> list:
+    """
+    Escribe en raw_dir las n_docs páginas de iter_pages. Devuelve las
+    rutas .txt.
+    """
+    return [
+        write_page(raw_dir, n, title, html, f"https://es.example.org/wiki/Doc_{n}")
+        for n, title, html in iter_pages(n_docs, words_per_doc, seed)
+    ]
+
+
+def use_db(db_path: str):
+    """
+    Redirige el índice a db_path (fichero nuevo) y crea el esquema.
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    storage.DB_PATH = db_path
+    storage.init_db()
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Silencia stdout (los [DEBUG] del indexador distorsionan los tiempos).
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
@@ -1,12 +1,14 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
 
 # Importamos tu función real de crawling
-from app.core.crawler import simple_crawl
+from app.core.crawler import open_crawl_state, simple_crawl
+from app.core.async_crawler import async_crawl, ASYNC_CONCURRENCY, ASYNC_PER_HOST
 
 # Importamos la función que nos da la ruta global de raw
 from app.core.paths import data_raw_dir
+from app.core.jobs import JobConflict, start_job
 
 router = APIRouter()
 
@@ -14,8 +16,49 @@ class CrawlRequest(BaseModel):
     seed_urls: List[str]
     max_pages: Optional[int] = 50
     max_depth: Optional[int] = 1
+    engine: Optional[str] = "threads"  # "threads" (ThreadPoolExecutor) o "async" (asyncio)
+    concurrency: Optional[int] = ASYNC_CONCURRENCY  # peticiones en vuelo (motor async)
+    per_host: Optional[int] = ASYNC_PER_HOST  # peticiones simultáneas por host (motor async)
+    resume: Optional[bool] = False  # continuar la frontera del último crawl (crawl_state.db)
 
-@router.post("/crawl")
+CRAWL_ENGINES = ("threads", "async")
+
+def run_crawl(params: dict) -> dict:
+    """
+    Ejecuta un crawl (trabajo en segundo plano de POST /crawl).
+    params: campos de CrawlRequest más raw_dir.
+    """
+    # Llamamos a la función de crawling real pasando la carpeta de destino
+    stats = {}
+    if params["engine"] == "async":
+        saved_files = async_crawl(
+            seed_urls=params["seed_urls"],
+            raw_dir=params["raw_dir"],
+            max_pages=params["max_pages"],
+            max_depth=params["max_depth"],
+            concurrency=params["concurrency"],
+            per_host=params["per_host"],
+            resume=params["resume"],
+            stats=stats
+        )
+    else:
+        saved_files = simple_crawl(
+            seed_urls=params["seed_urls"],
+            raw_dir=params["raw_dir"],
+            max_pages=params["max_pages"],
+            max_depth=params["max_depth"],
+            resume=params["resume"],
+            stats=stats
+        )
+
+    # Construimos y devolvemos un JSON fácil de interpretar
+    return {
+        "total_crawled": len(saved_files),
+        "files": saved_files,
+        "stats": stats
+    }
+
+@router.post("/crawl", status_code=202)
 def crawl_endpoint(req: CrawlRequest):
     """
     Ejemplo de body:
@@ -24,20 +67,33 @@ def crawl_endpoint(req: CrawlRequest):
     "max_pages": 20,
     "max_depth": 2
     }
+
+    Lanza el crawl como trabajo en segundo plano y devuelve su job_id
+    (progreso, resultado y cancelación en /jobs/{job_id}). Solo puede
+    haber un crawl a la vez sobre el mismo raw_dir (409 si no).
     """
+    if req.engine not in CRAWL_ENGINES:
+        raise HTTPException(status_code=400, detail=f"Motor de crawling desconocido: {req.engine}")
+
     # Obtenemos la ruta global donde guardaremos los archivos
     raw_dir = data_raw_dir()
 
-    # Llamamos a la función de crawling real pasando la carpeta de destino
-    saved_files = simple_crawl(
-        seed_urls=req.seed_urls,
-        raw_dir=raw_dir,
-        max_pages=req.max_pages,
-        max_depth=req.max_depth
-    )
+    try:
+        job = start_job("crawl", run_crawl, {**req.model_dump(), "raw_dir": raw_dir},
+                        lock_key=f"crawl:{raw_dir}")
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"job_id": job["job_id"], "status": job["status"]}
 
-    # Construimos y devolvemos un JSON fácil de interpretar
-    return {
-        "total_crawled": len(saved_files),
-        "files": saved_files
-    }
\ No newline at end of file
+@router.get("/crawl/state")
+def crawl_state_endpoint():
+    """
+    Estado persistente del crawler: último doc_id, bytes del corpus,
+    páginas del manifiesto y tamaño de la frontera y de los visitados
+    del último checkpoint.
+    """
+    state = open_crawl_state(data_raw_dir())
+    try:
+        return state.stats()
+    finally:
+        state.close()
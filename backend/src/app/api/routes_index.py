@@ -2,31 +2,98 @@ import os
 from fastapi import APIRouter
 from fastapi import HTTPException
 from pydantic import BaseModel
+from typing import Optional
 
+from app.index import storage
 from app.index.storage import init_db
-from app.index.indexer import index_documents
+from app.index.indexer import INDEX_MEMORY_BUDGET, index_documents
+from app.index.incremental import update_index
+from app.index.segments import convert_db_to_segments
+from app.index.shards import build_shards, run_shards_pagerank
 from app.core.paths import get_project_root
+from app.core.jobs import JobConflict, report_progress, start_job
 
 # Importar PageRank para ejecutarlo después de indexar
-from app.index.pagerank import run_pagerank
+from app.index.pagerank import run_pagerank, pagerank_stats
 
 router = APIRouter()
 
 class IndexRequest(BaseModel):
     raw_dir: str
+    workers: Optional[int] = 1  # procesos de análisis (0 = todos los núcleos)
+    bulk: Optional[bool] = False  # carga masiva (executemany + índices diferidos)
+    incremental: Optional[bool] = False  # sólo archivos nuevos/modificados/borrados
+    warm_start: Optional[bool] = True  # PageRank parte del resultado anterior
+    positions: Optional[bool] = False  # capa posicional (frases y NEAR en /search)
+    segments: Optional[bool] = False  # regenerar también el segmento binario (source="segments")
+    memory_mb: Optional[int] = None  # presupuesto de memoria del indexador (None = INDEX_MEMORY_BUDGET)
+    shards: Optional[int] = 0  # >0: índice repartido en N shards (source="shards"); workers = shards a la vez (0 = uno por núcleo)
 
-@router.post("/index")
+def run_index(params: dict) -> dict:
+    """
+    Indexa y ejecuta PageRank (trabajo en segundo plano de POST /index).
+    params: campos de IndexRequest más raw_dir (absoluto) y db_path.
+    """
+    storage.DB_PATH = params["db_path"]
+
+    # Inicializar la BD antes de indexar
+    init_db()
+
+    memory_budget = params["memory_mb"] * 1024 * 1024 if params["memory_mb"] else INDEX_MEMORY_BUDGET
+
+    # Índice por shards: se construyen en paralelo y PageRank usa el grafo de todos
+    if params["shards"]:
+        stats = build_shards(params["raw_dir"], params["shards"],
+                             processes=params["workers"] or None,
+                             bulk=params["bulk"], positions=params["positions"], memory_budget=memory_budget)
+        report_progress("pagerank", 0)
+        info = run_shards_pagerank([shard["path"] for shard in stats["shards"]], verbose=True)
+        return {"indexed": stats, "pagerank": info}
+
+    # Llamada al indexador con la ruta absoluta
+    if params["incremental"]:
+        stats = update_index(params["raw_dir"], workers=params["workers"])
+    else:
+        stats = index_documents(params["raw_dir"], workers=params["workers"], bulk=params["bulk"],
+                                positions=params["positions"], memory_budget=memory_budget)
+
+    # Ejecutar PageRank tras indexar
+    report_progress("pagerank", 0)
+    try:
+        run_pagerank(verbose=True, warm_start=params["warm_start"])  # verbose=True para que imprima logs en consola
+    except Exception as e:
+        # No bloqueamos el trabajo si PageRank falla,
+        # pero mostramos el error en consola
+        print("Error al calcular PageRank tras indexar:", e)
+
+    response = {
+        "indexed": stats,
+        "pagerank": pagerank_stats()
+    }
+
+    # Regenerar el segmento binario a partir de la BD recién escrita
+    if params["segments"]:
+        report_progress("segments", 0)
+        response["segments"] = convert_db_to_segments()
+
+    return response
+
+@router.post("/index", status_code=202)
 def index_endpoint(req: IndexRequest):
     """
     Ejemplo de body:
     {
-      "raw_dir": "data/raw"
+      "raw_dir": "data/raw",
+      "workers": 4,
+      "bulk": true
     }
 
     Esta función:
     - Combina la ruta relativa con la raíz real del proyecto
-    - Llama al indexador
-    - Ejecuta PageRank después de indexar
+    - Lanza como trabajo en segundo plano el indexador y, después,
+      PageRank (run_index), y devuelve su job_id (progreso, resultado y
+      cancelación en /jobs/{job_id})
+    - Responde 409 si ya hay una indexación en curso sobre la misma BD
     """
 
     project_root = get_project_root()
@@ -37,22 +104,15 @@ def index_endpoint(req: IndexRequest):
     # Verificar que existe la carpeta raw
     if not os.path.isdir(abs_raw_dir):
         raise HTTPException(status_code=400, detail=f"Directorio raw no existe: {abs_raw_dir}")
-    
-    # Inicializar la BD antes de indexar
-    init_db()
 
-    # Llamada al indexador con la ruta absoluta
-    stats = index_documents(abs_raw_dir)
+    if req.shards and req.incremental:
+        raise HTTPException(status_code=400, detail="El índice por shards no admite indexación incremental")
+    if req.shards and req.segments:
+        raise HTTPException(status_code=400, detail="El índice por shards no admite segmentos binarios")
 
-    # Ejecutar PageRank tras indexar
+    params = {**req.model_dump(), "raw_dir": abs_raw_dir, "db_path": storage.DB_PATH}
     try:
-        run_pagerank(verbose=True)  # verbose=True para que imprima logs en consola
-    except Exception as e:
-        # No bloqueamos la respuesta si PageRank falla,
-        # pero mostramos el error en consola
-        print("Error al calcular PageRank tras indexar:", e)
-
-    return {
-        "indexed": stats,
-        "pagerank": "calculado"
-    }
\ No newline at end of file
+        job = start_job("index", run_index, params, lock_key=f"index:{storage.DB_PATH}")
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"job_id": job["job_id"], "status": job["status"]}
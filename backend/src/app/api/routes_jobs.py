@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.core.jobs import FINAL_STATUSES, cancel_job, get_job, list_jobs
+
+router = APIRouter()
+
+# Cada cuánto consulta /jobs/{job_id}/events si el trabajo ha avanzado
+EVENTS_POLL_SECONDS = 0.5
+
+@router.get("/jobs")
+def jobs_endpoint(limit: int = 20):
+    """
+    Últimos trabajos (más recientes primero).
+    """
+    return list_jobs(limit)
+
+@router.get("/jobs/{job_id}")
+def job_endpoint(job_id: str):
+    """
+    Estado de un trabajo: status (queued, running, done, failed,
+    cancelled), progress (fase, done/total, rate por segundo, eta_s y
+    contadores de la fase), result al terminar o error si falló.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo no encontrado: {job_id}")
+    return job
+
+@router.post("/jobs/{job_id}/cancel")
+def cancel_job_endpoint(job_id: str):
+    """
+    Pide cancelar un trabajo. Se atiende en su siguiente informe de
+    progreso (normalmente en menos de un segundo); devuelve el trabajo,
+    que pasará a status "cancelled".
+    """
+    job = cancel_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo no encontrado: {job_id}")
+    return job
+
+@router.get("/jobs/{job_id}/events")
+async def job_events_endpoint(job_id: str):
+    """
+    Progreso del trabajo como Server-Sent Events: un evento `progress`
+    cada vez que cambia y un evento `end` con el trabajo completo al
+    terminar.
+    """
+    if await asyncio.to_thread(get_job, job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo no encontrado: {job_id}")
+
+    async def events():
+        last = None
+        while True:
+            job = await asyncio.to_thread(get_job, job_id)
+            if job["status"] in FINAL_STATUSES:
+                yield f"event: end\ndata: {json.dumps(job)}\n\n"
+                return
+            current = (job["status"], job["progress"])
+            if current != last:
+                last = current
+                data = {"status": job["status"], "progress": job["progress"]}
+                yield f"event: progress\ndata: {json.dumps(data)}\n\n"
+            await asyncio.sleep(EVENTS_POLL_SECONDS)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
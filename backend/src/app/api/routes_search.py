@@ -1,30 +1,45 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
-from app.core.textproc import normalize_text, tokenize_text, remove_stopwords
+from app.core.textproc import normalize_text
 from app.index.bm25 import bm25_score
-from app.index.storage import get_connection
+from app.index.docstore import load_doc_texts
+from app.index.indexer import read_raw_document
+from app.index.positions import load_doc_positions
+from app.index.query import parse_query, has_operators, matching_docs
+from app.index.cache import search_cache, shard_search_cache
+from app.index.shards import ShardSet
+from app.index.storage import get_read_connection
 
 router = APIRouter()
 
 class SearchRequest(BaseModel):
-    query: str
+    query: str         # admite "frases exactas" y palabra NEAR/k otra (requieren índice posicional)
     topk: int = 10     # número de documentos a considerar del ranking BM25
     page: int = 1      # página actual para paginación
     page_size: int = 5 # tamaño de página para paginación
+    algorithm: str = "exhaustive"  # "exhaustive" o "wand" (poda dinámica, mismo top-k)
+    source: str = "sqlite"  # "sqlite", "segments" (índice binario comprimido) o "shards" (índice por shards)
+    use_cache: bool = True  # servir desde la caché de resultados si es posible
 
-def extract_snippets_bm25(text: str, query_terms: list, window: int = 15, max_snip: int = 3) -> str:
+def extract_snippets_bm25(text: str, query_terms: list, window: int = 15, max_snip: int = 3,
+                          positions: list = None) -> str:
     """
     Extrae hasta max_snip snippets del texto, priorizando zonas con mayor densidad de query_terms.
     Luego resalta los términos de consulta con <b>…</b>.
+    positions: posiciones (índices de palabra en text) de los términos, si
+    vienen del índice posicional; así no hace falta recorrer el texto.
     """
     words = text.split()
-    positions = []
 
-    # encontrar todas las posiciones donde aparezcan términos de consulta
-    for i, w in enumerate(words):
-        if w in query_terms:
-            positions.append(i)
+    if positions is not None:
+        positions = [p for p in positions if p < len(words)]
+    else:
+        # encontrar todas las posiciones donde aparezcan términos de consulta
+        positions = []
+        for i, w in enumerate(words):
+            if w in query_terms:
+                positions.append(i)
 
     # si no hay ocurrencias de términos
     if not positions:
@@ -63,55 +78,150 @@ def extract_snippets_bm25(text: str, query_terms: list, window: int = 15, max_sn
 
     return " ".join(snippets)
 
+def cache_key(parsed: dict, req: SearchRequest) -> tuple:
+    """
+    Clave de la caché: términos normalizados, operadores y parámetros
+    que cambian el ranking (no la página).
+    """
+    return (
+        tuple(parsed["terms"]),
+        tuple(tuple(phrase) for phrase in parsed["phrases"]),
+        tuple(parsed["nears"]),
+        req.topk,
+        req.algorithm,
+        req.source,
+    )
+
+@router.get("/search/cache")
+def search_cache_stats():
+    """
+    Contadores de las cachés de resultados (aciertos, fallos, expulsiones,
+    invalidaciones por nueva generación, tamaño): la del índice SQLite y
+    la del índice por shards.
+    """
+    return {"sqlite": search_cache.stats(), "shards": shard_search_cache.stats()}
+
 @router.post("/search")
 def search_endpoint(req: SearchRequest):
-    # normalizar y tokenizar la consulta
-    text = normalize_text(req.query)
-    tokens = tokenize_text(text)
-    filtered_query_terms = remove_stopwords(tokens)
+    # normalizar y tokenizar la consulta (separando frases y NEAR)
+    parsed = parse_query(req.query)
+    filtered_query_terms = parsed["terms"]
+
+    # conexión de lectura del hilo (estadísticas globales ya cargadas);
+    # con source="shards", las de cada shard y su caché propia
+    shards = None
+    if req.source == "shards":
+        try:
+            shards = ShardSet()
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        con = None
+        index_stats = shards.stats
+        generation = shards.generation
+        cache = shard_search_cache
+    else:
+        reader = get_read_connection()
+        con = reader.con
+        index_stats = reader.stats
+        generation = reader.generation
+        cache = search_cache
+    positional = index_stats["positions"]
+
+    # --- ranking desde la caché si la generación del índice no cambió ---
+    key = cache_key(parsed, req)
+    entry = cache.get(key, generation) if req.use_cache else None
+    cached = entry is not None
+
+    if entry is None:
+        # frases y NEAR: documentos que cumplen las restricciones
+        doc_filter = None
+        if has_operators(parsed):
+            if not positional:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Las frases y NEAR necesitan un índice posicional (indexa con positions=true)"
+                )
+            doc_filter = shards.matching_docs(parsed) if shards is not None else matching_docs(con, parsed)
 
-    # ranking BM25 con topk
-    all_ranked = bm25_score(filtered_query_terms, topk=req.topk)
+        # ranking BM25 con topk
+        try:
+            all_ranked = bm25_score(
+                filtered_query_terms, topk=req.topk, con=con,
+                algorithm=req.algorithm, source=req.source, doc_filter=doc_filter,
+                stats=(index_stats["N"], index_stats["avgdl"])
+            )
+        except (ValueError, FileNotFoundError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # results: doc_id -> resultado ya montado (cada página nueva guarda una entrada ampliada)
+        entry = {"ranked": all_ranked, "results": {}}
+        if req.use_cache:
+            cache.put(key, generation, entry)
+
+    # la entrada puede estar compartida con otras peticiones: no se modifica,
+    # los documentos nuevos van a added y se guarda una entrada nueva
+    all_ranked = entry["ranked"]
+    built = entry["results"]
+    added = {}
 
     # paginación sobre los topk
     start = (req.page - 1) * req.page_size
     end = req.page * req.page_size
     paged_ranked = all_ranked[start:end]
+    missing = [(doc_id, score) for doc_id, score in paged_ranked if doc_id not in built]
 
-    results = []
-    con = get_connection()
+    if missing:
+        # valor máximo de PageRank (para normalizar), precargado en el pool
+        max_pr = index_stats["max_pagerank"]
 
-    # Calcular el valor máximo de PageRank una sola vez (para normalizar)
-    max_pr_row = con.execute("SELECT MAX(rank) FROM pagerank").fetchone()
-    max_pr = max_pr_row[0] if max_pr_row and max_pr_row[0] not in (None, 0) else 1.0
+        # conexión que guarda cada documento (su shard con source="shards")
+        page_ids = [doc_id for doc_id, _ in missing]
+        owners = shards.owners(page_ids) if shards is not None else dict.fromkeys(page_ids, con)
 
-    # recorrer los documentos paginados
-    for doc_id, score_bm25 in paged_ranked:
+        # texto limpio de todos los documentos de la página (una consulta por BD)
+        # y posiciones de los términos en ellos (snippets sin recorrer el texto)
+        doc_texts = {}
+        doc_positions = {}
+        for doc_con in set(owners.values()):
+            ids = [doc_id for doc_id in page_ids if owners[doc_id] is doc_con]
+            doc_texts.update(load_doc_texts(doc_con, ids))
+            if positional:
+                doc_positions.update(load_doc_positions(doc_con, ids, list(set(filtered_query_terms))))
+
+    # recorrer los documentos paginados que aún no están montados
+    for doc_id, score_bm25 in missing:
 
         # obtener título y path del documento
-        row = con.execute(
+        doc_con = owners.get(doc_id)
+        row = doc_con.execute(
             "SELECT title, path FROM docs WHERE doc_id=?", (doc_id,)
-        ).fetchone()
+        ).fetchone() if doc_con is not None else None
         title = row[0] if row else ""
         path = row[1] if row else ""
 
-        # leer el texto completo del documento para snippet
-        try:
-            with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                raw_text = f.read()
-        except Exception:
-            raw_text = ""
-
-        # normalizar texto completo para buscar snippet
-        normalized_doc_text = normalize_text(raw_text)
+        # texto normalizado guardado al indexar; si el índice es anterior
+        # a doc_text, se recurre al documento crudo (.txt o almacén de segmentos)
+        snippet_positions = None
+        if doc_id in doc_texts:
+            normalized_doc_text, token_offset = doc_texts[doc_id]
+            if positional:
+                snippet_positions = [
+                    p - token_offset for p in doc_positions.get(doc_id, []) if p >= token_offset
+                ]
+        else:
+            raw = read_raw_document(path) if path else None
+            raw_text = raw[0] if raw else ""
+            normalized_doc_text = normalize_text(raw_text)
 
         # extraer snippet alrededor de los términos de consulta
-        snippet = extract_snippets_bm25(normalized_doc_text, filtered_query_terms)
+        snippet = extract_snippets_bm25(
+            normalized_doc_text, filtered_query_terms, positions=snippet_positions
+        )
 
         # obtener PageRank si existe
-        pr_row = con.execute(
+        pr_row = doc_con.execute(
             "SELECT rank FROM pagerank WHERE doc_id=?", (doc_id,)
-        ).fetchone()
+        ).fetchone() if doc_con is not None else None
 
         # PageRank real sin normalizar
         raw_pr = pr_row[0] if pr_row else 0.0
@@ -123,8 +233,8 @@ def search_endpoint(req: SearchRequest):
         alpha = 0.7
         final_score = alpha * score_bm25 + (1 - alpha) * pagerank_norm
 
-        # añadir resultado a la lista con todos los campos
-        results.append({
+        # añadir resultado con todos los campos
+        added[doc_id] = {
             "doc_id": doc_id,
             "title": title,
             "score_bm25": score_bm25,
@@ -133,17 +243,21 @@ def search_endpoint(req: SearchRequest):
             "score": final_score,
             "path": path,
             "snippet": snippet
-        })
+        }
+
+    if missing and req.use_cache:
+        cache.refresh(key, generation, {"ranked": all_ranked, "results": {**built, **added}})
+
+    results = [built[doc_id] if doc_id in built else added[doc_id] for doc_id, _ in paged_ranked]
 
     # opcional: ordenar por score (descendente)
     results.sort(key=lambda r: r["score"], reverse=True)
 
-    con.close()
-
     return {
         "query_terms": filtered_query_terms,
         "page": req.page,
         "page_size": req.page_size,
         "total_results": len(all_ranked),
+        "cached": cached,
         "results": results
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,378 @@
+"""
+Motor de crawling asíncrono (asyncio + httpx).
+
+Alternativa a simple_crawl para frontera con muchos hosts: en lugar de
+MAX_WORKERS hilos bloqueados en requests.get, mantiene cientos de
+peticiones en vuelo en un único bucle de eventos. La cortesía por host
+(crawl-delay y límite de peticiones simultáneas) la aplica el mismo
+HostScheduler que usa simple_crawl.
+
+Conserva la semántica de simple_crawl: normalización de URLs, BFS por
+profundidad dentro del mismo dominio, robots.txt (con la excepción de
+Wikipedia) y crawl-delay, cuota MAX_TOTAL_BYTES, límite MAX_HTML_SIZE,
+almacenamiento en segmentos con numeración continua (store_page), GET
+condicional de las páginas ya guardadas y descarte de casi duplicados.
+"""
+import asyncio
+import urllib.robotparser
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+from .crawler import (
+    DEFAULT_USER_AGENT,
+    MAX_HTML_SIZE,
+    MAX_TOTAL_BYTES,
+    WIKIPEDIA_CRAWL_DELAY,
+    count_fetch,
+    load_stored_links,
+    load_validators,
+    new_crawl_stats,
+    open_crawl_state,
+    parse_fetched_page,
+    print_crawl_stats,
+    robots_cache,
+    robots_from_response,
+    robots_policy,
+    same_site_links,
+    start_frontier,
+    store_page,
+)
+from .jobs import JobCancelled, report_progress
+from .scheduler import HostScheduler
+
+# Peticiones simultáneas en total y por host
+ASYNC_CONCURRENCY = 200
+ASYNC_PER_HOST = 8
+
+# Timeout de cada petición (segundos), igual que crawl_page
+ASYNC_TIMEOUT = 10
+
+class AsyncCrawler:
+    """
+    Estado de un crawl asíncrono: frontera por hosts (HostScheduler),
+    visitados, numeración y cuota (crawl_state.db), clientes HTTP por
+    host y caché de robots.txt compartida (robots_cache).
+    """
+
+    def __init__(self, raw_dir: str, max_pages: int, max_depth: int,
+                 concurrency: int, per_host: int, user_agent: str,
+                 stats: Dict[str, int]):
+        self.raw_dir = raw_dir
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.user_agent = user_agent
+
+        self.state = open_crawl_state(raw_dir)
+        self.seen = None  # URLSeen, lo crea start_frontier
+        self.frontier = HostScheduler(max_per_host=per_host)
+        self.saved_files: List[str] = []
+        # peticiones en vuelo: url → profundidad (van a la frontera en los checkpoints)
+        self.running: Dict[str, int] = {}
+        self.stopped = False
+        self.stats = stats
+
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.wakeup = asyncio.Event()
+
+    # ---------------- clientes HTTP ----------------
+
+    def client(self, netloc: str) -> httpx.AsyncClient:
+        """
+        Cliente httpx del host. Un pool de per_host conexiones por host en
+        vez de uno global: httpcore recorre todas las conexiones del pool
+        en cada petición y con cientos de ellas el coste es cuadrático.
+        """
+        client = self.clients.get(netloc)
+        if client is None:
+            limits = httpx.Limits(max_connections=self.per_host, max_keepalive_connections=self.per_host)
+            client = httpx.AsyncClient(limits=limits, timeout=ASYNC_TIMEOUT, follow_redirects=True)
+            self.clients[netloc] = client
+        return client
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
+
+    # ---------------- robots.txt ----------------
+
+    async def trace(self, event_name: str, info: dict):
+        # httpcore avisa de cada conexión TCP nueva (las demás se reutilizan)
+        if event_name == "connection.connect_tcp.complete":
+            self.stats["connections"] += 1
+
+    async def get(self, url: str, headers: dict) -> httpx.Response:
+        self.stats["requests"] += 1
+        return await self.client(urlparse(url).netloc).get(
+            url, headers=headers, extensions={"trace": self.trace}
+        )
+
+    async def robots(self, domain: str) -> urllib.robotparser.RobotFileParser:
+        """
+        robots.txt del dominio. HostScheduler solo deja una petición en
+        vuelo por host mientras no se conoce su crawl-delay, así que se
+        descarga una sola vez. Si falla, se reintenta en la siguiente URL.
+        """
+        if domain in robots_cache:
+            return robots_cache[domain]
+        res = await self.get(f"{domain}/robots.txt", headers={"User-Agent": self.user_agent})
+        rp = robots_from_response(domain, res.status_code, res.text)
+        robots_cache[domain] = rp
+        return rp
+
+    # ---------------- descarga ----------------
+
+    async def crawl_page(self, url: str, validators: Optional[Dict[str, str]] = None
+                         ) -> Tuple[str, Optional[float], dict]:
+        """
+        Equivalente asíncrono de crawler.crawl_page: (HTML de la página o
+        "" si robots.txt lo prohíbe, hay cualquier error o responde 304,
+        crawl-delay, info con status / bytes / etag / last_modified).
+        """
+        delay = None
+        info = {"status": None, "bytes": 0}
+        try:
+            parsed = urlparse(url)
+            domain = f"{parsed.scheme}://{parsed.netloc}"
+
+            # --- Excepción conocida para Wikipedia ---
+            if parsed.netloc.endswith("wikipedia.org"):
+                allowed, delay = True, WIKIPEDIA_CRAWL_DELAY
+            else:
+                rp = await self.robots(domain)
+                allowed, delay = robots_policy(url, rp, self.user_agent)
+
+            if not allowed:
+                print(f"[robots.txt] Acceso denegado para {url}")
+                return "", delay, info
+
+            headers = {"User-Agent": self.user_agent}
+            if validators:
+                if validators.get("etag"):
+                    headers["If-None-Match"] = validators["etag"]
+                if validators.get("last_modified"):
+                    headers["If-Modified-Since"] = validators["last_modified"]
+            res = await self.get(url, headers)
+            info["status"] = res.status_code
+            if res.status_code == 304:
+                return "", delay, info
+            res.raise_for_status()
+
+            info["bytes"] = len(res.content)
+            info["etag"] = res.headers.get("ETag")
+            info["last_modified"] = res.headers.get("Last-Modified")
+            return res.text, delay, info
+
+        except Exception as e:
+            print(f"Crawl error en {url}:", e)
+            return "", delay, info
+
+    # ---------------- bucle principal ----------------
+
+    def enqueue(self, url: str, depth: int):
+        self.frontier.push(url, depth)
+        self.wakeup.set()
+
+    def checkpoint(self):
+        self.state.checkpoint(list(self.frontier.items()) + list(self.running.items()))
+
+    def processed(self) -> int:
+        # páginas tratadas: guardadas + sin cambios (304)
+        return len(self.saved_files) + self.stats["not_modified"]
+
+    async def process(self, url: str, depth: int):
+        try:
+            # Si ya la teníamos guardada → GET condicional con su ETag / Last-Modified
+            known = self.state.find_page(url)
+            validators = await asyncio.to_thread(load_validators, self.raw_dir, known[0]) if known else None
+
+            html_text, delay, info = await self.crawl_page(url, validators)
+            self.frontier.release(url, delay)
+            count_fetch(self.stats, info, known)
+
+            if info.get("status") == 304:
+                await self.handle_not_modified(url, depth, known[0])
+            else:
+                await self.handle_page(url, depth, html_text, info, known)
+        finally:
+            # visitada solo cuando sus enlaces ya están en la frontera;
+            # si el crawl se ha parado no se han encolado: vuelve a la
+            # frontera para el checkpoint
+            del self.running[url]
+            if self.stopped:
+                self.frontier.push(url, depth)
+            else:
+                self.state.mark_visited(url)
+            self.wakeup.set()
+
+    def enqueue_links(self, url: str, depth: int, links: List[str]):
+        # --- Encolar los enlaces del mismo sitio si hay profundidad ---
+        if depth < self.max_depth and not self.stopped:
+            # deduplicación al encolar: cada URL entra una sola vez en la frontera
+            for link in same_site_links(links, url):
+                if self.seen.add(link):
+                    self.enqueue(link, depth + 1)
+
+    async def handle_not_modified(self, url: str, depth: int, doc_id: int):
+        # Sin cambios: ni se reescribe ni se reindexa; los enlaces salen de la copia guardada
+        print(f"[CRAWL] Sin cambios (304): {url}")
+        if depth < self.max_depth and not self.stopped:
+            links = await asyncio.to_thread(load_stored_links, self.raw_dir, doc_id, url)
+            self.enqueue_links(url, depth, links)
+
+    async def handle_page(self, url: str, depth: int, html_text: str, info: dict,
+                          known: Optional[Tuple[int, int]]):
+        # Si no hay HTML o está vacío → ignorar
+        if not html_text or self.stopped:
+            return
+
+        # Si HTML demasiado grande → ignorar
+        if len(html_text) > MAX_HTML_SIZE:
+            print(f"[SKIP] HTML demasiado grande: {url}")
+            return
+
+        if self.processed() >= self.max_pages:
+            return
+
+        # parseo (una sola pasada, con la huella del texto) fuera del bucle de eventos
+        page = await asyncio.to_thread(parse_fetched_page, html_text, url)
+        if self.stopped or self.processed() >= self.max_pages:
+            return
+
+        doc_bytes = len(html_text.encode("utf-8"))
+        old_bytes = known[1] if known else 0
+
+        # --- Casi duplicada de una página ya guardada → no se guarda (sí se siguen sus enlaces) ---
+        canonical = None
+        if not known and page["simhash"] is not None:
+            canonical = self.state.find_near_duplicate(page["simhash"])
+        if canonical is not None:
+            self.state.mark_near_duplicate(url, canonical)
+            self.stats["near_duplicates"] += 1
+            self.stats["near_duplicate_bytes"] += doc_bytes
+            print(f"[SKIP] Casi duplicada de doc_id={canonical}: {url}")
+            self.enqueue_links(url, depth, page["links"])
+            return
+
+        if self.state.total_bytes + doc_bytes - old_bytes > MAX_TOTAL_BYTES:
+            print("[STOP] Cuota máxima de 10GB alcanzada")
+            self.stopped = True
+            return
+
+        # numeración y cuota se reservan aquí, dentro del bucle (sin carreras);
+        # una página que ya teníamos y ha cambiado se reescribe en su sitio
+        if known:
+            new_idx = self.state.update_page(known[0], url, doc_bytes, old_bytes, page["simhash"])
+        else:
+            new_idx = self.state.reserve_page(url, doc_bytes, page["simhash"])
+        self.saved_files.append("")
+        slot = len(self.saved_files) - 1
+
+        # escritura fuera del bucle de eventos
+        doc_key = await asyncio.to_thread(store_page, new_idx, url, html_text, self.raw_dir, info, page)
+        self.saved_files[slot] = doc_key
+        print(f"[CRAWL] Guardado ({len(self.saved_files)}/{self.max_pages}): {url}")
+
+        self.enqueue_links(url, depth, page["links"])
+
+    async def run(self, seed_urls: List[str], resume: bool = False) -> List[str]:
+        self.seen = start_frontier(self.state, self.frontier, seed_urls, resume)
+
+        tasks = set()
+        try:
+            await self.crawl_frontier(tasks)
+        except JobCancelled:
+            # cancelado: se esperan las peticiones en vuelo sin seguir sus enlaces
+            self.stopped = True
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return [path for path in self.saved_files if path]
+
+    async def crawl_frontier(self, tasks: set):
+        while not self.stopped and self.processed() < self.max_pages:
+            # --- Lanzar tareas de los hosts disponibles mientras haya hueco ---
+            while (
+                len(self.running) < self.concurrency
+                and self.processed() + len(self.running) < self.max_pages
+            ):
+                item = self.frontier.pop()
+                if item is None:
+                    break
+                url, depth = item
+                self.running[url] = depth
+                task = asyncio.ensure_future(self.process(url, depth))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if self.state.checkpoint_due():
+                self.checkpoint()
+
+            # Progreso del trabajo en segundo plano (y punto de cancelación)
+            report_progress("crawl", self.processed(), self.max_pages, fetched=self.stats["fetched"],
+                            saved=len(self.saved_files), not_modified=self.stats["not_modified"],
+                            near_duplicates=self.stats["near_duplicates"], frontier=len(self.frontier))
+
+            wait_time = self.frontier.wait_time()
+            if not self.running and wait_time is None:
+                break
+            if len(self.running) >= self.concurrency or self.processed() + len(self.running) >= self.max_pages:
+                # sin hueco: solo despierta al terminar una tarea
+                wait_time = None
+
+            # --- Esperar a que termine alguna tarea o se libere un host ---
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=wait_time)
+            except asyncio.TimeoutError:
+                pass
+
+async def async_crawl_loop(
+    seed_urls: List[str],
+    raw_dir: str,
+    max_pages: int = 100,
+    max_depth: int = 2,
+    concurrency: int = ASYNC_CONCURRENCY,
+    per_host: int = ASYNC_PER_HOST,
+    user_agent: str = DEFAULT_USER_AGENT,
+    resume: bool = False,
+    stats: Optional[Dict[str, int]] = None,
+) -> List[str]:
+    if stats is None:
+        stats = {}
+    stats.update(new_crawl_stats())
+    crawler = AsyncCrawler(raw_dir, max_pages, max_depth, concurrency, per_host, user_agent, stats)
+    try:
+        return await crawler.run(seed_urls, resume=resume)
+    finally:
+        # Checkpoint final: lo pendiente y lo que estaba en vuelo
+        crawler.checkpoint()
+        crawler.state.close()
+        await crawler.close()
+        print_crawl_stats(stats)
+
+def async_crawl(
+    seed_urls: List[str],
+    raw_dir: str,
+    max_pages: int = 100,
+    max_depth: int = 2,
+    concurrency: int = ASYNC_CONCURRENCY,
+    per_host: int = ASYNC_PER_HOST,
+    resume: bool = False,
+    stats: Optional[Dict[str, int]] = None,
+) -> List[str]:
+    """
+    Igual que simple_crawl (mismos parámetros y resultado: claves de los
+    documentos guardados) pero con el motor asíncrono: hasta `concurrency`
+    peticiones en vuelo y como mucho `per_host` por host.
+    """
+    return asyncio.run(async_crawl_loop(
+        seed_urls, raw_dir, max_pages=max_pages, max_depth=max_depth,
+        concurrency=concurrency, per_host=per_host, resume=resume, stats=stats,
+    ))
@@ -0,0 +1,266 @@
+"""
+Estado persistente del crawler: raw_dir/crawl_state.db (SQLite).
+
+Guarda lo que simple_crawl / async_crawl tenían solo en memoria o
+recalculaban en cada arranque recorriendo todo data/raw:
+- meta: último doc_id asignado y bytes totales del corpus (cuota
+  MAX_TOTAL_BYTES), así el arranque es O(1)
+- pages: manifiesto del crawl, una fila por página guardada
+  (doc_id, url, bytes, instante). Se escribe al reservar el doc_id,
+  antes de crear los ficheros, así que dos crawls nunca reutilizan un
+  número aunque el proceso muera a medias
+- frontier / visited: frontera pendiente y URLs ya descargadas del crawl
+  en curso, volcadas en checkpoints periódicos para poder reanudarlo
+- fingerprints / near_duplicates: SimHash del texto de cada página
+  guardada y URLs descartadas por ser casi duplicadas de otra (con el
+  doc_id de la guardada)
+
+Solo la primera vez (o si se borra el fichero) hay que recorrer raw_dir
+para inicializar los contadores con el corpus que ya existiera.
+"""
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .simhash import SimHashIndex, to_signed, to_unsigned
+
+CRAWL_STATE_FILE = "crawl_state.db"
+
+# Cada cuántas páginas guardadas o segundos se vuelca la frontera
+CHECKPOINT_PAGES = 100
+CHECKPOINT_SECONDS = 30
+
+def crawl_state_path(raw_dir: str) -> str:
+    return os.path.join(raw_dir, CRAWL_STATE_FILE)
+
+class CrawlState:
+    """
+    Acceso a crawl_state.db. Lo usa un único hilo: el bucle que reparte
+    el trabajo del crawl.
+    """
+
+    def __init__(self, raw_dir: str):
+        os.makedirs(raw_dir, exist_ok=True)
+        self.con = sqlite3.connect(crawl_state_path(raw_dir))
+        self.con.execute("PRAGMA journal_mode=WAL;")
+        self.con.execute("PRAGMA synchronous=NORMAL;")
+        self.con.executescript("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key   TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS pages (
+            doc_id     INTEGER PRIMARY KEY,
+            url        TEXT NOT NULL,
+            bytes      INTEGER NOT NULL,
+            crawled_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_pages_url ON pages(url);
+        CREATE TABLE IF NOT EXISTS frontier (
+            seq   INTEGER PRIMARY KEY,
+            url   TEXT NOT NULL,
+            depth INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS visited (
+            url TEXT PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS fingerprints (
+            doc_id  INTEGER PRIMARY KEY,
+            simhash INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS near_duplicates (
+            url    TEXT PRIMARY KEY,
+            doc_id INTEGER NOT NULL
+        );
+        """)
+
+        meta = dict(self.con.execute("SELECT key, value FROM meta"))
+        self.initialized = "last_doc_id" in meta
+        self.last_doc_id = meta.get("last_doc_id", 0)
+        self.total_bytes = meta.get("total_bytes", 0)
+
+        self.new_visited: List[str] = []
+        # huellas de las páginas guardadas; se carga al primer uso
+        self.fingerprints: Optional[SimHashIndex] = None
+        self.pages_since_checkpoint = 0
+        self.last_checkpoint = time.monotonic()
+
+    def _save_counters(self):
+        self.con.executemany(
+            "INSERT INTO meta(key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            [("last_doc_id", self.last_doc_id), ("total_bytes", self.total_bytes)],
+        )
+
+    def init_counters(self, last_doc_id: int, total_bytes: int):
+        """
+        Contadores iniciales a partir del corpus existente (scan_raw_dir).
+        """
+        self.last_doc_id = last_doc_id
+        self.total_bytes = total_bytes
+        self._save_counters()
+        self.con.commit()
+        self.initialized = True
+
+    # ---------------- manifiesto ----------------
+
+    def reserve_page(self, url: str, doc_bytes: int, simhash: Optional[int] = None) -> int:
+        """
+        Asigna el siguiente doc_id a una página, suma sus bytes a la
+        cuota y lo confirma en disco antes de escribir los ficheros.
+        simhash es la huella de su texto (text_simhash), si la tiene.
+        """
+        self.last_doc_id += 1
+        self.total_bytes += doc_bytes
+        self.con.execute(
+            "INSERT OR REPLACE INTO pages(doc_id, url, bytes, crawled_at) VALUES (?, ?, ?, ?)",
+            (self.last_doc_id, url, doc_bytes, time.time()),
+        )
+        self._save_fingerprint(self.last_doc_id, simhash)
+        self._save_counters()
+        self.con.commit()
+        self.pages_since_checkpoint += 1
+        return self.last_doc_id
+
+    def update_page(self, doc_id: int, url: str, doc_bytes: int, old_bytes: int,
+                    simhash: Optional[int] = None) -> int:
+        """
+        Página ya guardada que ha cambiado: se reescribe con el mismo
+        doc_id y la cuota se ajusta a su nuevo tamaño.
+        """
+        self.total_bytes += doc_bytes - old_bytes
+        self.con.execute(
+            "INSERT OR REPLACE INTO pages(doc_id, url, bytes, crawled_at) VALUES (?, ?, ?, ?)",
+            (doc_id, url, doc_bytes, time.time()),
+        )
+        self._save_fingerprint(doc_id, simhash)
+        self._save_counters()
+        self.con.commit()
+        self.pages_since_checkpoint += 1
+        return doc_id
+
+    def find_page(self, url: str) -> Optional[Tuple[int, int]]:
+        """
+        (doc_id, bytes) de la última copia guardada de la URL, o None.
+        """
+        return self.con.execute(
+            "SELECT doc_id, bytes FROM pages WHERE url = ? ORDER BY doc_id DESC LIMIT 1", (url,)
+        ).fetchone()
+
+    # ---------------- casi duplicados ----------------
+
+    def _save_fingerprint(self, doc_id: int, simhash: Optional[int]):
+        if simhash is None:
+            return
+        self.con.execute(
+            "INSERT OR REPLACE INTO fingerprints(doc_id, simhash) VALUES (?, ?)",
+            (doc_id, to_signed(simhash)),
+        )
+        # la huella anterior de una página reescrita sigue en memoria
+        # hasta el próximo arranque (SimHashIndex no admite borrados)
+        if self.fingerprints is not None:
+            self.fingerprints.add(simhash, doc_id)
+
+    def find_near_duplicate(self, simhash: int) -> Optional[int]:
+        """
+        doc_id de una página guardada cuyo texto es casi igual (SimHash a
+        distancia <= SIMHASH_MAX_DISTANCE), o None.
+        """
+        if self.fingerprints is None:
+            self.fingerprints = SimHashIndex()
+            for doc_id, value in self.con.execute("SELECT doc_id, simhash FROM fingerprints ORDER BY doc_id"):
+                self.fingerprints.add(to_unsigned(value), doc_id)
+        return self.fingerprints.find(simhash)
+
+    def mark_near_duplicate(self, url: str, doc_id: int):
+        """
+        URL descartada por ser casi duplicada de doc_id; se confirma con
+        la siguiente escritura del estado.
+        """
+        self.con.execute(
+            "INSERT OR REPLACE INTO near_duplicates(url, doc_id) VALUES (?, ?)", (url, doc_id)
+        )
+
+    # ---------------- frontera y visitados ----------------
+
+    def mark_visited(self, url: str):
+        """
+        URL ya descargada (con éxito o no); se persiste en el siguiente
+        checkpoint.
+        """
+        self.new_visited.append(url)
+
+    def iter_visited(self) -> Iterator[str]:
+        for (url,) in self.con.execute("SELECT url FROM visited"):
+            yield url
+
+    def iter_frontier(self) -> Iterator[Tuple[str, int]]:
+        yield from self.con.execute("SELECT url, depth FROM frontier ORDER BY seq")
+
+    def reset_crawl(self):
+        """
+        Empieza un crawl nuevo: olvida frontera y visitados del anterior
+        (el manifiesto y los contadores se conservan).
+        """
+        self.con.execute("DELETE FROM frontier")
+        self.con.execute("DELETE FROM visited")
+        self.con.commit()
+        self.new_visited.clear()
+
+    def checkpoint_due(self) -> bool:
+        return (
+            self.pages_since_checkpoint >= CHECKPOINT_PAGES
+            or time.monotonic() - self.last_checkpoint >= CHECKPOINT_SECONDS
+        )
+
+    def checkpoint(self, frontier: Iterable[Tuple[str, int]]):
+        """
+        Vuelca la frontera completa (pendientes + peticiones en vuelo, que
+        se repetirán al reanudar) y los visitados nuevos, en una sola
+        transacción.
+        """
+        cur = self.con.cursor()
+        cur.execute("DELETE FROM frontier")
+        cur.executemany("INSERT INTO frontier(url, depth) VALUES (?, ?)", frontier)
+        cur.executemany("INSERT OR IGNORE INTO visited(url) VALUES (?)", ((u,) for u in self.new_visited))
+        self.con.commit()
+
+        self.new_visited.clear()
+        self.pages_since_checkpoint = 0
+        self.last_checkpoint = time.monotonic()
+
+    def stats(self) -> Dict[str, int]:
+        count = lambda table: self.con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        return {
+            "last_doc_id": self.last_doc_id,
+            "total_bytes": self.total_bytes,
+            "pages": count("pages"),
+            "frontier": count("frontier"),
+            "visited": count("visited") + len(self.new_visited),
+            "near_duplicates": count("near_duplicates"),
+        }
+
+    def close(self):
+        self.con.commit()
+        self.con.close()
+
+def read_near_duplicates(raw_dir: str) -> List[Tuple[str, str]]:
+    """
+    (url descartada, url de la página guardada) de todos los casi
+    duplicados que descartó el crawler, para que el indexador asocie la
+    URL descartada a su documento. Lista vacía si no hay crawl_state.db.
+    """
+    path = crawl_state_path(raw_dir)
+    if not os.path.exists(path):
+        return []
+    con = sqlite3.connect(path)
+    try:
+        return con.execute(
+            "SELECT n.url, p.url FROM near_duplicates n JOIN pages p ON p.doc_id = n.doc_id"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # crawl_state.db anterior a la tabla near_duplicates
+        return []
+    finally:
+        con.close()
@@ -1,70 +1,37 @@
 import os
 import time
 import requests
-import json
 import urllib.robotparser
-from urllib.parse import urlparse, urljoin, urlunparse, parse_qsl, urlencode
+from urllib.parse import urlparse, urljoin
 from bs4 import BeautifulSoup
-from typing import List, Tuple
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from collections import deque
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import threading
 
+from .crawl_state import CrawlState
+from .jobs import report_progress
+from .pageparse import parse_page
+from .rawstore import STORE_DIR_NAME, get_raw_store_writer, open_raw_store, read_bucket_document
+from .scheduler import HostScheduler
+from .simhash import text_simhash
+from .urlnorm import normalize_url
+from .urlseen import URLSeen
+
 
 MAX_HTML_SIZE = 5 * 1024 * 1024  # 5 MB
 BUCKET_SIZE = 1000
 MAX_TOTAL_BYTES = 12 * 1024 * 1024 * 1024  # 12 GB
 robots_cache = {}
 MAX_WORKERS = 5
+MAX_CRAWL_DELAY = 5  # segundos, tope al crawl-delay de robots.txt
+WIKIPEDIA_CRAWL_DELAY = 1
+DEFAULT_USER_AGENT = "PracticaRI-CrawlerBot/1.0 (+https://github.com/XDANIELAKA)"
+# Conexiones keep-alive por host (una por worker)
+SESSION_POOL_SIZE = MAX_WORKERS
 visited_lock = threading.Lock()
 quota_lock = threading.Lock()
 
 
-def normalize_url(url: str) -> str:
-    """
-    Normaliza una URL para evitar duplicados semánticos.
-    - Convierte esquema y host a minúsculas
-    - Elimina 'www.'
-    - Elimina fragmentos (#)
-    - Ordena parámetros query
-    - Elimina barra final innecesaria
-    """
-    try:
-        parsed = urlparse(url)
-
-        scheme = parsed.scheme.lower()
-        netloc = parsed.netloc.lower()
-
-        # Eliminar www. solo si está al inicio
-        if netloc.startswith("www."):
-            netloc = netloc[4:]
-
-        # Normalizar path
-        path = parsed.path or "/"
-        path = path.rstrip("/")
-        if not path:
-            path = "/"
-
-        # Ordenar parámetros query
-        query_params = parse_qsl(parsed.query, keep_blank_values=True)
-        query_params.sort()
-        query = urlencode(query_params)
-
-        normalized = urlunparse((
-            scheme,
-            netloc,
-            path,
-            "",      # params (obsoletos)
-            query,
-            ""       # fragment eliminado
-        ))
-
-        return normalized
-
-    except Exception:
-        # En caso de URL malformada, devolver la original
-        return url
-    
 def get_bucket_dir(doc_id: int, base_dir: str) -> str:
     """
     Devuelve el directorio correspondiente al rango de IDs del documento.
@@ -75,68 +42,231 @@ def get_bucket_dir(doc_id: int, base_dir: str) -> str:
     bucket_name = f"{start:06d}-{end:06d}"
     return os.path.join(base_dir, bucket_name)
 
+def robots_from_response(domain: str, status: int, text: str) -> urllib.robotparser.RobotFileParser:
+    """
+    Construye el RobotFileParser con el mismo criterio que
+    RobotFileParser.read(): 401/403 → todo prohibido, otros 4xx → todo
+    permitido, resto → se interpreta el contenido.
+    """
+    rp = urllib.robotparser.RobotFileParser()
+    rp.set_url(f"{domain}/robots.txt")
+    if status in (401, 403):
+        rp.disallow_all = True
+    elif 400 <= status < 500:
+        rp.allow_all = True
+    else:
+        rp.parse(text.splitlines())
+    return rp
+
+class HostSessions:
+    """
+    Una requests.Session por host con su pool de conexiones keep-alive
+    (SESSION_POOL_SIZE), compartida por los workers: el pool de urllib3
+    es seguro entre hilos. Así robots.txt y todas las páginas de un host
+    reutilizan las mismas conexiones TCP/TLS.
+    """
+
+    def __init__(self, pool_size: int = SESSION_POOL_SIZE):
+        self.pool_size = pool_size
+        self.sessions: Dict[str, requests.Session] = {}
+        self.lock = threading.Lock()
+
+    def get(self, netloc: str) -> requests.Session:
+        with self.lock:
+            session = self.sessions.get(netloc)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[netloc] = session
+            return session
+
+    def connection_stats(self) -> Tuple[int, int]:
+        """
+        (peticiones, conexiones abiertas) sumando los pools de urllib3.
+        """
+        num_requests = num_connections = 0
+        for session in self.sessions.values():
+            for adapter in {id(a): a for a in session.adapters.values()}.values():
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools[key]
+                    num_requests += pool.num_requests
+                    num_connections += pool.num_connections
+        return num_requests, num_connections
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+
+def new_crawl_stats() -> Dict[str, int]:
+    """
+    Contadores de un crawl (los devuelve POST /crawl):
+    - fetched / not_modified: respuestas 200 y 304
+    - bytes_downloaded: cuerpos descargados
+    - bytes_saved: tamaño de las copias guardadas que un 304 evitó bajar
+    - requests / connections: peticiones HTTP y conexiones abiertas;
+      la diferencia son peticiones que reutilizaron una conexión
+    - near_duplicates / near_duplicate_bytes: páginas descartadas por ser
+      casi duplicadas de otra ya guardada y bytes que no se guardaron
+    """
+    return {"fetched": 0, "not_modified": 0, "bytes_downloaded": 0, "bytes_saved": 0,
+            "requests": 0, "connections": 0, "connections_reused": 0,
+            "near_duplicates": 0, "near_duplicate_bytes": 0}
+
+def count_fetch(stats: Dict[str, int], info: dict, known: Optional[Tuple[int, int]]):
+    """
+    Suma a stats el resultado de una descarga (info de crawl_page).
+    """
+    if info.get("status") == 304:
+        stats["not_modified"] += 1
+        stats["bytes_saved"] += known[1] if known else 0
+    elif info.get("status") == 200:
+        stats["fetched"] += 1
+        stats["bytes_downloaded"] += info.get("bytes", 0)
+
+def print_crawl_stats(stats: Dict[str, int]):
+    stats["connections_reused"] = max(0, stats["requests"] - stats["connections"])
+    print(
+        f"[CRAWL] Resumen: {stats['fetched']} descargadas, {stats['not_modified']} sin cambios (304), "
+        f"{stats['bytes_downloaded']} bytes bajados, {stats['bytes_saved']} bytes ahorrados, "
+        f"{stats['requests']} peticiones en {stats['connections']} conexiones "
+        f"({stats['connections_reused']} reutilizadas), "
+        f"{stats['near_duplicates']} casi duplicadas descartadas ({stats['near_duplicate_bytes']} bytes)"
+    )
+
+def load_stored_page(raw_dir: str, doc_id: int) -> Optional[Tuple[dict, str]]:
+    """
+    (metadatos, HTML) de la copia guardada de un documento: del almacén
+    de segmentos o, si es anterior a él y no se ha migrado, de su bucket.
+    """
+    doc = open_raw_store(raw_dir).read(doc_id)
+    if doc is not None:
+        return doc
+    html_path = os.path.join(get_bucket_dir(doc_id, raw_dir), f"{doc_id:06d}.txt")
+    try:
+        return read_bucket_document(html_path)
+    except OSError:
+        return None
+
+def load_validators(raw_dir: str, doc_id: int) -> Optional[Dict[str, str]]:
+    """
+    ETag / Last-Modified guardados en los metadatos de un documento, o
+    None si no tiene ninguno.
+    """
+    doc = load_stored_page(raw_dir, doc_id)
+    if doc is None:
+        return None
+    validators = {k: doc[0][k] for k in ("etag", "last_modified") if doc[0].get(k)}
+    return validators or None
+
+def load_stored_links(raw_dir: str, doc_id: int, url: str) -> List[str]:
+    """
+    Enlaces salientes de la copia guardada: los que se guardaron en sus
+    metadatos al crawlearla o, si es anterior a eso, parseando su HTML.
+    """
+    doc = load_stored_page(raw_dir, doc_id)
+    if doc is None:
+        return []
+    if "links" in doc[0]:
+        return doc[0]["links"]
+    return parse_page(doc[1], url, text=False)["links"]
+
+def robots_policy(url: str, rp, user_agent: str) -> Tuple[bool, float]:
+    """
+    (permitida, crawl-delay) de una URL según el robots.txt ya cargado
+    de su dominio. El delay se limita a MAX_CRAWL_DELAY segundos.
+    """
+    # --- Comprobar si la URL está permitida por robots.txt ---
+    allowed = (
+        rp.can_fetch(user_agent, url) or
+        rp.can_fetch("*", url)
+    )
+
+    # --- Crawl-delay con fallback y límite ---
+    delay = rp.crawl_delay(user_agent)
+    if delay is None:
+        delay = rp.crawl_delay("*")
+
+    return allowed, min(float(delay or 0), MAX_CRAWL_DELAY)
+
 def crawl_page(
     url: str,
-    user_agent: str = "PracticaRI-CrawlerBot/1.0 (+https://github.com/XDANIELAKA)"
-) -> str:
+    user_agent: str = DEFAULT_USER_AGENT,
+    session: Optional[requests.Session] = None,
+    validators: Optional[Dict[str, str]] = None
+) -> Tuple[str, Optional[float], dict]:
     """
     Hace una petición HTTP a la URL dada y devuelve
-    el HTML completo de la página si está permitido
-    por robots.txt o vacío en caso de error.
+    (HTML completo, crawl-delay del host, info). El HTML queda vacío si
+    robots.txt no lo permite, hay un error o el servidor responde 304;
+    el delay es None si no se pudo leer robots.txt. info lleva "status",
+    "bytes" y los validadores "etag" / "last_modified" de la respuesta.
+
+    Con `session` (HostSessions) reutiliza las conexiones del host; con
+    `validators` (de una descarga anterior) hace un GET condicional.
+
+    No espera el crawl-delay: de eso se encarga HostScheduler, que
+    espacia las peticiones a cada host sin bloquear al worker.
     """
+    delay = None
+    info = {"status": None, "bytes": 0}
+    http = session or requests
     try:
         # --- Preparar el parser de robots.txt para ese dominio ---
         parsed = urlparse(url)
         domain = f"{parsed.scheme}://{parsed.netloc}"
+        headers = {"User-Agent": user_agent}
 
         # --- Excepción conocida para Wikipedia ---
         if parsed.netloc.endswith("wikipedia.org"):
             allowed = True
-            delay = 1
+            delay = WIKIPEDIA_CRAWL_DELAY
         else:
             if domain not in robots_cache:
-                rp = urllib.robotparser.RobotFileParser()
-                rp.set_url(f"{domain}/robots.txt")
-                rp.read()
+                res = http.get(f"{domain}/robots.txt", headers=headers, timeout=10)
+                rp = robots_from_response(domain, res.status_code, res.text)
                 robots_cache[domain] = rp
             else:
                 rp = robots_cache[domain]
 
-            # --- Comprobar si la URL está permitida por robots.txt ---
-            allowed = (
-                rp.can_fetch(user_agent, url) or
-                rp.can_fetch("*", url)
-            )
-
-            if not allowed:
-                print(f"[robots.txt] Acceso denegado para {url}")
-                return ""
-
-            # --- Crawl-delay con fallback y límite ---
-            delay = rp.crawl_delay(user_agent)
-            if delay is None:
-                delay = rp.crawl_delay("*")
-
-        if delay:
-            time.sleep(min(delay, 5))
-
-        # --- Realizar la petición HTTP ---
-        headers = {"User-Agent": user_agent}
-        res = requests.get(url, headers=headers, timeout=10)
+            allowed, delay = robots_policy(url, rp, user_agent)
+
+        if not allowed:
+            print(f"[robots.txt] Acceso denegado para {url}")
+            return "", delay, info
+
+        # --- Realizar la petición HTTP (condicional si ya la teníamos) ---
+        if validators:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+        res = http.get(url, headers=headers, timeout=10)
+        info["status"] = res.status_code
+        if res.status_code == 304:
+            return "", delay, info
         res.raise_for_status()
 
+        info["bytes"] = len(res.content)
+        info["etag"] = res.headers.get("ETag")
+        info["last_modified"] = res.headers.get("Last-Modified")
+
         # --- Devolver el HTML completo ---
-        return res.text
+        return res.text, delay, info
 
     except Exception as e:
         print(f"Crawl error en {url}:", e)
-        return ""
+        return "", delay, info
 
 
 def extract_metadata(html: str) -> dict:
     """
     Extrae título, h1 y descripción de un HTML dado.
     Esta versión es más robusta y maneja casos como páginas de tags o autores.
+    (Referencia de pageparse.parse_page, que es lo que usa el crawler.)
     """
     soup = BeautifulSoup(html, "html.parser")
 
@@ -218,6 +348,7 @@ def save_document(n: int, text: str, raw_dir: str) -> str:
 def extract_links(html: str, base_url: str) -> List[str]:
     """
     Extrae todas las URLs de <a href> y las normaliza
+    (referencia de pageparse.parse_page, que es lo que usa el crawler)
     """
     links = []
     soup = BeautifulSoup(html, "html.parser")
@@ -233,22 +364,17 @@ def extract_links(html: str, base_url: str) -> List[str]:
 
     return links
 
-def simple_crawl(
-    seed_urls: List[str],
-    raw_dir: str,
-    max_pages: int = 100,
-    max_depth: int = 2
-) -> List[str]:
+def scan_raw_dir(raw_dir: str) -> Tuple[int, int]:
     """
-    Crawlea las URLs dadas con una cola recursiva (BFS),
-    siguiendo enlaces internos dentro de cada dominio,
-    respeta robots.txt, guarda cada documento y sus metadatos,
-    y devuelve la lista de rutas de los archivos guardados.
+    Recorre raw_dir y devuelve (último número de documento guardado,
+    bytes totales ocupados), para continuar la numeración y controlar
+    la cuota MAX_TOTAL_BYTES.
     """
-
-    # --- 1) Calcular numeración continua según los .txt existentes ---
+    # --- 1) Calcular numeración continua según los .txt existentes y el almacén ---
     existing_txts = []
-    for root, _, files in os.walk(raw_dir):
+    for root, dirs, files in os.walk(raw_dir):
+        if STORE_DIR_NAME in dirs:
+            dirs.remove(STORE_DIR_NAME)
         for f in files:
             if f.lower().endswith(".txt") and f.split(".")[0].isdigit():
                 existing_txts.append(f)
@@ -262,6 +388,9 @@ def simple_crawl(
         start_index = nums[-1]
     else:
         start_index = 0
+    stored = open_raw_store(raw_dir).doc_ids()
+    if stored:
+        start_index = max(start_index, stored[-1])
 
     # --- Comprobar tamaño total actual en bytes ---
     current_total_bytes = 0
@@ -273,99 +402,278 @@ def simple_crawl(
             except OSError:
                 pass
 
-    # --- 2) BFS con concurrencia, profundidad y robots.txt ---
-    visited = set()
-    queue = deque((normalize_url(url), 0) for url in seed_urls)
-    saved_files: List[str] = []
+    return start_index, current_total_bytes
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {}
+def store_page(new_idx: int, url: str, html_text: str, raw_dir: str,
+               info: Optional[dict] = None, page: Optional[dict] = None) -> str:
+    """
+    Añade una página descargada al almacén de segmentos (rawstore): un
+    registro con el HTML y sus metadatos (título, h1, descripción, url,
+    enlaces salientes normalizados para que el indexador no tenga que
+    volver a sacarlos y, si el servidor los envió, etag / last_modified
+    para el GET condicional del próximo crawl). page es el resultado de
+    parse_page si ya se tiene. Devuelve la clave del documento.
+    """
+    if page is None:
+        page = parse_page(html_text, url, text=False)
+    metadata = {key: page[key] for key in ("title", "h1", "description")}
+    metadata["url"] = normalize_url(url)
+    metadata["links"] = page["links"]
+    for key in ("etag", "last_modified"):
+        if info and info.get(key):
+            metadata[key] = info[key]
+
+    return get_raw_store_writer(raw_dir).append(new_idx, metadata, html_text)
+
+def same_site_links(links: List[str], url: str) -> List[str]:
+    """
+    Enlaces (ya normalizados) que se quedan en el mismo dominio que url
+    (esquema + host).
+    """
+    parsed = urlparse(url)
+    base_domain = f"{parsed.scheme}://{parsed.netloc}"
 
-        while queue and len(saved_files) < max_pages:
+    result = []
+    for link in links:
+        normalized_link = normalize_url(link)
+        if normalized_link.startswith(base_domain):
+            result.append(normalized_link)
+    return result
 
-            # --- Enviar nuevas tareas al executor ---
-            while queue and len(futures) < MAX_WORKERS and len(saved_files) + len(futures) < max_pages:
-                url, depth = queue.popleft()
+def parse_fetched_page(html_text: str, url: str) -> dict:
+    """
+    parse_page de una página descargada: metadatos, enlaces y simhash
+    (huella del texto visible, text_simhash) para descartar casi
+    duplicados antes de guardarla. El texto no se guarda.
+    """
+    page = parse_page(html_text, url)
+    page["simhash"] = text_simhash(page.pop("text"))
+    return page
 
-                with visited_lock:
-                    if url in visited:
-                        continue
-                    visited.add(url)
+def fetch_and_parse(url: str, user_agent: str, session=None,
+                    validators: Optional[Dict[str, str]] = None) -> Tuple[str, Optional[float], dict, Optional[dict]]:
+    """
+    crawl_page y, si hay HTML que se vaya a guardar, parse_fetched_page en
+    el mismo worker, para que el bucle que reparte el trabajo no parsee.
+    Devuelve (html, delay, info, page).
+    """
+    html_text, delay, info = crawl_page(url, user_agent, session, validators)
+    page = None
+    if html_text and len(html_text) <= MAX_HTML_SIZE:
+        page = parse_fetched_page(html_text, url)
+    return html_text, delay, info, page
 
-                # Encolamos tarea sin imprimir todavía
-                future = executor.submit(crawl_page, url)
-                futures[future] = (url, depth)
+def open_crawl_state(raw_dir: str) -> CrawlState:
+    """
+    Abre raw_dir/crawl_state.db. Si es nuevo, inicializa numeración y
+    cuota recorriendo una única vez el corpus que ya hubiera.
+    """
+    state = CrawlState(raw_dir)
+    if not state.initialized:
+        state.init_counters(*scan_raw_dir(raw_dir))
+    return state
 
-            # --- Procesar tareas completadas ---
-            for future in as_completed(list(futures)):
-                url, depth = futures.pop(future)
+def start_frontier(state: CrawlState, frontier: HostScheduler,
+                   seed_urls: List[str], resume: bool) -> URLSeen:
+    """
+    Carga la frontera inicial y devuelve el conjunto de URLs vistas
+    (descargadas o ya en la frontera).
+    Con resume=True continúa el crawl guardado (frontera y visitados del
+    último checkpoint); si no, empieza uno nuevo desde las semillas.
+    """
+    seen = URLSeen()
+    if resume:
+        for url in state.iter_visited():
+            seen.add(url)
+        for url, depth in state.iter_frontier():
+            if seen.add(url):
+                frontier.push(url, depth)
+    else:
+        state.reset_crawl()
 
-                try:
-                    html_text = future.result()
-                except Exception as e:
-                    print(f"[ERROR] Descargando {url}: {e}")
-                    continue
+    for url in seed_urls:
+        url = normalize_url(url)
+        if seen.add(url):
+            frontier.push(url, 0)
+    return seen
 
-                # Si no hay HTML o está vacío → ignorar
-                if not html_text:
-                    continue
+def simple_crawl(
+    seed_urls: List[str],
+    raw_dir: str,
+    max_pages: int = 100,
+    max_depth: int = 2,
+    resume: bool = False,
+    stats: Optional[Dict[str, int]] = None
+) -> List[str]:
+    """
+    Crawlea las URLs dadas con una cola recursiva (BFS),
+    siguiendo enlaces internos dentro de cada dominio,
+    respeta robots.txt, guarda cada documento y sus metadatos,
+    y devuelve la lista de claves de los documentos guardados.
+    Con resume=True continúa el crawl anterior desde su último
+    checkpoint (crawl_state.db) además de las semillas dadas.
+    Las páginas ya guardadas se piden con GET condicional: si no han
+    cambiado (304) no se reescriben y se siguen sus enlaces desde la
+    copia local. Las páginas nuevas cuyo texto es casi igual al de otra
+    ya guardada (SimHash) no se guardan. Si se pasa `stats` se rellena
+    con new_crawl_stats().
+    """
+    if stats is None:
+        stats = {}
+    stats.update(new_crawl_stats())
 
-                # Si HTML demasiado grande → ignorar
-                if len(html_text) > MAX_HTML_SIZE:
-                    print(f"[SKIP] HTML demasiado grande: {url}")
-                    continue
+    # --- 1) Numeración continua y tamaño actual del corpus (crawl_state.db) ---
+    state = open_crawl_state(raw_dir)
 
-                # Tamaño en bytes del documento
-                doc_bytes = len(html_text.encode("utf-8"))
+    # --- 2) BFS con concurrencia, profundidad y robots.txt ---
+    # La frontera va por hosts: cada worker recibe una URL de un host
+    # que ya puede atenderla (crawl-delay respetado por HostScheduler)
+    frontier = HostScheduler(max_per_host=MAX_WORKERS)
+    seen = start_frontier(state, frontier, seed_urls, resume)
+    sessions = HostSessions()
+    saved_files: List[str] = []
 
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {}
+        try:
+            crawl_loop(state, frontier, seen, sessions, executor, futures, saved_files,
+                       stats, raw_dir, max_pages, max_depth)
+        finally:
+            # Checkpoint final: lo pendiente y lo que estaba en vuelo
+            state.checkpoint(list(frontier.items()) + [f[:2] for f in futures.values()])
+            state.close()
+
+    stats["requests"], stats["connections"] = sessions.connection_stats()
+    sessions.close()
+    print_crawl_stats(stats)
+    return saved_files
+
+def crawl_loop(state: CrawlState, frontier: HostScheduler, seen: URLSeen,
+               sessions: HostSessions, executor: ThreadPoolExecutor, futures: dict,
+               saved_files: List[str], stats: Dict[str, int],
+               raw_dir: str, max_pages: int, max_depth: int):
+    """
+    Bucle principal de simple_crawl: reparte URLs de los hosts
+    disponibles entre los workers, guarda las páginas descargadas y
+    hace checkpoints periódicos del estado.
+    """
+    # páginas tratadas: guardadas + sin cambios (304)
+    processed = lambda: len(saved_files) + stats["not_modified"]
+
+    while processed() < max_pages:
+
+        # --- Enviar nuevas tareas de los hosts disponibles ---
+        while len(futures) < MAX_WORKERS and processed() + len(futures) < max_pages:
+            item = frontier.pop()
+            if item is None:
+                break
+            url, depth = item
+
+            # Si ya la teníamos guardada → GET condicional con su ETag / Last-Modified
+            known = state.find_page(url)
+            validators = load_validators(raw_dir, known[0]) if known else None
+
+            # Encolamos tarea sin imprimir todavía
+            session = sessions.get(urlparse(url).netloc)
+            future = executor.submit(fetch_and_parse, url, DEFAULT_USER_AGENT, session, validators)
+            futures[future] = (url, depth, known)
+
+        wait_time = frontier.wait_time()
+        if not futures:
+            # Frontera vacía → fin; si no, todos los hosts esperan su delay
+            if wait_time is None:
+                break
+            time.sleep(wait_time)
+            continue
+        if len(futures) >= MAX_WORKERS or processed() + len(futures) >= max_pages:
+            # sin hueco: solo despierta al terminar una tarea
+            wait_time = None
+
+        # --- Procesar tareas completadas (o despertar cuando un host quede libre) ---
+        done, _ = wait(list(futures), timeout=wait_time, return_when=FIRST_COMPLETED)
+        for future in done:
+            url, depth, known = futures.pop(future)
+
+            try:
+                html_text, delay, info, page = future.result()
+            except Exception as e:
+                print(f"[ERROR] Descargando {url}: {e}")
+                html_text, delay, info, page = "", None, {}, None
+            frontier.release(url, delay)
+            state.mark_visited(url)
+            count_fetch(stats, info, known)
+
+            if info.get("status") == 304:
+                # Sin cambios: ni se reescribe ni se reindexa; los enlaces
+                # salen de la copia guardada
+                print(f"[CRAWL] Sin cambios (304): {url}")
+                if depth < max_depth:
+                    stored_links = load_stored_links(raw_dir, known[0], url)
+                    for normalized_link in same_site_links(stored_links, url):
+                        with visited_lock:
+                            if seen.add(normalized_link):
+                                frontier.push(normalized_link, depth + 1)
+                continue
+
+            # Si no hay HTML o está vacío → ignorar
+            if not html_text:
+                continue
+
+            # Si HTML demasiado grande → ignorar
+            if len(html_text) > MAX_HTML_SIZE:
+                print(f"[SKIP] HTML demasiado grande: {url}")
+                continue
+
+            # Tamaño en bytes del documento
+            doc_bytes = len(html_text.encode("utf-8"))
+            old_bytes = known[1] if known else 0
+
+            # --- Casi duplicada de una página ya guardada → no se guarda (sí se siguen sus enlaces) ---
+            canonical = None
+            if not known and page["simhash"] is not None:
+                canonical = state.find_near_duplicate(page["simhash"])
+
+            if canonical is not None:
+                state.mark_near_duplicate(url, canonical)
+                stats["near_duplicates"] += 1
+                stats["near_duplicate_bytes"] += doc_bytes
+                print(f"[SKIP] Casi duplicada de doc_id={canonical}: {url}")
+            else:
                 with quota_lock:
-                    if current_total_bytes + doc_bytes > MAX_TOTAL_BYTES:
+                    if state.total_bytes + doc_bytes - old_bytes > MAX_TOTAL_BYTES:
                         print("[STOP] Cuota máxima de 10GB alcanzada")
-                        return saved_files
-
-                # --- Guardar documento y metadatos ---
-                new_idx = start_index + len(saved_files) + 1
-
-                # Guardar metadatos
-                metadata = extract_metadata(html_text)
-                metadata["url"] = normalize_url(url)
-                bucket_dir = get_bucket_dir(new_idx, raw_dir)
-                os.makedirs(bucket_dir, exist_ok=True)
+                        return
 
-                meta_path = os.path.join(bucket_dir, f"{new_idx:06d}.meta.json")
-                with open(meta_path, "w", encoding="utf-8") as mf:
-                    json.dump(metadata, mf, ensure_ascii=False, indent=2)
+                    # --- Reservar número (manifiesto) y guardar documento y metadatos ---
+                    # (una página que ya teníamos y ha cambiado se reescribe en su sitio)
+                    if known:
+                        new_idx = state.update_page(known[0], url, doc_bytes, old_bytes, page["simhash"])
+                    else:
+                        new_idx = state.reserve_page(url, doc_bytes, page["simhash"])
+                doc_key = store_page(new_idx, url, html_text, raw_dir, info, page)
 
-                # Guardar HTML
-                html_path = os.path.join(bucket_dir, f"{new_idx:06d}.txt")
-                with open(html_path, "w", encoding="utf-8", errors="ignore") as f:
-                    f.write(html_text)
-
-                saved_files.append(html_path)
-
-                with quota_lock:
-                    current_total_bytes += doc_bytes
+                saved_files.append(doc_key)
 
                 # Nuevo print con número real de guardado
                 doc_number = len(saved_files)
                 print(f"[CRAWL] Guardado ({doc_number}/{max_pages}): {url}")
 
-                # --- Extraer enlaces y encolar si hay profundidad ---
-                if depth < max_depth:
-                    links = extract_links(html_text, url)
-                    parsed = urlparse(url)
-                    base_domain = f"{parsed.scheme}://{parsed.netloc}"
-
-                    for link in links:
-                        normalized_link = normalize_url(link)
-                        if normalized_link.startswith(base_domain):
-                            with visited_lock:
-                                if normalized_link not in visited:
-                                    queue.append((normalized_link, depth + 1))
+            # --- Extraer enlaces y encolar si hay profundidad ---
+            if depth < max_depth:
+                # deduplicación al encolar: cada URL entra una sola vez en la frontera
+                for normalized_link in same_site_links(page["links"], url):
+                    with visited_lock:
+                        if seen.add(normalized_link):
+                            frontier.push(normalized_link, depth + 1)
 
-            # Fin del for as_completed
+        # Fin del for de tareas completadas
 
-        # Fin del while queue
+        if state.checkpoint_due():
+            state.checkpoint(list(frontier.items()) + [f[:2] for f in futures.values()])
 
+        # Progreso del trabajo en segundo plano (y punto de cancelación)
+        report_progress("crawl", processed(), max_pages, fetched=stats["fetched"], saved=len(saved_files),
+                        not_modified=stats["not_modified"], near_duplicates=stats["near_duplicates"],
+                        frontier=len(frontier))
 
-    return saved_files
\ No newline at end of file
+    # Fin del while
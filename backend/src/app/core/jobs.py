@@ -0,0 +1,360 @@
+"""
+Trabajos en segundo plano para /crawl y /index.
+
+Un crawl o una indexación completa con PageRank pueden durar horas: el
+endpoint no los ejecuta dentro de la petición HTTP, sino que crea un
+trabajo y lanza un proceso aparte (python -m app.core.jobs) que lo
+ejecuta y devuelve enseguida su job_id.
+
+Todo el estado vive en data/jobs/jobs.db (SQLite), así que sobrevive a
+reinicios del servidor (uvicorn --reload) y lo comparten el servidor y
+los procesos de trabajo:
+- jobs: tipo, función a ejecutar y sus parámetros (JSON), estado
+  (queued → running → done / failed / cancelled), pid del proceso,
+  progreso, resultado o error
+- lock_key: recurso que el trabajo usa en exclusiva (la base de datos
+  del índice, el raw_dir del crawl). start_job rechaza (JobConflict) un
+  trabajo nuevo si otro activo tiene la misma clave
+
+El código que hace el trabajo informa del avance con report_progress
+(fase, hechos, total y contadores propios); fuera de un trabajo no hace
+nada. Es también donde se atiende la cancelación: cancel_job marca el
+trabajo y la siguiente llamada lanza JobCancelled, que sale por los
+finally del crawler y del indexador (checkpoint de la frontera, runs
+temporales). Si el trabajo no llega a una llamada en
+CANCEL_GRACE_SECONDS se le envía SIGTERM, que lanza la misma excepción.
+
+La salida (print) de cada trabajo va a data/jobs/<job_id>.log.
+"""
+import importlib
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from .paths import get_project_root
+
+JOBS_DIR = os.path.join(get_project_root(), "data", "jobs")
+JOBS_DB_PATH = os.path.join(JOBS_DIR, "jobs.db")
+
+ACTIVE_STATUSES = ("queued", "running")
+FINAL_STATUSES = ("done", "failed", "cancelled")
+
+# Cada cuánto (segundos) se escribe el progreso como mucho
+PROGRESS_INTERVAL = 0.5
+
+# Tiempo que tiene un trabajo para atender la cancelación antes del SIGTERM
+CANCEL_GRACE_SECONDS = 30
+
+class JobConflict(Exception):
+    """
+    Ya hay un trabajo activo sobre el mismo recurso (lock_key).
+    """
+
+class JobCancelled(Exception):
+    """
+    El trabajo se ha cancelado (cancel_job o SIGTERM).
+    """
+
+def get_jobs_connection(db_path: Optional[str] = None) -> sqlite3.Connection:
+    """
+    Conexión a jobs.db (la crea si no existe). isolation_level=None: cada
+    sentencia se confirma sola salvo dentro de un BEGIN explícito.
+    """
+    db_path = db_path or JOBS_DB_PATH
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    con = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    con.row_factory = sqlite3.Row
+    con.execute("PRAGMA journal_mode=WAL;")
+    con.execute("PRAGMA synchronous=NORMAL;")
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id           TEXT PRIMARY KEY,
+        kind             TEXT NOT NULL,
+        target           TEXT NOT NULL,
+        params           TEXT NOT NULL,
+        lock_key         TEXT,
+        status           TEXT NOT NULL,
+        pid              INTEGER,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        created_at       REAL NOT NULL,
+        started_at       REAL,
+        finished_at      REAL,
+        updated_at       REAL,
+        progress         TEXT,
+        result           TEXT,
+        error            TEXT,
+        log_path         TEXT
+    );
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_jobs_lock ON jobs(lock_key, status);")
+    return con
+
+def job_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    for key in ("params", "progress", "result"):
+        job[key] = json.loads(job[key]) if job[key] else None
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    return job
+
+def process_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _finish(con: sqlite3.Connection, job_id: str, status: str, error: Optional[str] = None):
+    con.execute(
+        "UPDATE jobs SET status = ?, error = COALESCE(?, error), finished_at = ?, updated_at = ? "
+        "WHERE job_id = ? AND status IN ('queued', 'running')",
+        (status, error, time.time(), time.time(), job_id),
+    )
+
+# ---------------- servidor: crear, consultar y cancelar ----------------
+
+# Procesos lanzados por este servidor (los vigila _watch)
+_processes: Dict[str, subprocess.Popen] = {}
+
+def start_job(kind: str, target: Callable[[dict], dict], params: dict,
+              lock_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Crea un trabajo que ejecutará target(params) en un proceso aparte y
+    devuelve su fila. target debe ser una función de módulo (se importa
+    por nombre en el proceso de trabajo) y params serializable a JSON.
+    Lanza JobConflict si hay otro trabajo activo con el mismo lock_key
+    (los de procesos que ya no existen se dan por fallidos).
+    """
+    job_id = uuid.uuid4().hex
+    log_path = os.path.join(JOBS_DIR, f"{job_id}.log")
+    con = get_jobs_connection()
+    try:
+        # comprobación e inserción en la misma transacción de escritura
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            if lock_key is not None:
+                for row in con.execute(
+                    "SELECT job_id, status, pid FROM jobs WHERE lock_key = ? AND status IN ('queued', 'running')",
+                    (lock_key,),
+                ).fetchall():
+                    if row["job_id"] in _processes or process_alive(row["pid"]):
+                        raise JobConflict(f"El trabajo {row['job_id']} ya usa {lock_key}")
+                    _finish(con, row["job_id"], "failed", "El proceso del trabajo ya no existe")
+            con.execute(
+                "INSERT INTO jobs(job_id, kind, target, params, lock_key, status, created_at, updated_at, log_path) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, f"{target.__module__}:{target.__qualname__}", json.dumps(params),
+                 lock_key, time.time(), time.time(), log_path),
+            )
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+
+        # el proceso hereda el sys.path del servidor para importar `app`
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+        with open(log_path, "ab") as log:
+            proc = subprocess.Popen(
+                [sys.executable, "-u", "-m", "app.core.jobs", JOBS_DB_PATH, job_id],
+                stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                cwd=get_project_root(), env=env,
+            )
+        con.execute("UPDATE jobs SET pid = ? WHERE job_id = ?", (proc.pid, job_id))
+        _processes[job_id] = proc
+        threading.Thread(target=_watch, args=(job_id, proc), daemon=True).start()
+
+        print(f"[JOBS] Trabajo {kind} {job_id} lanzado (pid={proc.pid})")
+        return get_job(job_id)
+    finally:
+        con.close()
+
+def _watch(job_id: str, proc: subprocess.Popen):
+    """
+    Espera al proceso de un trabajo: si se pidió cancelarlo y no responde
+    en CANCEL_GRACE_SECONDS le envía SIGTERM; si muere sin dejar estado
+    final (p. ej. SIGKILL) marca el trabajo como fallido.
+    """
+    con = get_jobs_connection()
+    try:
+        while True:
+            try:
+                proc.wait(timeout=1)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            row = con.execute(
+                "SELECT cancel_requested, updated_at FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row["cancel_requested"] and time.time() - row["updated_at"] > CANCEL_GRACE_SECONDS:
+                print(f"[JOBS] {job_id} no atiende la cancelación: SIGTERM")
+                proc.terminate()
+                proc.wait()
+                break
+
+        _finish(con, job_id, "failed", f"El proceso terminó sin resultado (código {proc.returncode})")
+    finally:
+        _processes.pop(job_id, None)
+        con.close()
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    con = get_jobs_connection()
+    try:
+        row = con.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    finally:
+        con.close()
+    return job_to_dict(row) if row else None
+
+def list_jobs(limit: int = 20) -> List[Dict[str, Any]]:
+    con = get_jobs_connection()
+    try:
+        rows = con.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+    finally:
+        con.close()
+    return [job_to_dict(row) for row in rows]
+
+def cancel_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Pide cancelar un trabajo activo; lo atiende su siguiente
+    report_progress. Un trabajo que no lanzó este servidor (p. ej. tras
+    un reinicio) no tiene quien le envíe el SIGTERM diferido: se le
+    envía ya.
+    """
+    con = get_jobs_connection()
+    try:
+        con.execute(
+            "UPDATE jobs SET cancel_requested = 1, updated_at = ? "
+            "WHERE job_id = ? AND status IN ('queued', 'running')",
+            (time.time(), job_id),
+        )
+        row = con.execute("SELECT status, pid FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    finally:
+        con.close()
+    if row is None:
+        return None
+    if row["status"] in ACTIVE_STATUSES and job_id not in _processes and process_alive(row["pid"]):
+        os.kill(row["pid"], signal.SIGTERM)
+    return get_job(job_id)
+
+# ---------------- proceso de trabajo ----------------
+
+class JobContext:
+    """
+    Trabajo que se ejecuta en este proceso: su conexión a jobs.db y el
+    estado de la fase actual para calcular ritmo y ETA.
+    """
+
+    def __init__(self, con: sqlite3.Connection, job_id: str):
+        self.con = con
+        self.job_id = job_id
+        self.phase: Optional[str] = None
+        self.phase_started = 0.0
+        self.last_report = 0.0
+
+_current: Optional[JobContext] = None
+
+def report_progress(phase: str, done: int, total: Optional[int] = None, **extra):
+    """
+    Progreso del trabajo en curso: fase, unidades hechas (páginas,
+    documentos…), total si se conoce y contadores adicionales. Calcula
+    el ritmo (unidades/s desde el inicio de la fase) y la ETA. Se
+    escribe como mucho cada PROGRESS_INTERVAL segundos, salvo al cambiar
+    de fase. Lanza JobCancelled si se ha pedido cancelar el trabajo.
+    Fuera de un trabajo (CLI, benchmarks) no hace nada.
+    """
+    job = _current
+    if job is None:
+        return
+
+    now = time.monotonic()
+    if phase != job.phase:
+        job.phase = phase
+        job.phase_started = now
+    elif now - job.last_report < PROGRESS_INTERVAL:
+        return
+    job.last_report = now
+
+    elapsed = now - job.phase_started
+    rate = done / elapsed if elapsed > 0 else 0.0
+    eta = (total - done) / rate if total is not None and rate > 0 else None
+    progress = {
+        "phase": phase,
+        "done": done,
+        "total": total,
+        "rate": round(rate, 2),
+        "elapsed_s": round(elapsed, 1),
+        "eta_s": round(eta, 1) if eta is not None else None,
+        **extra,
+    }
+    job.con.execute(
+        "UPDATE jobs SET progress = ?, updated_at = ? WHERE job_id = ?",
+        (json.dumps(progress), time.time(), job.job_id),
+    )
+    cancel = job.con.execute(
+        "SELECT cancel_requested FROM jobs WHERE job_id = ?", (job.job_id,)
+    ).fetchone()[0]
+    if cancel:
+        raise JobCancelled()
+
+def _raise_cancelled(signum, frame):
+    raise JobCancelled()
+
+def load_target(name: str) -> Callable[[dict], dict]:
+    module, _, func = name.partition(":")
+    return getattr(importlib.import_module(module), func)
+
+def run_job(db_path: str, job_id: str):
+    """
+    Ejecuta un trabajo en este proceso (python -m app.core.jobs) y deja
+    en jobs.db su estado final y su resultado o error.
+    """
+    global _current
+    con = get_jobs_connection(db_path)
+    row = con.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    if row is None or row["status"] != "queued":
+        con.close()
+        return
+
+    con.execute(
+        "UPDATE jobs SET status = 'running', pid = ?, started_at = ?, updated_at = ? WHERE job_id = ?",
+        (os.getpid(), time.time(), time.time(), job_id),
+    )
+    _current = JobContext(con, job_id)
+    signal.signal(signal.SIGTERM, _raise_cancelled)
+    print(f"[JOBS] Trabajo {row['kind']} {job_id}: {row['target']}")
+
+    try:
+        if row["cancel_requested"]:
+            raise JobCancelled()
+        result = load_target(row["target"])(json.loads(row["params"]))
+        con.execute(
+            "UPDATE jobs SET status = 'done', result = ?, finished_at = ?, updated_at = ? WHERE job_id = ?",
+            (json.dumps(result), time.time(), time.time(), job_id),
+        )
+        print(f"[JOBS] Trabajo {job_id} terminado")
+    except JobCancelled:
+        _finish(con, job_id, "cancelled")
+        print(f"[JOBS] Trabajo {job_id} cancelado")
+    except BaseException as e:
+        traceback.print_exc()
+        _finish(con, job_id, "failed", f"{type(e).__name__}: {e}")
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        _current = None
+        con.close()
+
+if __name__ == "__main__":
+    # el módulo importado como app.core.jobs (el que ven report_progress y
+    # los targets) no es este __main__
+    from app.core import jobs
+    jobs.run_job(sys.argv[1], sys.argv[2])
@@ -0,0 +1,215 @@
+"""
+Análisis de una página HTML en una sola pasada (lxml).
+
+Antes cada página se parseaba al menos cuatro veces con BeautifulSoup:
+extract_metadata y extract_links (html.parser) en el crawler, y
+extract_visible_text (lxml) y extract_links otra vez en el indexador.
+parse_page construye un único árbol con lxml.html y saca de él los
+metadatos, los enlaces salientes normalizados y, si se pide, el texto
+visible, con los mismos criterios que esas funciones (que se conservan
+como referencia; ver backend/benchmarks/bench_parse.py).
+
+Para que el texto coincida con get_text(" ", strip=True) de
+BeautifulSoup:
+- los elementos que se descartan se vacían (clear) en lugar de quitarse
+  del árbol, así el texto de antes y el de después siguen siendo
+  cadenas separadas (con un espacio entre ellas al unirlas)
+- el contenido de script, style, template, rt y rp no cuenta como texto
+  (BeautifulSoup los guarda como cadenas de otro tipo); itertext ya se
+  salta comentarios e instrucciones de proceso
+"""
+import re
+from typing import Iterable, List, Optional
+from urllib.parse import urljoin
+
+import lxml.html
+from lxml import etree
+
+from .urlnorm import normalize_url
+
+HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+
+# Etiquetas cuyo contenido no es texto para get_text de BeautifulSoup
+NON_TEXT_TAGS = ("script", "style", "template", "rt", "rp")
+
+# Texto visible genérico (extract_visible_text)
+NOISE_TAGS = ("script", "style", "noscript", "header", "footer", "nav", "aside", "form")
+CONTENT_TAGS = ("p", "div", "article", "main", "section", "h1", "h2", "h3", "h4", "li", "dd", "dt")
+
+# Texto visible de Wikipedia (extract_visible_text_wikipedia)
+WIKI_NOISE_TAGS = ("script", "style", "noscript", "table", "sup", "aside", "figure", "nav")
+WIKI_NON_CONTENT_CLASSES = ("mw-editsection", "reference", "reflist", "toc", "navbox", "infobox", "metadata")
+WIKI_MAX_BLOCKS = 400
+
+_spaces = re.compile(r"\s+")
+
+def parse_html(html_text: str) -> Optional[etree._Element]:
+    """
+    Árbol lxml del documento, o None si está vacío o no se puede parsear.
+    Se parsean los bytes UTF-8 (lxml no acepta str con declaración de
+    codificación).
+    """
+    try:
+        return lxml.html.document_fromstring(html_text.encode("utf-8", errors="ignore"), parser=HTML_PARSER)
+    except (etree.ParserError, ValueError):
+        return None
+
+def node_text(el: etree._Element) -> str:
+    """
+    Equivalente a get_text(" ", strip=True) de BeautifulSoup.
+    """
+    return " ".join(s.strip() for s in el.itertext() if s.strip())
+
+def empty_elements(elements: Iterable[etree._Element]):
+    """
+    Vacía los elementos (texto, hijos y atributos) conservando su tail.
+    """
+    for el in list(elements):
+        el.clear(keep_tail=True)
+
+def tree_links(root: etree._Element, base_url: str) -> List[str]:
+    """
+    URLs de <a href> resueltas contra base_url y normalizadas (extract_links).
+    """
+    links = []
+    for a in root.iter("a"):
+        href = a.get("href")
+        if href is None:
+            continue
+        try:
+            links.append(normalize_url(urljoin(base_url, href.strip())))
+        except ValueError:
+            continue
+    return links
+
+def tree_metadata(root: etree._Element) -> dict:
+    """
+    Título, h1 y descripción con los mismos fallbacks que extract_metadata.
+    """
+    title = ""
+    title_el = next(root.iter("title"), None)
+    if title_el is not None and title_el.text and len(title_el) == 0:
+        title = title_el.text.strip()
+
+    h1 = ""
+    first_h1 = next(root.iter("h1"), None)
+    if first_h1 is not None:
+        h1 = node_text(first_h1)
+
+    # meta description estándar, OpenGraph y Twitter, por ese orden
+    description = ""
+    metas = list(root.iter("meta"))
+    for attr, value in (("name", "description"), ("property", "og:description"), ("name", "twitter:description")):
+        tag = next((m for m in metas if m.get(attr) == value), None)
+        if tag is not None and tag.get("content"):
+            description = tag.get("content").strip()
+            break
+
+    # Fallback: primeros 2 párrafos
+    if not description:
+        description = " ".join(node_text(p) for _, p in zip(range(2), root.iter("p")))
+
+    if not title and h1:
+        title = h1
+
+    if not description and title:
+        description = f"Contenido sobre {title}"
+
+    return {
+        "title": title,
+        "h1": h1,
+        "description": description
+    }
+
+def tree_visible_text(root: etree._Element) -> str:
+    """
+    Texto de los bloques de contenido sin duplicados (extract_visible_text).
+    """
+    empty_elements(root.iter(*NOISE_TAGS))
+
+    seen = set()
+    text_blocks = []
+    for sel in CONTENT_TAGS:
+        for element in root.iter(sel):
+            block_text = _spaces.sub(" ", node_text(element))
+            if not block_text or block_text in seen:
+                continue
+            seen.add(block_text)
+            text_blocks.append(block_text)
+
+    if not text_blocks:
+        fallback_text = _spaces.sub(" ", node_text(root))
+        if fallback_text:
+            text_blocks.append(fallback_text)
+
+    return " ".join(text_blocks).strip()
+
+def tree_visible_text_wikipedia(root: etree._Element) -> str:
+    """
+    Texto del artículo dentro de div#mw-content-text
+    (extract_visible_text_wikipedia).
+    """
+    main_content = next((d for d in root.iter("div") if d.get("id") == "mw-content-text"), None)
+    if main_content is None:
+        return ""
+
+    empty_elements(el for el in main_content.iterdescendants(*WIKI_NOISE_TAGS))
+    for cls in WIKI_NON_CONTENT_CLASSES:
+        empty_elements(
+            el for el in main_content.iterdescendants()
+            if isinstance(el.tag, str) and cls in (el.get("class") or "").split()
+        )
+
+    text_parts = []
+    seen = set()
+
+    # encabezados de sección para contexto semántico
+    for el in main_content.iterdescendants("h2", "h3"):
+        if len(text_parts) >= WIKI_MAX_BLOCKS:
+            break
+        txt = _spaces.sub(" ", node_text(el))
+        if not txt or len(txt.split()) < 2 or len(txt.split()) > 15:
+            continue
+        if txt not in seen:
+            seen.add(txt)
+            text_parts.append(txt)
+
+    # párrafos y listas
+    for el in main_content.iterdescendants("p", "li", "dd", "dt"):
+        if len(text_parts) >= WIKI_MAX_BLOCKS:
+            break
+        txt = _spaces.sub(" ", node_text(el))
+        if not txt or len(txt.split()) < 3:
+            continue
+        if txt not in seen:
+            seen.add(txt)
+            text_parts.append(txt)
+
+    return " ".join(text_parts).strip()
+
+def parse_page(html_text: str, url: str, text: bool = True) -> dict:
+    """
+    Parsea la página una vez y devuelve title, h1, description, links
+    (enlaces salientes normalizados, resueltos contra url) y, con
+    text=True, text (texto visible; de Wikipedia si la URL lo es).
+    El crawler lo llama con text=False: solo necesita metadatos y enlaces.
+    """
+    root = parse_html(html_text)
+    if root is None:
+        page = {"title": "", "h1": "", "description": "", "links": []}
+        if text:
+            page["text"] = ""
+        return page
+
+    # los enlaces primero: <a> dentro de <template> también cuentan
+    links = tree_links(root, url)
+    empty_elements(root.iter(*NON_TEXT_TAGS))
+
+    page = tree_metadata(root)
+    page["links"] = links
+    if text:
+        if "wikipedia.org" in url:
+            page["text"] = tree_visible_text_wikipedia(root)
+        else:
+            page["text"] = tree_visible_text(root)
+    return page
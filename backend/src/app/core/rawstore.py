@@ -0,0 +1,382 @@
+"""
+Almacén de páginas crudas en segmentos (formato tipo WARC).
+
+Guardar cada página como NNNNNN.txt + NNNNNN.meta.json en buckets de
+BUCKET_SIZE supone millones de ficheros pequeños para un corpus de
+12 GB (inodos, os.walk lento y HTML sin comprimir). Aquí las páginas se
+añaden a ficheros de segmento de hasta SEGMENT_MAX_BYTES:
+
+raw_dir/store/
+- seg-NNNNN.wrc: registros concatenados, solo se añade al final. Cada
+  registro es la cabecera RECORD_HEADER (magic, doc_id, bytes del
+  payload, crc32 del payload) seguida del payload: zlib(JSON de los
+  metadatos + NUL + HTML en UTF-8). Metadatos y HTML viajan juntos.
+- seg-NNNNN.idx: índice de offsets, una entrada fija INDEX_DTYPE
+  (doc_id, offset, bytes del registro) por registro, escrita después de
+  él. Cargar todos los .idx da acceso aleatorio por doc_id.
+
+Re-escribir un doc_id (re-crawl con cambios) añade un registro nuevo; el
+índice se queda con el último y el anterior queda como espacio muerto.
+
+Fuera del almacén, cada documento se identifica con una clave
+"<raw_dir>/store#NNNNNNNNN" (store_key), que el indexador guarda como
+path en docs y manifest.
+"""
+import json
+import os
+import struct
+import sys
+import threading
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+STORE_DIR_NAME = "store"
+STORE_KEY_SEP = "#"
+
+# Tamaño máximo de un segmento antes de abrir el siguiente
+SEGMENT_MAX_BYTES = 256 * 1024 * 1024
+COMPRESS_LEVEL = 6
+
+RECORD_MAGIC = b"RIW1"
+RECORD_HEADER = struct.Struct("<4sQII")
+INDEX_DTYPE = np.dtype([("doc_id", "<u8"), ("offset", "<u8"), ("length", "<u4")])
+
+# Ubicación de un registro: (segmento, offset, bytes)
+Location = Tuple[int, int, int]
+
+def store_dir(raw_dir: str) -> str:
+    return os.path.join(raw_dir, STORE_DIR_NAME)
+
+def store_key(raw_dir: str, doc_id: int) -> str:
+    """
+    Clave estable de un documento del almacén (no cambia al re-escribirlo).
+    """
+    return f"{store_dir(raw_dir)}{STORE_KEY_SEP}{doc_id:09d}"
+
+def parse_store_key(key: str) -> Optional[Tuple[str, int]]:
+    """
+    (raw_dir, doc_id) de una clave del almacén, o None si key es la ruta
+    de un fichero normal.
+    """
+    base, sep, number = key.rpartition(STORE_KEY_SEP)
+    if not sep or not number.isdigit() or os.path.basename(base) != STORE_DIR_NAME:
+        return None
+    return os.path.dirname(base), int(number)
+
+def segment_paths(sdir: str, seg_no: int) -> Tuple[str, str]:
+    base = os.path.join(sdir, f"seg-{seg_no:05d}")
+    return base + ".wrc", base + ".idx"
+
+def list_segments(sdir: str) -> List[int]:
+    try:
+        names = os.listdir(sdir)
+    except OSError:
+        return []
+    return sorted(
+        int(name[4:-4]) for name in names
+        if name.startswith("seg-") and name.endswith(".wrc") and name[4:-4].isdigit()
+    )
+
+def encode_record(doc_id: int, meta: dict, html_text: str) -> bytes:
+    payload = zlib.compress(
+        json.dumps(meta, ensure_ascii=False).encode("utf-8") + b"\0"
+        + html_text.encode("utf-8", errors="ignore"),
+        COMPRESS_LEVEL,
+    )
+    return RECORD_HEADER.pack(RECORD_MAGIC, doc_id, len(payload), zlib.crc32(payload)) + payload
+
+def decode_record(record: bytes) -> Tuple[int, dict, str]:
+    """
+    (doc_id, metadatos, HTML) de un registro completo. ValueError si la
+    cabecera o el crc no cuadran.
+    """
+    magic, doc_id, size, crc = RECORD_HEADER.unpack_from(record)
+    payload = record[RECORD_HEADER.size:RECORD_HEADER.size + size]
+    if magic != RECORD_MAGIC or len(payload) != size or zlib.crc32(payload) != crc:
+        raise ValueError(f"registro corrupto (doc_id={doc_id})")
+    meta_bytes, _, html_bytes = zlib.decompress(payload).partition(b"\0")
+    return doc_id, json.loads(meta_bytes), html_bytes.decode("utf-8", errors="ignore")
+
+def read_index(idx_path: str, start: int = 0) -> np.ndarray:
+    """
+    Entradas completas del .idx a partir del byte start (una entrada a
+    medio escribir por una caída se ignora).
+    """
+    try:
+        size = os.path.getsize(idx_path)
+    except OSError:
+        return np.empty(0, dtype=INDEX_DTYPE)
+    count = (size - start) // INDEX_DTYPE.itemsize
+    if count <= 0:
+        return np.empty(0, dtype=INDEX_DTYPE)
+    return np.fromfile(idx_path, dtype=INDEX_DTYPE, count=count, offset=start)
+
+class RawStore:
+    """
+    Lectura del almacén con acceso aleatorio por doc_id. Los .idx se
+    cargan al abrirlo y refresh() lee solo las entradas añadidas desde
+    entonces, así un lector abierto ve lo que va escribiendo el crawler.
+    Seguro entre hilos (os.pread sobre descriptores compartidos).
+    """
+
+    def __init__(self, raw_dir: str):
+        self.dir = store_dir(raw_dir)
+        self.locations: Dict[int, Location] = {}
+        self._idx_read: Dict[int, int] = {}
+        self._fds: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        with self._lock:
+            for seg_no in list_segments(self.dir):
+                _, idx_path = segment_paths(self.dir, seg_no)
+                start = self._idx_read.get(seg_no, 0)
+                entries = read_index(idx_path, start)
+                for doc_id, offset, length in entries.tolist():
+                    self.locations[doc_id] = (seg_no, offset, length)
+                self._idx_read[seg_no] = start + len(entries) * INDEX_DTYPE.itemsize
+
+    def note(self, doc_id: int, location: Location):
+        """
+        Registro recién añadido por un RawStoreWriter de este proceso.
+        """
+        self.locations[doc_id] = location
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def __contains__(self, doc_id: int) -> bool:
+        return doc_id in self.locations
+
+    def doc_ids(self) -> List[int]:
+        return sorted(self.locations)
+
+    def location(self, doc_id: int) -> Optional[Location]:
+        loc = self.locations.get(doc_id)
+        if loc is None:
+            self.refresh()
+            loc = self.locations.get(doc_id)
+        return loc
+
+    def signature(self, doc_id: int) -> Optional[Tuple[int, int]]:
+        """
+        (bytes del registro, segmento y offset en un entero): cambia
+        cuando el documento se re-escribe. Hace el papel de
+        (tamaño, mtime) de un fichero en el manifest del indexador.
+        """
+        loc = self.location(doc_id)
+        if loc is None:
+            return None
+        seg_no, offset, length = loc
+        return length, (seg_no << 40) | offset
+
+    def _fd(self, seg_no: int) -> int:
+        fd = self._fds.get(seg_no)
+        if fd is None:
+            with self._lock:
+                fd = self._fds.get(seg_no)
+                if fd is None:
+                    fd = os.open(segment_paths(self.dir, seg_no)[0], os.O_RDONLY)
+                    self._fds[seg_no] = fd
+        return fd
+
+    def read_at(self, location: Location) -> Tuple[int, dict, str]:
+        seg_no, offset, length = location
+        return decode_record(os.pread(self._fd(seg_no), length, offset))
+
+    def read(self, doc_id: int) -> Optional[Tuple[dict, str]]:
+        """
+        (metadatos, HTML) de la última versión del documento, o None.
+        """
+        loc = self.location(doc_id)
+        if loc is None:
+            return None
+        try:
+            _, meta, html_text = self.read_at(loc)
+        except (OSError, ValueError, zlib.error) as e:
+            print(f"[STORE] Error leyendo doc_id={doc_id}: {e}")
+            return None
+        return meta, html_text
+
+    def iter_documents(self) -> Iterator[Tuple[int, dict, str]]:
+        """
+        (doc_id, metadatos, HTML) de todos los documentos en orden de
+        doc_id. Como el crawler añade en ese orden, la lectura es casi
+        secuencial.
+        """
+        for doc_id in self.doc_ids():
+            _, meta, html_text = self.read_at(self.locations[doc_id])
+            yield doc_id, meta, html_text
+
+    def close(self):
+        with self._lock:
+            for fd in self._fds.values():
+                os.close(fd)
+            self._fds.clear()
+
+class RawStoreWriter:
+    """
+    Escritura del almacén: añade registros al último segmento y abre
+    otro al pasar de segment_max_bytes. Un único escritor por raw_dir
+    (el proceso del crawler); dentro del proceso es seguro entre hilos.
+    """
+
+    def __init__(self, raw_dir: str, segment_max_bytes: int = SEGMENT_MAX_BYTES):
+        self.raw_dir = raw_dir
+        self.dir = store_dir(raw_dir)
+        self.segment_max_bytes = segment_max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.dir, exist_ok=True)
+        segments = list_segments(self.dir)
+        self._open(segments[-1] if segments else 1)
+
+    def _open(self, seg_no: int):
+        """
+        Abre el segmento para añadir. Si una caída dejó un registro sin
+        su entrada en el .idx (o una entrada a medias), se descarta.
+        """
+        data_path, idx_path = segment_paths(self.dir, seg_no)
+        entries = read_index(idx_path)
+        end = int(entries["offset"][-1]) + int(entries["length"][-1]) if len(entries) else 0
+        for path, size in ((data_path, end), (idx_path, len(entries) * INDEX_DTYPE.itemsize)):
+            with open(path, "ab") as f:
+                f.truncate(size)
+
+        self.seg_no = seg_no
+        self.offset = end
+        self._data = open(data_path, "ab")
+        self._idx = open(idx_path, "ab")
+
+    def append(self, doc_id: int, meta: dict, html_text: str) -> str:
+        """
+        Añade la página y devuelve su clave (store_key).
+        """
+        record = encode_record(doc_id, meta, html_text)
+        with self._lock:
+            if self.offset and self.offset + len(record) > self.segment_max_bytes:
+                self._close_files()
+                self._open(self.seg_no + 1)
+
+            location = (self.seg_no, self.offset, len(record))
+            self._data.write(record)
+            self._data.flush()
+            self._idx.write(np.array([(doc_id, self.offset, len(record))], dtype=INDEX_DTYPE).tobytes())
+            self._idx.flush()
+            self.offset += len(record)
+
+        open_raw_store(self.raw_dir).note(doc_id, location)
+        return store_key(self.raw_dir, doc_id)
+
+    def _close_files(self):
+        self._data.close()
+        self._idx.close()
+
+    def close(self):
+        with self._lock:
+            self._close_files()
+
+_readers: Dict[str, RawStore] = {}
+_writers: Dict[str, RawStoreWriter] = {}
+_open_lock = threading.Lock()
+
+def open_raw_store(raw_dir: str) -> RawStore:
+    """
+    Lector compartido del almacén de raw_dir (uno por proceso).
+    """
+    key = os.path.abspath(raw_dir)
+    with _open_lock:
+        store = _readers.get(key)
+        if store is None:
+            store = _readers[key] = RawStore(raw_dir)
+    return store
+
+def get_raw_store_writer(raw_dir: str) -> RawStoreWriter:
+    """
+    Escritor compartido del almacén de raw_dir (uno por proceso).
+    """
+    key = os.path.abspath(raw_dir)
+    with _open_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = RawStoreWriter(raw_dir)
+    return writer
+
+# ---------------- migración desde los buckets ----------------
+
+def list_bucket_documents(raw_dir: str) -> List[Tuple[int, str]]:
+    """
+    (número, ruta del .txt) de los documentos NNNNNN.txt de los buckets,
+    en orden de número.
+    """
+    found = []
+    for root, dirs, files in os.walk(raw_dir):
+        if os.path.abspath(root) == os.path.abspath(raw_dir) and STORE_DIR_NAME in dirs:
+            dirs.remove(STORE_DIR_NAME)
+        for f in files:
+            stem = f[:-4]
+            if f.endswith(".txt") and stem.isdigit():
+                found.append((int(stem), os.path.join(root, f)))
+    return sorted(found)
+
+def read_bucket_document(txt_path: str) -> Tuple[dict, str]:
+    """
+    (metadatos, HTML) de un documento en formato de buckets, leído con
+    el mismo criterio que el indexador.
+    """
+    with open(txt_path, "r", encoding="utf-8", errors="ignore") as f:
+        html_text = f.read()
+    meta = {}
+    try:
+        with open(txt_path[:-4] + ".meta.json", "r", encoding="utf-8") as mf:
+            meta = json.load(mf)
+    except (OSError, ValueError):
+        pass
+    return meta, html_text
+
+def migrate_buckets(raw_dir: str, delete: bool = True) -> Dict[str, str]:
+    """
+    Pasa los documentos de los buckets (NNNNNN.txt + .meta.json) al
+    almacén de segmentos con el mismo doc_id. Con delete=True borra los
+    ficheros migrados y los buckets que queden vacíos. Se puede repetir:
+    los doc_id que ya están en el almacén no se vuelven a añadir.
+    Devuelve {ruta .txt: clave en el almacén}.
+    """
+    writer = get_raw_store_writer(raw_dir)
+    store = open_raw_store(raw_dir)
+    migrated: Dict[str, str] = {}
+
+    for doc_id, txt_path in list_bucket_documents(raw_dir):
+        if doc_id in store:
+            key = store_key(raw_dir, doc_id)
+        else:
+            meta, html_text = read_bucket_document(txt_path)
+            key = writer.append(doc_id, meta, html_text)
+        migrated[txt_path] = key
+
+        if delete:
+            for path in (txt_path, txt_path[:-4] + ".meta.json"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            try:
+                os.rmdir(os.path.dirname(txt_path))  # solo si el bucket quedó vacío
+            except OSError:
+                pass
+
+    return migrated
+
+if __name__ == "__main__":
+    # python -m app.core.rawstore get <raw_dir> <doc_id>   (depuración)
+    if len(sys.argv) == 4 and sys.argv[1] == "get":
+        doc = open_raw_store(sys.argv[2]).read(int(sys.argv[3]))
+        if doc is None:
+            sys.exit(f"doc_id {sys.argv[3]} no está en el almacén")
+        print(json.dumps(doc[0], ensure_ascii=False, indent=2))
+        print(doc[1])
+    else:
+        store = open_raw_store(sys.argv[1] if len(sys.argv) > 1 else ".")
+        print(f"{len(store)} documentos en {len(list_segments(store.dir))} segmentos ({store.dir})")
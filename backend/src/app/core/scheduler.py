@@ -0,0 +1,135 @@
+"""
+Planificador de cortesía por host para el crawler.
+
+En lugar de que cada hilo duerma el crawl-delay antes de su petición
+(bloqueando un worker y sin impedir que varios hilos golpeen el mismo
+host a la vez), la frontera se reparte en una cola por host y un heap
+con el instante en que cada host puede recibir la siguiente petición.
+Los workers solo reciben URLs de hosts ya disponibles, así que mientras
+la frontera abarque varios hosts ninguno se queda esperando.
+
+Reglas por host:
+- crawl-delay desconocido (aún no se ha leído robots.txt): una sola
+  petición en vuelo, que es la que descarga y cachea robots.txt
+- con crawl-delay: una petición en vuelo y `delay` segundos entre el
+  inicio de una petición y el de la siguiente
+- sin crawl-delay: hasta `max_per_host` peticiones simultáneas
+
+Este objeto no es seguro entre hilos: lo usa solo el bucle que reparte
+el trabajo (el hilo principal de simple_crawl o el bucle de eventos de
+async_crawl).
+"""
+import heapq
+import time
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+def url_host(url: str) -> str:
+    return urlparse(url).netloc
+
+class HostScheduler:
+    """
+    Frontera de crawling agrupada por host con "próxima petición
+    permitida" en un min-heap.
+    """
+
+    def __init__(self, max_per_host: int):
+        self.max_per_host = max_per_host
+        self.queues: Dict[str, Deque[Tuple[str, int]]] = {}
+        self.delays: Dict[str, float] = {}
+        self.next_allowed: Dict[str, float] = {}
+        self.in_flight: Dict[str, int] = {}
+        self.heap: List[Tuple[float, str]] = []
+        self.in_heap: Set[str] = set()
+        self.pending = 0
+
+    def __len__(self) -> int:
+        return self.pending
+
+    def host_limit(self, host: str) -> int:
+        delay = self.delays.get(host)
+        if delay is None or delay > 0:
+            return 1
+        return self.max_per_host
+
+    def _schedule(self, host: str):
+        # el host entra en el heap si tiene URLs pendientes y hueco libre
+        if (
+            host not in self.in_heap
+            and self.queues.get(host)
+            and self.in_flight.get(host, 0) < self.host_limit(host)
+        ):
+            heapq.heappush(self.heap, (self.next_allowed.get(host, 0.0), host))
+            self.in_heap.add(host)
+
+    def push(self, url: str, depth: int):
+        host = url_host(url)
+        self.queues.setdefault(host, deque()).append((url, depth))
+        self.pending += 1
+        self._schedule(host)
+
+    def pop(self, now: Optional[float] = None) -> Optional[Tuple[str, int]]:
+        """
+        Siguiente (url, depth) de algún host disponible ahora, o None si
+        todos los hosts con frontera están ocupados o esperando su delay.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        while self.heap and self.heap[0][0] <= now:
+            _, host = heapq.heappop(self.heap)
+            self.in_heap.discard(host)
+
+            queue = self.queues.get(host)
+            if not queue or self.in_flight.get(host, 0) >= self.host_limit(host):
+                continue
+
+            url, depth = queue.popleft()
+            self.pending -= 1
+            self.in_flight[host] = self.in_flight.get(host, 0) + 1
+            self.next_allowed[host] = now + self.delays.get(host, 0.0)
+            if not queue:
+                del self.queues[host]
+
+            self._schedule(host)
+            return url, depth
+
+        return None
+
+    def release(self, url: str, delay: Optional[float] = None):
+        """
+        Marca como terminada una petición despachada con pop(). `delay` es
+        el crawl-delay del host según robots.txt; se registra la primera
+        vez y a partir de ahí se aplica a todas sus peticiones.
+        """
+        host = url_host(url)
+        self.in_flight[host] -= 1
+        if not self.in_flight[host]:
+            del self.in_flight[host]
+
+        if host not in self.delays and delay is not None:
+            # la primera petición del host también descargó robots.txt y
+            # no se sabe cuándo salió la de la página: se cuenta desde ahora
+            self.delays[host] = float(delay)
+            self.next_allowed[host] = time.monotonic() + self.delays[host]
+
+        self._schedule(host)
+
+    def items(self) -> Iterator[Tuple[str, int]]:
+        """
+        Todas las (url, depth) pendientes, para volcar la frontera.
+        """
+        for queue in self.queues.values():
+            yield from queue
+
+    def wait_time(self, now: Optional[float] = None) -> Optional[float]:
+        """
+        Segundos hasta que algún host con frontera vuelva a estar
+        disponible (0 si ya lo está), o None si no hay ninguno en espera.
+        """
+        if not self.heap:
+            return None
+        if now is None:
+            now = time.monotonic()
+        return max(0.0, self.heap[0][0] - now)
@@ -0,0 +1,148 @@
+"""
+Huellas SimHash del texto visible para detectar casi duplicados.
+
+La misma página llega a menudo con URLs que normalize_url no unifica:
+redirecciones, vista para imprimir, host móvil, variantes de query
+string. Su texto visible es igual o casi igual, así que su SimHash de
+64 bits también: se quedan a pocos bits de distancia de Hamming.
+
+- text_simhash: huella de 64 bits de los shingles (3 palabras seguidas)
+  del texto normalizado; None si el texto es demasiado corto para que
+  la huella sea fiable
+- SimHashIndex: índice en memoria de huellas con LSH por bandas. La
+  huella se parte en SIMHASH_MAX_DISTANCE + 1 bandas (de 9 o 10 bits);
+  si dos huellas están a distancia <= SIMHASH_MAX_DISTANCE, al menos una
+  banda coincide (palomar), así que basta con comparar los candidatos
+  que comparten alguna banda
+
+La usan el crawler (antes de guardar una página) y el indexador (antes
+de indexar un documento); los dos calculan la huella igual, sobre el
+texto visible de parse_page.
+"""
+import hashlib
+import re
+from array import array
+from typing import Dict, List, Optional
+
+import numpy as np
+
+SIMHASH_BITS = 64
+SHINGLE_WORDS = 3
+
+# Distancia de Hamming máxima entre casi duplicados (bits de 64)
+SIMHASH_MAX_DISTANCE = 6
+SIMHASH_BANDS = SIMHASH_MAX_DISTANCE + 1
+
+# (desplazamiento, máscara) de cada banda: 64 bits repartidos en SIMHASH_BANDS
+_band_widths = [SIMHASH_BITS // SIMHASH_BANDS + (i < SIMHASH_BITS % SIMHASH_BANDS) for i in range(SIMHASH_BANDS)]
+BANDS = [(sum(_band_widths[:i]), (1 << w) - 1) for i, w in enumerate(_band_widths)]
+
+# Por debajo de estas palabras no se calcula huella (páginas casi vacías)
+SIMHASH_MIN_WORDS = 20
+
+_words = re.compile(r"\w+")
+
+# Multiplicadores impares para combinar y mezclar hashes de 64 bits
+_K1 = np.uint64(0x9E3779B97F4A7C15)
+_K2 = np.uint64(0xBF58476D1CE4E5B9)
+_K3 = np.uint64(0x94D049BB133111EB)
+
+def word_hash(word: str) -> int:
+    return int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+
+def shingle_hashes(words: List[str]) -> np.ndarray:
+    """
+    Hash de 64 bits de cada shingle de SHINGLE_WORDS palabras: combina los
+    hashes de sus palabras (blake2b, uno por palabra distinta) y los
+    mezcla con el finalizador de splitmix64. Es determinista entre
+    procesos (las huellas se guardan en disco).
+    """
+    cache: Dict[str, int] = {}
+    hashes = np.fromiter(
+        (cache[w] if w in cache else cache.setdefault(w, word_hash(w)) for w in words),
+        dtype=np.uint64, count=len(words),
+    )
+    with np.errstate(over="ignore"):
+        h = hashes[:len(words) - SHINGLE_WORDS + 1].copy()
+        for i in range(1, SHINGLE_WORDS):
+            h = h * _K1 + hashes[i:len(words) - SHINGLE_WORDS + 1 + i]
+        h ^= h >> np.uint64(30)
+        h *= _K2
+        h ^= h >> np.uint64(27)
+        h *= _K3
+        h ^= h >> np.uint64(31)
+    return h
+
+def text_simhash(text: str) -> Optional[int]:
+    """
+    SimHash de 64 bits del texto (entero sin signo), o None si tiene menos
+    de SIMHASH_MIN_WORDS palabras. Cada bit es el voto mayoritario de ese
+    bit entre los hashes de todos los shingles.
+    """
+    words = _words.findall(text.lower())
+    if len(words) < max(SIMHASH_MIN_WORDS, SHINGLE_WORDS):
+        return None
+
+    h = shingle_hashes(words).astype("<u8")
+    bits = np.unpackbits(h.view(np.uint8), bitorder="little").reshape(-1, SIMHASH_BITS)
+    majority = bits.sum(axis=0, dtype=np.int64) * 2 > len(h)
+    return int(np.packbits(majority, bitorder="little").view("<u8")[0])
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def to_signed(fp: int) -> int:
+    """
+    Huella como entero con signo de 64 bits (INTEGER de SQLite).
+    """
+    return fp - (1 << 64) if fp >= 1 << 63 else fp
+
+def to_unsigned(value: int) -> int:
+    return value & ((1 << 64) - 1)
+
+class SimHashIndex:
+    """
+    Huellas con su doc_id y, por cada banda, un diccionario valor de la
+    banda → posiciones (array de enteros de 4 bytes). Unos 44 bytes por
+    huella; no admite borrados (quien lo usa lo reconstruye).
+    """
+
+    def __init__(self, max_distance: int = SIMHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.fingerprints = array("Q")
+        self.doc_ids = array("q")
+        self.bands: List[Dict[int, array]] = [{} for _ in BANDS]
+
+    def __len__(self) -> int:
+        return len(self.fingerprints)
+
+    def add(self, fp: int, doc_id: int):
+        pos = len(self.fingerprints)
+        self.fingerprints.append(fp)
+        self.doc_ids.append(doc_id)
+        for (shift, mask), buckets in zip(BANDS, self.bands):
+            key = (fp >> shift) & mask
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = bucket = array("I")
+            bucket.append(pos)
+
+    def find(self, fp: int) -> Optional[int]:
+        """
+        doc_id de la primera huella añadida a distancia <= max_distance
+        de fp, o None. Los candidatos de cada banda se comparan de una vez
+        con NumPy.
+        """
+        best = None
+        fingerprints = np.frombuffer(self.fingerprints, dtype=np.uint64)
+        for (shift, mask), buckets in zip(BANDS, self.bands):
+            bucket = buckets.get((fp >> shift) & mask)
+            if bucket is None:
+                continue
+            candidates = np.frombuffer(bucket, dtype=np.uint32)
+            distances = np.bitwise_count(fingerprints[candidates] ^ np.uint64(fp))
+            hits = np.flatnonzero(distances <= self.max_distance)
+            # posiciones en orden de inserción: la primera que encaja es la más antigua
+            if hits.size and (best is None or candidates[hits[0]] < best):
+                best = int(candidates[hits[0]])
+        return None if best is None else self.doc_ids[best]
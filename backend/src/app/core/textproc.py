@@ -1,10 +1,53 @@
+"""
+Análisis de texto: normalización, tokenización y stopwords.
+
+Todo el texto que se indexa o se consulta pasa por un analizador:
+- NltkAnalyzer: el de siempre (tres expresiones regulares de
+  normalize_text y después word_tokenize de NLTK, que divide en frases
+  con Punkt y aplica las reglas de Treebank). Se conserva como
+  referencia
+- FastAnalyzer: mismos tokens en una sola pasada. Tras normalize_text
+  solo quedan letras [a-záéíóúüñ], dígitos y espacios sueltos, así que
+  Punkt no parte nada y de las reglas de Treebank solo actúan las
+  contracciones inglesas sin apóstrofo (cannot → can not, ...): basta
+  con buscar las secuencias de caracteres válidos y expandir esas
+  pocas palabras
+
+get_analyzer() devuelve el analizador activo (DEFAULT_ANALYZER, o el
+elegido con set_analyzer); tokenize_text y remove_stopwords lo usan por
+debajo, y analyze_batch analiza una lista de documentos.
+"""
 import re
+from typing import Dict, List, Optional, Tuple
+
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 
 # Inicializamos stopwords para español
 STOPWORDS = set(stopwords.words("spanish"))
 
+DEFAULT_ANALYZER = "fast"
+
+_url = re.compile(r"http\S+")
+_invalid = re.compile(r"[^a-záéíóúüñ0-9\s]")
+_spaces = re.compile(r"\s+")
+_token = re.compile(r"[a-záéíóúüñ0-9]+")
+# Solo los tokens que pueden pasar el filtro (3 caracteres o más): como
+# las secuencias son maximales, coincide con filtrar después por longitud
+_long_token = re.compile(r"[a-záéíóúüñ0-9]{3,}")
+
+# Contracciones de Treebank (MacIntyre) que word_tokenize separa aunque
+# el texto no tenga apóstrofos; las demás llevan ' y no sobreviven a la
+# normalización
+CONTRACTIONS: Dict[str, Tuple[str, str]] = {
+    "cannot": ("can", "not"),
+    "gimme": ("gim", "me"),
+    "gonna": ("gon", "na"),
+    "gotta": ("got", "ta"),
+    "lemme": ("lem", "me"),
+    "wanna": ("wan", "na"),
+}
+
 def normalize_text(text: str) -> str:
     """
     Normaliza un texto:
@@ -14,20 +57,101 @@ def normalize_text(text: str) -> str:
     - limpia espacios
     """
     text = text.lower()
-    text = re.sub(r"http\S+", " ", text)
-    text = re.sub(r"[^a-záéíóúüñ0-9\s]", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
+    text = _url.sub(" ", text)
+    text = _invalid.sub(" ", text)
+    text = _spaces.sub(" ", text).strip()
     return text
 
+def expand_contractions(tokens: List[str]) -> List[str]:
+    if CONTRACTIONS.keys().isdisjoint(tokens):
+        return tokens
+    expanded = []
+    for token in tokens:
+        if token in CONTRACTIONS:
+            expanded.extend(CONTRACTIONS[token])
+        else:
+            expanded.append(token)
+    return expanded
+
+class NltkAnalyzer:
+    """
+    Analizador de referencia: normalize_text + word_tokenize (español)
+    + filtro de stopwords y tokens de menos de 3 caracteres.
+    """
+    name = "nltk"
+
+    def tokenize(self, normalized: str) -> List[str]:
+        """
+        Tokens de un texto ya normalizado (normalize_text).
+        """
+        return word_tokenize(normalized, language="spanish")
+
+    def tokens(self, text: str) -> List[str]:
+        """
+        Tokens de un texto sin normalizar, stopwords incluidas.
+        """
+        return self.tokenize(normalize_text(text))
+
+    def filter(self, tokens: List[str]) -> List[str]:
+        return [t for t in tokens if t not in STOPWORDS and len(t) > 2]
+
+    def analyze(self, text: str) -> List[str]:
+        """
+        Términos indexables de un texto sin normalizar.
+        """
+        return self.filter(self.tokens(text))
+
+    def analyze_batch(self, texts: List[str]) -> List[List[str]]:
+        return [self.analyze(text) for text in texts]
+
+class FastAnalyzer(NltkAnalyzer):
+    """
+    Mismos tokens que NltkAnalyzer sin NLTK: una sola expresión regular
+    sobre el texto en minúsculas y sin URLs.
+    """
+    name = "fast"
+
+    def tokenize(self, normalized: str) -> List[str]:
+        return expand_contractions(normalized.split())
+
+    def tokens(self, text: str) -> List[str]:
+        return expand_contractions(_token.findall(_url.sub(" ", text.lower())))
+
+    def filter(self, tokens: List[str]) -> List[str]:
+        return [t for t in tokens if len(t) > 2 and t not in STOPWORDS]
+
+    def analyze(self, text: str) -> List[str]:
+        # los tokens de menos de 3 caracteres ni se extraen
+        return self.filter(expand_contractions(_long_token.findall(_url.sub(" ", text.lower()))))
+
+ANALYZERS = {"nltk": NltkAnalyzer, "fast": FastAnalyzer}
+
+_analyzer: Optional[NltkAnalyzer] = None
+
+def get_analyzer() -> NltkAnalyzer:
+    global _analyzer
+    if _analyzer is None:
+        _analyzer = ANALYZERS[DEFAULT_ANALYZER]()
+    return _analyzer
+
+def set_analyzer(name: str) -> NltkAnalyzer:
+    """
+    Cambia el analizador activo ("fast" o "nltk") en este proceso.
+    """
+    global _analyzer
+    if name not in ANALYZERS:
+        raise ValueError(f"Analizador desconocido: {name}")
+    _analyzer = ANALYZERS[name]()
+    return _analyzer
+
 def tokenize_text(text: str):
     """
-    Tokeniza el texto usando nltk word_tokenize
+    Tokeniza un texto ya normalizado con el analizador activo
     """
-    tokens = word_tokenize(text, language="spanish")
-    return tokens
+    return get_analyzer().tokenize(text)
 
 def remove_stopwords(tokens: list):
     """
     Elimina stopwords de una lista de tokens
     """
-    return [t for t in tokens if t not in STOPWORDS and len(t) > 2]
\ No newline at end of file
+    return get_analyzer().filter(tokens)
@@ -0,0 +1,51 @@
+"""
+Normalización de URLs, compartida por el crawler, el análisis de
+páginas (pageparse) y el indexador. crawler.normalize_url la re-exporta.
+"""
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normaliza una URL para evitar duplicados semánticos.
+    - Convierte esquema y host a minúsculas
+    - Elimina 'www.'
+    - Elimina fragmentos (#)
+    - Ordena parámetros query
+    - Elimina barra final innecesaria
+    """
+    try:
+        parsed = urlparse(url)
+
+        scheme = parsed.scheme.lower()
+        netloc = parsed.netloc.lower()
+
+        # Eliminar www. solo si está al inicio
+        if netloc.startswith("www."):
+            netloc = netloc[4:]
+
+        # Normalizar path
+        path = parsed.path or "/"
+        path = path.rstrip("/")
+        if not path:
+            path = "/"
+
+        # Ordenar parámetros query
+        query_params = parse_qsl(parsed.query, keep_blank_values=True)
+        query_params.sort()
+        query = urlencode(query_params)
+
+        normalized = urlunparse((
+            scheme,
+            netloc,
+            path,
+            "",      # params (obsoletos)
+            query,
+            ""       # fragment eliminado
+        ))
+
+        return normalized
+
+    except Exception:
+        # En caso de URL malformada, devolver la original
+        return url
@@ -0,0 +1,110 @@
+"""
+Conjunto compacto de URLs vistas por el crawler (filtro de Bloom).
+
+Un set de Python con las URLs normalizadas cuesta más de 100 bytes por
+URL (el str más la entrada de la tabla hash); con millones de URLs son
+gigabytes. Un filtro de Bloom guarda solo bits: con una tasa de falsos
+positivos p necesita -ln(p) / ln(2)^2 bits por URL (≈ 1.8 bytes con
+p = 0.1%), a cambio de que una fracción p de las URLs nuevas se tome por
+vista y no se descargue. Nunca hay falsos negativos: una URL ya vista no
+se repite.
+
+URLSeen es escalable: cuando el filtro actual se llena se añade otro del
+doble de capacidad con la mitad de tasa de error, así la tasa total se
+mantiene por debajo de `fp_rate` aunque no se sepa de antemano cuántas
+URLs va a tener el crawl.
+"""
+import hashlib
+import math
+from typing import List, Tuple
+
+# Capacidad del primer filtro y tasa de falsos positivos total
+URL_SEEN_CAPACITY = 1_000_000
+URL_SEEN_FP_RATE = 0.001
+
+def url_hashes(url: str) -> Tuple[int, int]:
+    """
+    Dos hashes de 64 bits de la URL (blake2b de 128 bits partido en dos)
+    para el doble hashing de los filtros.
+    """
+    digest = hashlib.blake2b(url.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+class BloomFilter:
+    """
+    Filtro de Bloom de capacidad fija sobre un bytearray. Las k posiciones
+    de cada URL salen de h1 + i·h2 (mod m).
+    """
+
+    def __init__(self, capacity: int, fp_rate: float):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.num_bits = max(8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def contains(self, hashes: Tuple[int, int]) -> bool:
+        m, bits = self.num_bits, self.bits
+        pos, step = hashes[0] % m, hashes[1] % (m - 1) + 1
+        for _ in range(self.num_hashes):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+            pos += step
+            if pos >= m:
+                pos -= m
+        return True
+
+    def add(self, hashes: Tuple[int, int]):
+        m, bits = self.num_bits, self.bits
+        pos, step = hashes[0] % m, hashes[1] % (m - 1) + 1
+        for _ in range(self.num_hashes):
+            bits[pos >> 3] |= 1 << (pos & 7)
+            pos += step
+            if pos >= m:
+                pos -= m
+        self.count += 1
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+class URLSeen:
+    """
+    Conjunto de URLs vistas con tasa de falsos positivos acotada por
+    fp_rate. add() devuelve si la URL era nueva, para deduplicar al
+    encolar.
+    """
+
+    def __init__(self, capacity: int = URL_SEEN_CAPACITY, fp_rate: float = URL_SEEN_FP_RATE):
+        self.fp_rate = fp_rate
+        self.filters: List[BloomFilter] = [BloomFilter(capacity, fp_rate / 2)]
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, url: str) -> bool:
+        hashes = url_hashes(url)
+        return any(f.contains(hashes) for f in self.filters)
+
+    def add(self, url: str) -> bool:
+        """
+        Añade la URL. Devuelve False si ya estaba (o es un falso positivo).
+        """
+        hashes = url_hashes(url)
+        if any(f.contains(hashes) for f in self.filters):
+            return False
+
+        last = self.filters[-1]
+        if last.full:
+            # fp_rate/2 + fp_rate/4 + ... < fp_rate
+            last = BloomFilter(last.capacity * 2, last.fp_rate / 2)
+            self.filters.append(last)
+        last.add(hashes)
+        self.count += 1
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(f.bits) for f in self.filters)
@@ -1,38 +1,440 @@
+import heapq
 import math
-from typing import List, Dict, Tuple
-from .storage import get_connection
+from typing import Iterable, List, Dict, Optional, Tuple
 
-def bm25_score(query_terms: List[str], k1=1.5, b=0.75, topk=10) -> List[Tuple[int,float]]:
-    con = get_connection()
+import numpy as np
+
+from .segments import get_segment_reader
+from .storage import get_connection, get_generation
+
+# Parámetros BM25 con los que se calculan las cotas max_score de terms
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Algoritmos de recuperación disponibles en bm25_score
+ALGORITHMS = ("exhaustive", "wand")
+
+# Origen de los postings: tablas SQLite, segmentos binarios (segments.py)
+# o índice repartido en shards por rangos de doc_id (shards.py)
+SOURCES = ("sqlite", "segments", "shards")
+
+# Documentos por consulta al buscar candidatos en una lista no esencial (MaxScore)
+PROBE_BATCH = 500
+# Se busca documento a documento si los candidatos son menos de df / PROBE_RATIO;
+# si no, se lee la lista entera
+PROBE_RATIO = 4
+
+# Holgura relativa de las cotas frente a redondeos de coma flotante
+BOUND_SLACK = 1e-9
+
+def bm25_idf(N: float, df: float) -> float:
+    """
+    idf de BM25 (variante con +1 dentro del logaritmo, siempre positiva).
+    """
+    return math.log(1 + (N - df + 0.5) / (df + 0.5))
+
+def load_collection_stats(cur) -> Tuple[float, float]:
+    """
+    Lee N y avgdl de la tabla meta en una sola consulta.
+    """
+    stats = dict(cur.execute("SELECT key, value FROM meta WHERE key IN ('N', 'avgdl')"))
+    return stats.get("N", 0), stats.get("avgdl", 1)
+
+def lookup_terms(cur, terms: Iterable[str]) -> Dict[str, Tuple[int, int, Optional[float]]]:
+    """
+    {término: (term_id, df, max_score)} de los términos de la consulta
+    que están en el diccionario, en una sola consulta.
+    """
+    terms = list(terms)
+    if not terms:
+        return {}
+    rows = cur.execute(
+        f"SELECT term, term_id, df, max_score FROM terms WHERE term IN ({','.join('?' * len(terms))})",
+        terms
+    ).fetchall()
+    return {term: (term_id, df, max_score) for term, term_id, df, max_score in rows}
+
+def fetch_postings(cur, term_id: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Postings de un término junto con la longitud de cada documento,
+    en una sola consulta (doc_id, tf, dl) ordenada por doc_id: un rango
+    de la clave primaria (term_id, doc_id).
+    """
+    rows = cur.execute("""
+        SELECT p.doc_id, p.tf, IFNULL(d.length, 0)
+        FROM postings p LEFT JOIN docs d ON d.doc_id = p.doc_id
+        WHERE p.term_id=?
+        ORDER BY p.doc_id
+    """, (term_id,)).fetchall()
+
+    if not rows:
+        empty = np.zeros(0)
+        return empty.astype(np.int64), empty, empty
+
+    arr = np.array(rows, dtype=np.float64)
+    return arr[:, 0].astype(np.int64), arr[:, 1], arr[:, 2]
+
+def refresh_score_bounds(con, term_ids: Optional[Iterable[int]] = None, k1=BM25_K1, b=BM25_B):
+    """
+    Calcula terms.max_score: el mayor valor de la parte de frecuencia de
+    BM25, (k1+1)·tf / (tf + k1·(1-b+b·dl/avgdl)), sobre los documentos
+    del término. La contribución máxima del término es idf · max_score;
+    el idf se aplica al consultar, así la cota no depende de N ni de df.
+
+    - term_ids=None: recalcula todos los términos con el avgdl actual y lo
+      guarda en meta como bound_avgdl.
+    - term_ids dado (indexación incremental): recalcula sólo esos términos
+      con el mismo bound_avgdl; term_upper_bounds corrige la deriva
+      hasta el avgdl actual.
+    """
+    cur = con.cursor()
+
+    if term_ids is None:
+        _, avgdl = load_collection_stats(cur)
+        cur.execute(
+            "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+            ("bound_avgdl", avgdl)
+        )
+        rows = cur.execute("""
+            SELECT p.term_id,
+                   MAX(p.tf * 1.0 / (p.tf + ? * (1 - ? + ? * (IFNULL(d.length, 0) * 1.0 / ?))))
+            FROM postings p LEFT JOIN docs d ON d.doc_id = p.doc_id
+            GROUP BY p.term_id
+        """, (k1, b, b, avgdl or 1)).fetchall()
+    else:
+        row = cur.execute("SELECT value FROM meta WHERE key='bound_avgdl'").fetchone()
+        avgdl = row[0] if row else 1
+        rows = []
+        for term_id in term_ids:
+            row = cur.execute("""
+                SELECT MAX(p.tf * 1.0 / (p.tf + ? * (1 - ? + ? * (IFNULL(d.length, 0) * 1.0 / ?))))
+                FROM postings p LEFT JOIN docs d ON d.doc_id = p.doc_id
+                WHERE p.term_id=?
+            """, (k1, b, b, avgdl or 1, term_id)).fetchone()
+            if row and row[0] is not None:
+                rows.append((term_id, row[0]))
+
+    cur.executemany(
+        "UPDATE terms SET max_score=? WHERE term_id=?",
+        (((k1 + 1) * max_ratio, term_id) for term_id, max_ratio in rows)
+    )
+
+def term_upper_bounds(cur, terms: List[str], N: float, avgdl: float,
+                      doc_freqs: Optional[Dict[str, int]] = None) -> Optional[Dict[str, Tuple[int, float, float, int]]]:
+    """
+    Devuelve {término: (term_id, idf, cota, df)} con la cota de la contribución BM25
+    válida para N/avgdl actuales y la longitud de su lista en este índice,
+    o None si falta alguna cota (índice antiguo). Los términos sin
+    postings no aparecen en el resultado.
+    doc_freqs: df con los que calcular el idf en lugar de los del índice.
+
+    max_score se calculó con bound_avgdl; si desde entonces avgdl
+    creció, la parte de frecuencia puede crecer como mucho en el
+    factor avgdl/bound_avgdl, que se aplica como margen.
+    """
+    row = cur.execute("SELECT value FROM meta WHERE key='bound_avgdl'").fetchone()
+    if row is None:
+        return None
+    drift = max(1.0, avgdl / row[0]) if row[0] else 1.0
+
+    found = lookup_terms(cur, terms)
+    result = {}
+    for term in terms:
+        if term not in found:
+            continue
+        term_id, doc_freq, max_score = found[term]
+        if max_score is None:
+            return None
+        list_length = doc_freq
+        if doc_freqs is not None:
+            doc_freq = doc_freqs[term]
+        idf = bm25_idf(N, float(doc_freq))
+        result[term] = (term_id, idf, idf * max_score * drift * (1 + BOUND_SLACK), list_length)
+
+    return result
+
+def term_contributions(idf: float, doc_ids: np.ndarray, tf: np.ndarray, dl: np.ndarray,
+                       k1: float, b: float, avgdl: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (doc_ids, contribución BM25) de unos postings, con la misma fórmula y
+    orden de operaciones que rank_term_postings (mismo float).
+    """
+    denom = tf + k1 * (1 - b + b * (dl / avgdl))
+    return doc_ids, idf * ((tf * (k1 + 1)) / denom)
+
+def probe_postings(cur, term_id: int, doc_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Como fetch_postings, pero sólo para esos doc_id (ordenados): una
+    búsqueda puntual en la clave primaria (term_id, doc_id) por
+    documento, sin recorrer la lista.
+    """
+    rows = []
+    for i in range(0, len(doc_ids), PROBE_BATCH):
+        batch = doc_ids[i:i + PROBE_BATCH].tolist()
+        rows.extend(cur.execute(f"""
+            SELECT p.doc_id, p.tf, IFNULL(d.length, 0)
+            FROM postings p LEFT JOIN docs d ON d.doc_id = p.doc_id
+            WHERE p.term_id=? AND p.doc_id IN ({','.join('?' * len(batch))})
+            ORDER BY p.doc_id
+        """, (term_id, *batch)).fetchall())
+
+    if not rows:
+        empty = np.zeros(0)
+        return empty.astype(np.int64), empty, empty
+
+    arr = np.array(rows, dtype=np.float64)
+    return arr[:, 0].astype(np.int64), arr[:, 1], arr[:, 2]
+
+def matching(doc_ids: np.ndarray, candidates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (máscara sobre candidates, posición en doc_ids) de los candidatos
+    presentes en doc_ids; los dos arrays están ordenados.
+    """
+    idx = np.searchsorted(doc_ids, candidates)
+    hit = idx < len(doc_ids)
+    hit[hit] = doc_ids[idx[hit]] == candidates[hit]
+    return hit, idx[hit]
+
+def kth_score(scores: np.ndarray, topk: int) -> float:
+    """
+    k-ésima mayor puntuación (umbral del top-k), o -inf si hay menos de k.
+    """
+    if len(scores) < topk:
+        return -math.inf
+    return float(np.partition(scores, len(scores) - topk)[len(scores) - topk])
+
+def wand_score(cur, bounds: Dict[str, Tuple[int, float, float, int]], k1: float, b: float, avgdl: float,
+               topk: int, stats: Optional[dict] = None) -> List[Tuple[int, float]]:
+    """
+    Top-k con poda dinámica MaxScore (Turtle y Flood 1995), la variante
+    de WAND que mejor encaja con listas leídas de SQLite de una vez.
+
+    Los términos se recorren de mayor a menor cota. Las listas de los
+    primeros ("esenciales") se leen enteras y sus contribuciones son una
+    cota inferior de la puntuación de cada documento; la k-ésima de
+    ellas es el umbral θ. En cuanto la suma de cotas de los términos que
+    faltan queda por debajo de θ, un documento que no está en ninguna
+    lista esencial ya no puede entrar en el top-k: los términos restantes
+    no se recorren, sólo se buscan (clave primaria) los documentos
+    candidatos, y tras cada término se descartan los que ni con las cotas
+    que faltan alcanzan θ.
+
+    Es seguro: devuelve exactamente el mismo top-k (mismos scores,
+    sumados en el orden de la consulta, y desempates por doc_id) que la
+    evaluación exhaustiva.
+    stats: si se da, recibe postings_read (filas leídas de postings) y
+    docs_scored (candidatos puntuados al final).
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault("postings_read", 0)
+
+    terms = list(bounds.values())  # orden de la consulta = orden de suma
+    by_bound = sorted(range(len(terms)), key=lambda i: -terms[i][2])
+    remaining = sum(ub for _, _, ub, _ in terms) * (1 + BOUND_SLACK)
+    found: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+    # --- términos esenciales: listas completas hasta que el resto no alcance θ ---
+    candidates = np.zeros(0, dtype=np.int64)
+    partial = np.zeros(0)
+    threshold = -math.inf
+    pending = list(by_bound)
+    while pending and not remaining < threshold:
+        i = pending.pop(0)
+        term_id, idf, ub, _ = terms[i]
+        doc_ids, tf, dl = fetch_postings(cur, term_id)
+        stats["postings_read"] += len(doc_ids)
+        found[i] = term_contributions(idf, doc_ids, tf, dl, k1, b, avgdl)
+        remaining -= ub
+
+        doc_ids = np.concatenate([candidates, found[i][0]])
+        weights = np.concatenate([partial, found[i][1]])
+        candidates, inverse = np.unique(doc_ids, return_inverse=True)
+        partial = np.bincount(inverse, weights=weights, minlength=len(candidates))
+        threshold = kth_score(partial, topk) * (1 - BOUND_SLACK)
+
+    # --- términos no esenciales: sólo búsquedas puntuales de los candidatos ---
+    for i in pending:
+        keep = partial + remaining >= threshold
+        candidates, partial = candidates[keep], partial[keep]
+        if not len(candidates):
+            break
+        term_id, idf, ub, df = terms[i]
+        if len(candidates) * PROBE_RATIO < df:
+            doc_ids, tf, dl = probe_postings(cur, term_id, candidates)
+        else:
+            # casi toda la lista es candidata: sale más barato leerla entera
+            doc_ids, tf, dl = fetch_postings(cur, term_id)
+        stats["postings_read"] += len(doc_ids)
+        found[i] = term_contributions(idf, doc_ids, tf, dl, k1, b, avgdl)
+        remaining -= ub
+
+        hit, idx = matching(found[i][0], candidates)
+        partial[hit] += found[i][1][idx]
+        threshold = max(threshold, kth_score(partial, topk) * (1 - BOUND_SLACK))
+
+    # --- puntuación exacta de los candidatos, sumando en el orden de la consulta ---
+    scores = np.zeros(len(candidates))
+    for i in sorted(found):
+        doc_ids, contributions = found[i]
+        hit, idx = matching(doc_ids, candidates)
+        scores[hit] += contributions[idx]
+    stats["docs_scored"] = len(candidates)
+    return top_k(candidates, scores, topk)
+
+def top_k(doc_ids: np.ndarray, scores: np.ndarray, topk: int) -> List[Tuple[int, float]]:
+    """
+    Selecciona los topk mejores con un heap (O(n log k)) en lugar de
+    ordenar todos. Empates: gana el doc_id menor.
+    """
+    best = heapq.nlargest(
+        topk,
+        zip(scores.tolist(), doc_ids.tolist()),
+        key=lambda item: (item[0], -item[1])
+    )
+    return [(doc_id, score) for score, doc_id in best]
+
+def rank_term_postings(term_postings, k1: float, b: float, avgdl: float, topk: int,
+                       doc_filter: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+    """
+    Acumula las contribuciones BM25 de [(idf, doc_ids, tf, dl)] en un
+    array preasignado indexado por doc_id y extrae el top-k.
+    doc_filter: si se da, sólo compiten esos documentos.
+    """
+    if not term_postings:
+        return []
+
+    size = max(int(doc_ids[-1]) for _, doc_ids, _, _ in term_postings) + 1
+    scores = np.zeros(size)
+    touched = np.zeros(size, dtype=bool)
+
+    for idf, doc_ids, tf, dl in term_postings:
+        denom = tf + k1 * (1 - b + b * (dl / avgdl))
+        scores[doc_ids] += idf * ((tf * (k1 + 1)) / denom)
+        touched[doc_ids] = True
+
+    candidates = np.flatnonzero(touched)
+    if doc_filter is not None:
+        allowed = np.fromiter(doc_filter, dtype=np.int64)
+        candidates = candidates[np.isin(candidates, allowed)]
+    return top_k(candidates, scores[candidates], topk)
+
+def bm25_score_segments(query_terms: List[str], k1=BM25_K1, b=BM25_B, topk=10,
+                        reader=None, doc_filter: Optional[Iterable[int]] = None,
+                        con=None) -> List[Tuple[int, float]]:
+    """
+    Igual que el modo exhaustivo de bm25_score, pero leyendo los
+    postings de un segmento binario (ver segments.py) en vez de SQLite.
+    reader: SegmentReader; si no se da, se usa el del directorio por
+    defecto, que debe ser de la generación actual del índice (la de con
+    o, si no se da, la de una conexión nueva).
+    """
+    if reader is not None:
+        return score_segment(reader, query_terms, k1, b, topk, doc_filter)
+
+    if con is None:
+        own = get_connection()
+        generation = get_generation(own)
+        own.close()
+    else:
+        generation = get_generation(con)
+    reader = get_segment_reader(generation=generation)
+    try:
+        return score_segment(reader, query_terms, k1, b, topk, doc_filter)
+    finally:
+        reader.release()
+
+def score_segment(reader, query_terms: List[str], k1: float, b: float, topk: int,
+                  doc_filter: Optional[Iterable[int]]) -> List[Tuple[int, float]]:
+    qtf: Dict[str,int] = {}
+    for t in query_terms:
+        qtf[t] = qtf.get(t, 0) + 1
+
+    term_postings = []
+    for term in qtf.keys():
+        doc_freq = reader.doc_freq(term)
+        if doc_freq is None:
+            continue
+        idf = bm25_idf(reader.N, float(doc_freq))
+        doc_ids, tf, dl = reader.postings(term)
+        if len(doc_ids):
+            term_postings.append((idf, doc_ids, tf, dl))
+
+    return rank_term_postings(term_postings, k1, b, reader.avgdl, topk, doc_filter)
+
+def bm25_score(query_terms: List[str], k1=BM25_K1, b=BM25_B, topk=10, con=None,
+               algorithm: str = "exhaustive", source: str = "sqlite",
+               doc_filter: Optional[Iterable[int]] = None,
+               stats: Optional[Tuple[float, float]] = None,
+               doc_freqs: Optional[Dict[str, int]] = None) -> List[Tuple[int,float]]:
+    """
+    Ranking BM25 de la consulta, conjunto a conjunto:
+    - por cada término, una consulta trae sus postings con la longitud
+      de documento ya unida (sin SELECT por posting)
+    - las contribuciones se calculan vectorizadas y se acumulan en un
+      array preasignado indexado por doc_id
+    - el top-k se extrae con un heap
+
+    algorithm: "exhaustive" o "wand" (poda dinámica, mismo resultado;
+    si el índice no tiene cotas o k1/b no son los de las cotas, se
+    evalúa de forma exhaustiva).
+    source: "sqlite", "segments" (segmento binario convertido desde la
+    base de datos; siempre exhaustivo) o "shards" (se consulta cada shard
+    en paralelo con N, avgdl y df globales y se fusionan sus top-k).
+    doc_filter: restringe el ranking a esos doc_id (frases/NEAR); se
+    evalúa de forma exhaustiva.
+    con: conexión opcional para reutilizar (si no, se abre y cierra una).
+    stats: (N, avgdl) ya cargados (conexiones del pool de lectura).
+    doc_freqs: df de los términos de la consulta en toda la colección
+    (consulta a un shard); si no se dan, los del índice.
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Algoritmo desconocido: {algorithm} (opciones: {', '.join(ALGORITHMS)})")
+    if source not in SOURCES:
+        raise ValueError(f"Origen desconocido: {source} (opciones: {', '.join(SOURCES)})")
+
+    if source == "segments":
+        return bm25_score_segments(query_terms, k1=k1, b=b, topk=topk, doc_filter=doc_filter, con=con)
+    if source == "shards":
+        from .shards import bm25_score_shards
+        return bm25_score_shards(query_terms, k1=k1, b=b, topk=topk, algorithm=algorithm, doc_filter=doc_filter)
+
+    own_connection = con is None
+    if own_connection:
+        con = get_connection()
     cur = con.cursor()
 
     # leer variables globales
-    row = cur.execute("SELECT value FROM meta WHERE key='N'").fetchone()
-    N = row[0] if row else 0
-    row = cur.execute("SELECT value FROM meta WHERE key='avgdl'").fetchone()
-    avgdl = row[0] if row else 1
+    N, avgdl = stats if stats is not None else load_collection_stats(cur)
 
     qtf: Dict[str,int] = {}
     for t in query_terms:
         qtf[t] = qtf.get(t, 0) + 1
 
-    scores: Dict[int,float] = {}
+    if algorithm == "wand" and (k1, b) == (BM25_K1, BM25_B) and topk > 0 and doc_filter is None:
+        bounds = term_upper_bounds(cur, list(qtf.keys()), N, avgdl, doc_freqs)
+        if bounds is not None:
+            ranked = wand_score(cur, bounds, k1, b, avgdl, topk)
+            if own_connection:
+                con.close()
+            return ranked
 
+    # --- Traer postings de cada término (una consulta por término) ---
+    found = lookup_terms(cur, qtf.keys())
+    term_postings = []
     for term in qtf.keys():
-        row = cur.execute("SELECT doc_freq FROM df WHERE term=?", (term,)).fetchone()
-        if not row:
+        if term not in found:
             continue
-        df = float(row[0])
-        idf = math.log(1 + (N - df + 0.5)/(df + 0.5))
-
-        for doc_id, tf in cur.execute("SELECT doc_id, tf FROM postings WHERE term=?", (term,)):
-            row = cur.execute("SELECT length FROM docs WHERE doc_id=?", (doc_id,)).fetchone()
-            dl = row[0] if row else 0.0
+        term_id, doc_freq, _ = found[term]
+        if doc_freqs is not None:
+            doc_freq = doc_freqs[term]
+        idf = bm25_idf(N, float(doc_freq))
+        doc_ids, tf, dl = fetch_postings(cur, term_id)
+        if len(doc_ids):
+            term_postings.append((idf, doc_ids, tf, dl))
 
-            denom = tf + k1 * (1 - b + b * (dl / avgdl))
-            score = idf * ((tf * (k1 + 1)) / denom if denom > 0 else 0)
-            scores[doc_id] = scores.get(doc_id, 0.0) + score
+    if own_connection:
+        con.close()
 
-    ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:topk]
-    con.close()
-    return ranked
\ No newline at end of file
+    # --- Acumular en un array preasignado ---
+    return rank_term_postings(term_postings, k1, b, avgdl, topk, doc_filter)
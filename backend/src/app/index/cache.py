@@ -0,0 +1,133 @@
+"""
+Caché de resultados de /search.
+
+Cada entrada guarda el ranking BM25 completo (top-k) de una consulta y,
+según se van pidiendo páginas, los resultados ya montados de cada
+documento (título, snippet, PageRank...). La paginación se sirve desde
+la entrada sin repetir nada.
+
+- Expulsión LRU con límite de entradas y de memoria (tamaño estimado).
+- Invalidación por generación: si meta.generation cambió (indexación,
+  PageRank, nuevo segmento) se vacía entera.
+- Una entrada guardada no se modifica: varias peticiones pueden estar
+  leyéndola a la vez, así que las páginas nuevas se guardan en una
+  entrada nueva (refresh).
+"""
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+# Límites por defecto de la caché de /search
+SEARCH_CACHE_MAX_BYTES = 64 * 1024 * 1024
+SEARCH_CACHE_MAX_ENTRIES = 10_000
+
+def estimate_size(value: Any) -> int:
+    """
+    Tamaño aproximado en bytes de un valor formado por dict/list/tuple
+    y escalares (suficiente para repartir el límite de memoria).
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimate_size(v) for v in value)
+    return size
+
+class ResultCache:
+    """
+    Caché LRU acotada en entradas y en bytes, segura entre hilos
+    (FastAPI ejecuta los endpoints síncronos en un pool de hilos).
+    """
+
+    def __init__(self, max_bytes: int = SEARCH_CACHE_MAX_BYTES,
+                 max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.generation: Optional[int] = None
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # clave -> (valor, tamaño)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_generation(self, generation: int):
+        if generation != self.generation:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self.generation = generation
+
+    def get(self, key: Hashable, generation: int) -> Optional[Any]:
+        with self._lock:
+            self._check_generation(generation)
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, generation: int, value: Any):
+        """
+        Inserta (o reemplaza) una entrada y expulsa las menos usadas
+        hasta volver a los límites.
+        """
+        self._store(key, generation, value)
+
+    def refresh(self, key: Hashable, generation: int, value: Any):
+        """
+        Sustituye una entrada por una copia ampliada (páginas nuevas); no
+        hace nada si entretanto se expulsó.
+        """
+        self._store(key, generation, value, only_existing=True)
+
+    def _store(self, key: Hashable, generation: int, value: Any, only_existing: bool = False):
+        size = estimate_size(value)
+        with self._lock:
+            self._check_generation(generation)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            elif only_existing:
+                return
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "generation": self.generation,
+            }
+
+# Instancia compartida por el endpoint /search
+search_cache = ResultCache()
+
+# Consultas con source="shards": su generación es la de cada shard
+shard_search_cache = ResultCache()
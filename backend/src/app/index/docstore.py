@@ -0,0 +1,46 @@
+import zlib
+from typing import Dict, Iterable, Tuple
+
+# Nivel de compresión zlib del texto guardado (compromiso tamaño/velocidad)
+DOC_TEXT_LEVEL = 6
+
+def compress_text(text: str) -> bytes:
+    """
+    Comprime el texto limpio de un documento para la tabla doc_text.
+    """
+    return zlib.compress(text.encode("utf-8"), DOC_TEXT_LEVEL)
+
+def decompress_text(blob: bytes) -> str:
+    """
+    Inversa de compress_text.
+    """
+    return zlib.decompress(blob).decode("utf-8")
+
+def store_doc_text(cursor, doc_id: int, blob: bytes, token_offset: int = 0):
+    """
+    Guarda (o reemplaza) el texto comprimido de un documento.
+    token_offset: posición de su primera palabra en la secuencia de
+    tokens indexada (el texto visible va detrás de título, h1 y
+    descripción).
+    """
+    cursor.execute(
+        "INSERT OR REPLACE INTO doc_text(doc_id, text, token_offset) VALUES (?, ?, ?)",
+        (doc_id, blob, token_offset)
+    )
+
+def load_doc_texts(cursor, doc_ids: Iterable[int]) -> Dict[int, Tuple[str, int]]:
+    """
+    Devuelve {doc_id: (texto normalizado, token_offset)} de los
+    documentos pedidos con una sola consulta. Los que no tienen texto
+    guardado (índices anteriores a doc_text) no aparecen en el resultado.
+    """
+    doc_ids = list(doc_ids)
+    if not doc_ids:
+        return {}
+
+    placeholders = ",".join("?" * len(doc_ids))
+    rows = cursor.execute(
+        f"SELECT doc_id, text, IFNULL(token_offset, 0) FROM doc_text WHERE doc_id IN ({placeholders})",
+        doc_ids
+    ).fetchall()
+    return {doc_id: (decompress_text(blob), offset) for doc_id, blob, offset in rows}
@@ -0,0 +1,379 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.core.jobs import report_progress
+from app.core.simhash import SimHashIndex, to_signed, to_unsigned
+
+from .indexer import (
+    list_raw_documents,
+    file_signature,
+    file_sha1,
+    iter_analyzed_documents,
+    index_documents,
+    url_indexed,
+    count_near_duplicate,
+    add_crawl_near_duplicates,
+)
+from .storage import get_connection, bump_generation, lookup_term_ids
+from .docstore import store_doc_text
+from .positions import has_positions
+from .bm25 import refresh_score_bounds
+
+
+def remove_document(cursor, doc_id: int, touched: Optional[Set[int]] = None) -> int:
+    """
+    Elimina un documento del índice (postings, df de terms, enlaces, PageRank,
+    texto, sus casi duplicados y docs) y devuelve su longitud para poder actualizar avgdl.
+    Su PageRank pasa a pagerank_prev por si la URL vuelve a indexarse.
+    Si se pasa touched, añade ahí los term_id afectados.
+    """
+    row = cursor.execute("SELECT length FROM docs WHERE doc_id=?", (doc_id,)).fetchone()
+    if row is None:
+        return 0
+
+    term_ids = cursor.execute("SELECT term_id FROM postings WHERE doc_id=?", (doc_id,)).fetchall()
+    if touched is not None:
+        touched.update(term_id for (term_id,) in term_ids)
+    cursor.executemany("UPDATE terms SET df = df - 1 WHERE term_id=?", term_ids)
+    cursor.executemany("DELETE FROM terms WHERE term_id=? AND df <= 0", term_ids)
+    cursor.execute("DELETE FROM postings WHERE doc_id=?", (doc_id,))
+    cursor.execute("DELETE FROM positions WHERE doc_id=?", (doc_id,))
+
+    cursor.execute("DELETE FROM links WHERE from_doc_id=?", (doc_id,))
+    cursor.execute("DELETE FROM links WHERE to_doc_id=?", (doc_id,))
+    cursor.execute("DELETE FROM outlinks WHERE from_doc_id=?", (doc_id,))
+    cursor.execute(
+        "INSERT OR REPLACE INTO pagerank_prev(url, rank) "
+        "SELECT d.url, p.rank FROM pagerank p JOIN docs d ON d.doc_id = p.doc_id "
+        "WHERE p.doc_id=?",
+        (doc_id,)
+    )
+    cursor.execute("DELETE FROM pagerank WHERE doc_id=?", (doc_id,))
+    cursor.execute("DELETE FROM doc_text WHERE doc_id=?", (doc_id,))
+    cursor.execute("DELETE FROM near_duplicates WHERE doc_id=?", (doc_id,))
+    cursor.execute("DELETE FROM docs WHERE doc_id=?", (doc_id,))
+
+    return row[0] or 0
+
+
+def add_document(cursor, doc_id: int, doc: dict) -> List[int]:
+    """
+    Inserta un documento analizado (salida de analyze_document) con el
+    doc_id dado y enlaza sus aristas en ambos sentidos:
+    - sus enlaces salientes hacia documentos ya indexados
+    - los enlaces entrantes que otros documentos tenían pendientes (outlinks)
+    Devuelve los term_id de sus términos (los nuevos se añaden a terms).
+    """
+    doc_title = doc["title"] if doc["title"] else doc["filename"]
+    simhash = doc["simhash"]
+    cursor.execute(
+        "INSERT INTO docs(doc_id, url, title, path, length, simhash) VALUES (?, ?, ?, ?, ?, ?)",
+        (doc_id, doc["url"], doc_title, doc["path"], doc["length"],
+         to_signed(simhash) if simhash is not None else None)
+    )
+    store_doc_text(cursor, doc_id, doc["text"], doc["token_offset"])
+
+    cursor.executemany(
+        "INSERT INTO terms(term, df) VALUES (?, 1) "
+        "ON CONFLICT(term) DO UPDATE SET df = df + 1",
+        ((term,) for term in doc["tf"])
+    )
+    term_ids = lookup_term_ids(cursor, doc["tf"])
+    cursor.executemany(
+        "INSERT INTO postings(term_id, doc_id, tf) VALUES (?, ?, ?)",
+        ((term_ids[term], doc_id, freq) for term, freq in doc["tf"].items())
+    )
+    if "positions" in doc:
+        cursor.executemany(
+            "INSERT INTO positions(term_id, doc_id, data) VALUES (?, ?, ?)",
+            ((term_ids[term], doc_id, data) for term, data in doc["positions"].items())
+        )
+
+    # --- Enlaces salientes (incluye autoenlaces, como la indexación completa) ---
+    # Un enlace a una URL casi duplicada cuenta para su documento
+    targets: Dict[str, Optional[int]] = {}
+    for link in doc["links"]:
+        if link not in targets:
+            row = cursor.execute(
+                "SELECT doc_id FROM docs WHERE url=? UNION ALL SELECT doc_id FROM near_duplicates WHERE url=?",
+                (link, link)
+            ).fetchone()
+            targets[link] = row[0] if row else None
+        if targets[link] is not None:
+            cursor.execute(
+                "INSERT INTO links(from_doc_id, to_doc_id) VALUES (?, ?)",
+                (doc_id, targets[link])
+            )
+
+    # --- Enlaces entrantes que esperaban a esta URL ---
+    incoming = cursor.execute(
+        "SELECT from_doc_id FROM outlinks WHERE url=? AND from_doc_id != ?",
+        (doc["url"], doc_id)
+    ).fetchall()
+    cursor.executemany(
+        "INSERT INTO links(from_doc_id, to_doc_id) VALUES (?, ?)",
+        ((from_doc_id, doc_id) for (from_doc_id,) in incoming)
+    )
+
+    cursor.executemany(
+        "INSERT INTO outlinks(from_doc_id, url) VALUES (?, ?)",
+        ((doc_id, link) for link in doc["links"])
+    )
+    return list(term_ids.values())
+
+
+def add_near_duplicate(cursor, url: str, doc_id: int, path: Optional[str] = None,
+                       simhash: Optional[int] = None):
+    """
+    Registra url como casi duplicada de doc_id (con su huella SimHash, si
+    se da) y le pasa los enlaces entrantes que esperaban a esa URL (outlinks).
+    """
+    cursor.execute(
+        "INSERT OR REPLACE INTO near_duplicates(url, doc_id, path, simhash) VALUES (?, ?, ?, ?)",
+        (url, doc_id, path, to_signed(simhash) if simhash is not None else None)
+    )
+    link_near_duplicate(cursor, url, doc_id)
+
+
+def link_near_duplicate(cursor, url: str, doc_id: int):
+    incoming = cursor.execute("SELECT from_doc_id FROM outlinks WHERE url=?", (url,)).fetchall()
+    cursor.executemany(
+        "INSERT INTO links(from_doc_id, to_doc_id) VALUES (?, ?)",
+        ((from_doc_id, doc_id) for (from_doc_id,) in incoming)
+    )
+
+
+def load_fingerprints(cursor) -> SimHashIndex:
+    """
+    SimHashIndex con las huellas de los documentos indexados.
+    """
+    fingerprints = SimHashIndex()
+    for doc_id, value in cursor.execute(
+        "SELECT doc_id, simhash FROM docs WHERE simhash IS NOT NULL ORDER BY doc_id"
+    ).fetchall():
+        fingerprints.add(to_unsigned(value), doc_id)
+    return fingerprints
+
+
+def relocate_documents(moved: Dict[str, str]) -> int:
+    """
+    Cambia la ruta de documentos que se han movido sin cambiar de
+    contenido (migración de los buckets al almacén de segmentos,
+    rawstore.migrate_buckets): docs.path y manifest pasan a la ruta nueva
+    con su firma, así update_index no los vuelve a analizar.
+    Devuelve cuántas filas de manifest se han actualizado.
+    """
+    con = get_connection()
+    cursor = con.cursor()
+
+    relocated = 0
+    for old_path, new_path in moved.items():
+        signature = file_signature(new_path)
+        if signature is None:
+            continue
+        cursor.execute("UPDATE docs SET path=? WHERE path=?", (new_path, old_path))
+        relocated += cursor.execute(
+            "UPDATE OR REPLACE manifest SET path=?, size=?, mtime_ns=? WHERE path=?",
+            (new_path, *signature, old_path)
+        ).rowcount
+
+    # las rutas salen en los resultados de /search
+    bump_generation(cursor)
+    con.commit()
+    con.close()
+    return relocated
+
+
+def update_index(raw_dir: str, workers: int = 1):
+    """
+    Indexación incremental de raw_dir usando la tabla manifest:
+    - archivos nuevos            → se analizan e insertan
+    - archivos modificados       → se reanalizan (conservan su doc_id)
+    - archivos borrados          → se eliminan sus postings y enlaces
+    - tamaño/mtime distintos pero mismo contenido → sólo se actualiza manifest
+    - casi duplicados (SimHash) de un documento indexado → no se indexan
+      y su URL se asocia a ese documento; si el documento se borra o
+      cambia, se vuelven a analizar
+    df, N y avgdl se actualizan en el sitio, sin recorrer el resto del índice.
+    Si todavía no hay manifest se hace una indexación completa.
+    Si el índice tiene capa posicional, también se mantiene.
+    """
+
+    con = get_connection()
+    cursor = con.cursor()
+    positions = has_positions(cursor)
+
+    if cursor.execute("SELECT 1 FROM manifest LIMIT 1").fetchone() is None:
+        con.close()
+        print("[update_index] Sin manifest previo: indexación completa")
+        return index_documents(raw_dir, workers=workers, positions=positions)
+
+    # --- Estado anterior ---
+    manifest: Dict[str, Tuple[int, int, Optional[str], Optional[int]]] = {
+        path: (size, mtime_ns, sha1, doc_id)
+        for path, size, mtime_ns, sha1, doc_id in cursor.execute(
+            "SELECT path, size, mtime_ns, sha1, doc_id FROM manifest"
+        )
+    }
+
+    row = cursor.execute("SELECT value FROM meta WHERE key='N'").fetchone()
+    N = int(row[0]) if row else 0
+    row = cursor.execute("SELECT value FROM meta WHERE key='avgdl'").fetchone()
+    total_len = round((row[0] if row else 0.0) * N)
+
+    # Los doc_id nuevos nunca reutilizan los de documentos borrados
+    max_doc = cursor.execute("SELECT MAX(doc_id) FROM docs").fetchone()[0] or 0
+    max_manifest = cursor.execute("SELECT MAX(doc_id) FROM manifest").fetchone()[0] or 0
+    next_doc_id = max(max_doc, max_manifest) + 1
+
+    # --- Clasificar archivos de raw_dir ---
+    txt_files = list_raw_documents(raw_dir)
+    on_disk = set(txt_files)
+
+    to_analyze: List[str] = []
+    unchanged = 0
+    for path in txt_files:
+        signature = file_signature(path)
+        if signature is None:
+            continue
+
+        old = manifest.get(path)
+        if old is None:
+            to_analyze.append(path)
+            continue
+
+        if (old[0], old[1]) == signature:
+            unchanged += 1
+            continue
+
+        # tamaño o mtime distintos: sólo reanalizar si cambió el contenido
+        if old[2] is not None and file_sha1(path) == old[2]:
+            cursor.execute(
+                "UPDATE manifest SET size=?, mtime_ns=? WHERE path=?",
+                (*signature, path)
+            )
+            unchanged += 1
+            continue
+
+        to_analyze.append(path)
+
+    deleted = [path for path in manifest if path not in on_disk]
+
+    # --- Casi duplicados de documentos que se borran o cambian: se vuelven a analizar ---
+    # (y los archivos casi duplicados que cambian dejan de serlo hasta reanalizarlos)
+    pending = set(to_analyze)
+    for path in deleted + to_analyze:
+        old = manifest.get(path)
+        if old is None or old[3] is None:
+            continue
+        for (dup_path,) in cursor.execute(
+            "SELECT path FROM near_duplicates WHERE doc_id=? AND path IS NOT NULL", (old[3],)
+        ).fetchall():
+            if dup_path in on_disk and dup_path not in pending:
+                pending.add(dup_path)
+                to_analyze.append(dup_path)
+    for path in deleted + to_analyze:
+        cursor.execute("DELETE FROM near_duplicates WHERE path=?", (path,))
+
+    # Términos cuyas postings cambian (hay que recalcular su cota WAND)
+    touched: Set[int] = set()
+
+    # --- Eliminar documentos borrados y versiones antiguas de los modificados ---
+    removed = 0
+    for path in deleted:
+        doc_id = manifest[path][3]
+        if doc_id is not None:
+            total_len -= remove_document(cursor, doc_id, touched)
+            N -= 1
+            removed += 1
+        cursor.execute("DELETE FROM manifest WHERE path=?", (path,))
+
+    for path in to_analyze:
+        old = manifest.get(path)
+        if old is not None and old[3] is not None:
+            total_len -= remove_document(cursor, old[3], touched)
+            N -= 1
+
+    # --- Analizar (en paralelo si workers > 1) e insertar lo nuevo ---
+    added = 0
+    updated = 0
+    fingerprints = load_fingerprints(cursor)
+    near_dups = {"near_duplicates": 0, "near_duplicate_postings": 0, "near_duplicate_bytes": 0}
+    analyzed = zip(to_analyze, iter_analyzed_documents(to_analyze, workers, positions))
+    for i, (path, doc) in enumerate(analyzed):
+        # Progreso del trabajo en segundo plano (y punto de cancelación)
+        report_progress("index", i, len(to_analyze), added=added, updated=updated,
+                        near_duplicates=near_dups["near_duplicates"])
+        signature = file_signature(path)
+        if signature is None:
+            continue
+
+        old = manifest.get(path)
+        doc_id = None
+
+        if doc is not None:
+            duplicate_url = url_indexed(cursor, doc["url"])
+            canonical = None
+            if not duplicate_url and doc["simhash"] is not None:
+                canonical = fingerprints.find(doc["simhash"])
+
+            if duplicate_url:
+                print(f"[SKIP] URL ya indexada: {doc['url']}")
+            elif canonical is not None:
+                print(f"[SKIP] Casi duplicado de doc_id={canonical}: {doc['url']}")
+                add_near_duplicate(cursor, doc["url"], canonical, path, doc["simhash"])
+                count_near_duplicate(near_dups, doc)
+            else:
+                if old is not None and old[3] is not None:
+                    doc_id = old[3]
+                    updated += 1
+                else:
+                    doc_id = next_doc_id
+                    next_doc_id += 1
+                    added += 1
+
+                touched.update(add_document(cursor, doc_id, doc))
+                if doc["simhash"] is not None:
+                    fingerprints.add(doc["simhash"], doc_id)
+                N += 1
+                total_len += doc["length"]
+                print(f">>> Indexando doc_id={doc_id} ({doc['filename']})")
+
+        # un archivo modificado que ya no produce documento cuenta como borrado
+        if doc_id is None and old is not None and old[3] is not None:
+            removed += 1
+
+        cursor.execute(
+            "INSERT OR REPLACE INTO manifest(path, size, mtime_ns, sha1, doc_id) VALUES (?, ?, ?, ?, ?)",
+            (path, *signature, doc["sha1"] if doc else None, doc_id)
+        )
+
+    # --- Casi duplicados que descartó el crawler desde la última vez ---
+    for url, doc_id in add_crawl_near_duplicates(cursor, raw_dir):
+        link_near_duplicate(cursor, url, doc_id)
+
+    # --- Estadísticas globales ---
+    avgdl = (total_len / N) if N > 0 else 0.0
+    cursor.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", ("N", N))
+    cursor.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", ("avgdl", avgdl))
+    refresh_score_bounds(con, touched)
+    bump_generation(cursor)
+
+    con.commit()
+    con.execute("PRAGMA wal_checkpoint(PASSIVE);")
+    con.close()
+
+    print(
+        f"[update_index] nuevos={added} modificados={updated} "
+        f"borrados={removed} sin cambios={unchanged} "
+        f"casi duplicados={near_dups['near_duplicates']}"
+    )
+
+    return {
+        "indexed_docs": N,
+        "avgdl": avgdl,
+        "added": added,
+        "updated": updated,
+        "removed": removed,
+        "unchanged": unchanged,
+        **near_dups,
+    }
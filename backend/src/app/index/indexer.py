@@ -1,14 +1,45 @@
 import html
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
 from bs4 import BeautifulSoup
 import os
 import json
+import hashlib
 import re
-from urllib.parse import urljoin
-
-from app.core.textproc import normalize_text, tokenize_text, remove_stopwords
-from app.core.crawler import extract_links, normalize_url
-from .storage import get_connection
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import groupby
+from operator import itemgetter
+
+from app.core.textproc import get_analyzer, normalize_text
+from app.core.crawler import normalize_url
+from app.core.crawl_state import read_near_duplicates
+from app.core.jobs import report_progress
+from app.core.pageparse import parse_page
+from app.core.rawstore import open_raw_store, parse_store_key, store_key
+from app.core.simhash import SimHashIndex, text_simhash, to_signed
+from .storage import get_connection, begin_bulk_load, end_bulk_load, bump_generation, restore_pragmas
+from .docstore import compress_text, store_doc_text
+from .positions import term_positions
+from .bm25 import refresh_score_bounds
+from .spimi import RunBuffer, make_run_dir, remove_run_dir
+
+# Máximo de documentos por lote enviado a cada proceso trabajador
+INDEX_CHUNKSIZE = 64
+# Lotes en vuelo por proceso trabajador
+INDEX_PREFETCH = 2
+
+# Memoria (estimada) para postings, posiciones y enlaces antes de volcar un run
+INDEX_MEMORY_BUDGET = 256 * 1024 * 1024
+# Bytes que se cuentan por tupla en memoria, además del término / URL / posiciones
+RUN_TUPLE_BYTES = 120
+# Filas por executemany al escribir lo fusionado
+INSERT_BATCH = 10_000
+# Tablas que una indexación completa vacía y vuelve a llenar (más meta)
+REBUILT_TABLES = (
+    "postings", "positions", "links", "outlinks", "pagerank", "doc_text",
+    "docs", "terms", "manifest", "near_duplicates",
+)
 
 
 def extract_visible_text(html: str) -> str:
@@ -17,6 +48,7 @@ def extract_visible_text(html: str) -> str:
     - Elimina scripts, estilos y bloques no útiles.
     - Prioriza varios selectores comunes.
     - Filtra duplicados y ruido.
+    (Referencia de pageparse.parse_page, que es lo que usa el indexador.)
     """
 
     # Detectar si parece XML
@@ -64,6 +96,7 @@ def extract_visible_text_wikipedia(html: str) -> str:
     - Se centra en <div id='mw-content-text'>, que contiene el artículo.
     - Elimina ruido común (tablas, referencias, navegación, etc.).
     - Extrae párrafos, listas, encabezados y definiciones relevantes.
+    (Referencia de pageparse.parse_page, que es lo que usa el indexador.)
     """
 
     soup = BeautifulSoup(html, "html.parser")
@@ -124,206 +157,557 @@ def extract_visible_text_wikipedia(html: str) -> str:
     # --- Devolver la concatenación de partes relevantes ---
     return " ".join(text_parts).strip()
 
-def index_documents(raw_dir: str):
+def list_txt_files(raw_dir: str) -> List[str]:
     """
-    Indexa todos los .txt en raw_dir.
-    Guarda en tables: docs, postings, df, links y meta.
+    Devuelve, ordenadas, las rutas de todos los .txt bajo raw_dir
+    (recorriendo también los subdirectorios / buckets).
+    El orden determina la asignación de doc_id.
     """
+    txt_files = []
+    for root, _, files in os.walk(raw_dir):
+        for f in files:
+            if f.lower().endswith(".txt"):
+                txt_files.append(os.path.join(root, f))
 
-    con = get_connection()
-    cursor = con.cursor()
-
-    # --- borrar índice viejo (solo datos), pero no estructura de tablas ---
-    cursor.executescript("""
-        DELETE FROM postings;
-        DELETE FROM links;
-        DELETE FROM docs;
-        DELETE FROM df;
-        DELETE FROM meta;
-    """)
-    con.commit()
+    return sorted(txt_files)
 
-    # Contadores globales
-    N = 0
-    total_len = 0
+def list_raw_documents(raw_dir: str) -> List[str]:
+    """
+    Documentos de raw_dir en el orden de asignación de doc_id: los .txt
+    sueltos (list_txt_files) y después las claves del almacén de
+    segmentos (rawstore) en orden de doc_id del crawler.
+    """
+    store = open_raw_store(raw_dir)
+    store.refresh()
+    return list_txt_files(raw_dir) + [store_key(raw_dir, doc_id) for doc_id in store.doc_ids()]
 
-    # df_counts: cuenta en cuántos documentos aparece cada término
-    df_counts: Dict[str, int] = {}
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """
+    Devuelve (tamaño, mtime en ns) del archivo o None si no se puede leer.
+    Es lo que guarda la tabla manifest para detectar cambios. Para una
+    clave del almacén de segmentos es RawStore.signature (cambia al
+    re-escribir el documento).
+    """
+    stored = parse_store_key(path)
+    if stored is not None:
+        return open_raw_store(stored[0]).signature(stored[1])
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+def read_raw_document(path: str) -> Optional[Tuple[str, dict]]:
+    """
+    (HTML, metadatos) de un documento: un .txt con su .meta.json al lado
+    o una clave del almacén de segmentos. None si no se puede leer.
+    """
+    filename = os.path.basename(path)
+    stored = parse_store_key(path)
+    if stored is not None:
+        doc = open_raw_store(stored[0]).read(stored[1])
+        if doc is None:
+            print(f"[index_documents] No está en el almacén: {filename}")
+            return None
+        return doc[1], doc[0]
+
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            raw_text = f.read()
+    except Exception as e:
+        print(f"[index_documents] Error leyendo {filename}: {e}")
+        return None
+
+    # --- Leer metadatos si existen ---
+    meta = {}
+    meta_file = path.replace(".txt", ".meta.json")
+    if os.path.exists(meta_file):
+        try:
+            with open(meta_file, "r", encoding="utf-8") as mf:
+                meta = json.load(mf)
+        except json.JSONDecodeError:
+            meta = {}
+        except Exception as e:
+            print(f"[index_documents] JSON inválido en {meta_file}: {e}")
 
-    # Mapas de armonización URL ↔ doc_id
-    url_to_docid: Dict[str, int] = {}
-    docid_to_url: Dict[int, str] = {}
+    return raw_text, meta
 
-    # --- Recorrer todos los .txt en raw_dir y sus subdirectorios ---
-    print(">>> Recorriendo raw_dir recursivamente:", raw_dir)
+def text_sha1(text: str) -> str:
+    """
+    Hash del contenido tal y como lo lee el indexador.
+    """
+    return hashlib.sha1(text.encode("utf-8", errors="ignore")).hexdigest()
 
-    txt_files = []
-    for root, _, files in os.walk(raw_dir):
-        for f in files:
-            if f.lower().endswith(".txt"):
-                txt_files.append(os.path.join(root, f))
+def file_sha1(path: str) -> Optional[str]:
+    """
+    Hash del contenido de un documento (mismo criterio que analyze_document).
+    """
+    raw = read_raw_document(path)
+    return text_sha1(raw[0]) if raw is not None else None
 
-    txt_files = sorted(txt_files)
-    print(">>> Archivos .txt encontrados:", txt_files)
+def analyze_document(path: str, positions: bool = False) -> Optional[dict]:
+    """
+    Lee y analiza un documento crudo, .txt o registro del almacén de
+    segmentos (parseo HTML + normalización +
+    tokenización + stopwords). No toca la base de datos, por lo que
+    puede ejecutarse en un proceso trabajador.
+
+    Devuelve None si el archivo debe omitirse o un diccionario con:
+    path, filename, url, title, length, tf (término -> frecuencia),
+    links (URLs salientes ya normalizadas), sha1 del contenido, text
+    (texto visible normalizado, ya comprimido para doc_text),
+    token_offset (posición de la primera palabra de text) y, si
+    positions=True, positions (término -> posiciones codificadas).
+    """
 
-    # Guardamos HTML crudo para extraer luego enlaces
-    raw_html_store: Dict[int, str] = {}
+    # Nombre simple para depuración
+    filename = os.path.basename(path)
+
+    # --- Leer HTML bruto y metadatos ---
+    raw = read_raw_document(path)
+    if raw is None:
+        return None
+    raw_text, meta = raw
+
+    # Evita indexar archivos vacíos
+    if not raw_text:
+        print(f"[index_documents] Archivo vacío, omitiendo: {filename}")
+        return None
+
+    print(f">>> Encontrado TXT: {path}")
+
+    original_url = meta.get("url", "").strip()
+    if not original_url:
+        # Si no existe en meta, usamos filename (fallback no ideal)
+        original_url = filename
+
+    normalized_doc_url = normalize_url(original_url)
+
+    # --- Parsear la página una sola vez: texto visible (y enlaces) ---
+    page = parse_page(raw_text, normalized_doc_url)
+    visible_text = page["text"]
+
+    # --- DEBUG: información de texto visible ---
+    print(f"\n[DEBUG] Doc URL: {normalized_doc_url}")
+    print(f"[DEBUG] Visible text preview (200 chars): {visible_text[:200]}...")
+    print(f"[DEBUG] Visible text word count: {len(visible_text.split())}")
+
+    # --- Construir y normalizar texto completo para indexar ---
+    title = meta.get("title", "")
+    h1 = meta.get("h1", "")
+    description = meta.get("description", "")
+    full_text_to_index = f"{title} {h1} {description} {visible_text}"
+
+    analyzer = get_analyzer()
+    tokens = analyzer.tokens(full_text_to_index)
+
+    # tokens de título/h1/descripción: el texto visible empieza detrás
+    token_offset = len(analyzer.tokens(f"{title} {h1} {description}"))
+
+    # --- DEBUG: tokens antes y después de filtrar ---
+    print(f"[DEBUG] Normalized tokens (first 20): {tokens[:20]}")
+    filtered = analyzer.filter(tokens)
+    print(f"[DEBUG] Filtered tokens count: {len(filtered)}")
+    print(f"[DEBUG] Filtered tokens (first 20): {filtered[:20]}\n")
+
+    if not filtered:
+        print(f"[index_documents] Sin tokens útiles en: {filename}")
+        return None
+
+    # --- Frecuencias de término (mapa compacto que viaja al escritor) ---
+    tf: Dict[str, int] = {}
+    for term in filtered:
+        tf[term] = tf.get(term, 0) + 1
+
+    # --- Enlaces salientes: los que guardó el crawler o, si no, los del parseo ---
+    links = meta["links"] if "links" in meta else page["links"]
+
+    doc = {
+        "path": path,
+        "filename": filename,
+        "url": normalized_doc_url,
+        "title": title,
+        "length": len(filtered),
+        "tf": tf,
+        "links": links,
+        "sha1": text_sha1(raw_text),
+        "text": compress_text(normalize_text(visible_text)),
+        "token_offset": token_offset,
+        "simhash": text_simhash(visible_text),
+    }
+    if positions:
+        doc["positions"] = term_positions(tokens, tf.keys())
+    return doc
+
+def analyze_batch(paths: List[str], positions: bool = False) -> List[Optional[dict]]:
+    return [analyze_document(path, positions) for path in paths]
+
+def iter_analyzed_documents(txt_files: List[str], workers: int = 1, positions: bool = False) -> Iterator[Optional[dict]]:
+    """
+    Aplica analyze_document a cada archivo, en el mismo orden de txt_files.
+    positions: calcular también las posiciones de cada término.
+    - workers == 1: en este mismo proceso.
+    - workers > 1: en un pool de procesos (workers <= 0 usa todos los núcleos).
+    El orden de salida es siempre el de entrada, así que la numeración
+    de doc_id es determinista e idéntica a la del modo secuencial.
+    """
+    if workers is None or workers <= 0:
+        workers = os.cpu_count() or 1
+
+    if workers == 1:
+        yield from map(partial(analyze_document, positions=positions), txt_files)
+        return
+
+    # lotes para no pagar un viaje IPC por documento; como mucho
+    # workers * INDEX_PREFETCH lotes en vuelo (executor.map lo enviaría
+    # todo de golpe y los resultados se acumularían en memoria si el
+    # escritor va más lento que los procesos)
+    chunksize = max(1, min(INDEX_CHUNKSIZE, len(txt_files) // (workers * 4) or 1))
+    batches = (txt_files[i:i + chunksize] for i in range(0, len(txt_files), chunksize))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(analyze_batch, batch, positions))
+            if len(pending) >= workers * INDEX_PREFETCH:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def join_term_ids(rows: Iterator[tuple], terms_by_id) -> Iterator[tuple]:
+    """
+    (term_id, doc_id, data) de cada fila (término, doc_id, data) de rows,
+    que llega en orden de término como las filas (término, term_id) de
+    terms_by_id. Todos los términos de rows están en terms_by_id.
+    """
+    current = next(terms_by_id, None)
+    for term, doc_id, data in rows:
+        while current[0] != term:
+            current = next(terms_by_id)
+        yield current[1], doc_id, data
 
-    # --- Primera pasada: indexar docs y postings ---
-    for path in txt_files:
+def url_indexed(cursor, url: str) -> bool:
+    """
+    La URL ya es un documento del índice o un casi duplicado de uno.
+    """
+    return cursor.execute(
+        "SELECT 1 FROM docs WHERE url=? UNION ALL SELECT 1 FROM near_duplicates WHERE url=?",
+        (url, url)
+    ).fetchone() is not None
 
-        # Nombre simple para depuración
-        filename = os.path.basename(path)
+def count_near_duplicate(counters: Dict[str, int], doc: dict):
+    """
+    Suma a counters lo que ahorra no indexar doc: sus postings y su texto
+    comprimido (doc_text).
+    """
+    counters["near_duplicates"] += 1
+    counters["near_duplicate_postings"] += len(doc["tf"])
+    counters["near_duplicate_bytes"] += len(doc["text"])
 
-        # Evita indexar archivos vacíos
-        try:
-            if os.path.getsize(path) == 0:
-                print(f"[index_documents] Archivo vacío, omitiendo: {filename}")
-                continue
-        except Exception as e:
-            print(f"[index_documents] No se pudo verificar tamaño de {filename}: {e}")
+def add_crawl_near_duplicates(cursor, raw_dir: str) -> List[Tuple[str, int]]:
+    """
+    Asocia las URLs que el crawler descartó por casi duplicadas
+    (crawl_state.db) al doc_id de su página guardada, si está indexada.
+    Devuelve las filas (url, doc_id) añadidas a near_duplicates.
+    """
+    added = []
+    for url, canonical_url in read_near_duplicates(raw_dir):
+        if url_indexed(cursor, url):
             continue
-
-        # --- Leer HTML bruto ---
-        try:
-            with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                raw_text = f.read()
-        except Exception as e:
-            print(f"[index_documents] Error leyendo {filename}: {e}")
+        row = cursor.execute("SELECT doc_id FROM docs WHERE url=?", (canonical_url,)).fetchone()
+        if row is None:
             continue
+        cursor.execute("INSERT INTO near_duplicates(url, doc_id) VALUES (?, ?)", (url, row[0]))
+        added.append((url, row[0]))
+    return added
+
+def index_documents(
+    raw_dir: str,
+    workers: int = 1,
+    bulk: bool = False,
+    positions: bool = False,
+    memory_budget: Optional[int] = INDEX_MEMORY_BUDGET,
+    documents: Optional[List[str]] = None,
+    first_doc_id: int = 1
+):
+    """
+    Indexa todos los documentos de raw_dir (.txt y almacén de segmentos).
+    Guarda en tables: docs, doc_text, terms, postings, links, outlinks, manifest,
+    near_duplicates y meta.
+
+    workers: número de procesos que parsean y analizan documentos en
+    paralelo. La conexión SQLite sólo la usa este proceso (único escritor).
+
+    Indexación SPIMI en una sola pasada: docs, doc_text y manifest se
+    escriben según llegan; postings, posiciones y enlaces se acumulan
+    hasta memory_budget bytes (estimados), se vuelcan como runs ordenados
+    a ficheros temporales y al final se fusionan (spimi.py) para escribir
+    terms y postings en orden de término y resolver los enlaces. La memoria
+    no crece con el tamaño del corpus (None = sin límite, todo en memoria).
+
+    bulk: modo de carga masiva, con los índices secundarios desactivados
+    hasta el final (ver storage.begin_bulk_load). El contenido final del
+    índice es el mismo que sin bulk.
+
+    positions: construir también la capa posicional (tabla positions),
+    necesaria para frases y NEAR en /search.
+
+    documents y first_doc_id (índice por shards, ver shards.py): indexar
+    sólo esa parte de list_raw_documents(raw_dir). Cada documento recibe
+    first_doc_id más su posición en documents, así que los que no se
+    indexan dejan su doc_id libre (reconcile_shards puede necesitarlo).
+
+    Un documento cuyo texto es casi igual al de otro ya indexado (SimHash,
+    app/core/simhash.py) no se indexa: su URL queda en near_duplicates
+    apuntando al primero, y los enlaces hacia ella cuentan para él.
+    """
 
-        print(f">>> Encontrado TXT: {path}")
-
-        # --- Leer metadatos si existen ---
-        meta = {}
-        meta_file = path.replace(".txt", ".meta.json")
-        if os.path.exists(meta_file):
-            try:
-                with open(meta_file, "r", encoding="utf-8") as mf:
-                    meta = json.load(mf)
-            except json.JSONDecodeError:
-                meta = {}
-            except Exception as e:
-                print(f"[index_documents] JSON inválido en {meta_file}: {e}")
-
-        original_url = meta.get("url", "").strip()
-        if not original_url:
-            # Si no existe en meta, usamos filename (fallback no ideal)
-            original_url = filename
-
-        normalized_doc_url = normalize_url(original_url)
-
-        # --- Extraer texto visible ---
-        if "wikipedia.org" in normalized_doc_url:
-            visible_text = extract_visible_text_wikipedia(raw_text)
-        else:
-            visible_text = extract_visible_text(raw_text)
-
-        # --- DEBUG: información de texto visible ---
-        print(f"\n[DEBUG] Doc URL: {normalized_doc_url}")
-        print(f"[DEBUG] Visible text preview (200 chars): {visible_text[:200]}...")
-        print(f"[DEBUG] Visible text word count: {len(visible_text.split())}")
-
-        # --- Construir y normalizar texto completo para indexar ---
-        title = meta.get("title", "")
-        h1 = meta.get("h1", "")
-        description = meta.get("description", "")
-        full_text_to_index = f"{title} {h1} {description} {visible_text}"
-
-        normalized = normalize_text(full_text_to_index)
-        tokens = tokenize_text(normalized)
-
-        # --- DEBUG: tokens antes y después de filtrar ---
-        print(f"[DEBUG] Normalized tokens (first 20): {tokens[:20]}")
-        filtered = remove_stopwords(tokens)
-        print(f"[DEBUG] Filtered tokens count: {len(filtered)}")
-        print(f"[DEBUG] Filtered tokens (first 20): {filtered[:20]}\n")
-
-        if not filtered:
-            print(f"[index_documents] Sin tokens útiles en: {filename}")
-            continue
+    con = get_connection()
+    cursor = con.cursor()
 
-        # --- Evitar indexar dos veces la misma URL ---
-        cursor.execute(
-            "SELECT doc_id FROM docs WHERE url = ?",
-            (normalized_doc_url,)
-        )
-        row = cursor.fetchone()
-        if row is not None:
-            print(f"[SKIP] URL ya indexada: {normalized_doc_url}")
-            continue
+    # Todo, el borrado del índice viejo incluido, va en una sola transacción
+    # que se confirma al final: si la indexación se cancela (JobCancelled)
+    # o falla, se deshace y el índice publicado queda como estaba
+    if bulk:
+        begin_bulk_load(con, memory_budget)
+
+    # Postings, posiciones y enlaces pendientes: se vuelcan a runs
+    # ordenados en disco cuando superan memory_budget (ver spimi.py)
+    run_dir = make_run_dir()
+    postings_run = RunBuffer(run_dir, "postings")
+    positions_run = RunBuffer(run_dir, "positions")
+    outlinks_run = RunBuffer(run_dir, "outlinks")
+    buffered_bytes = 0
+
+    def flush_runs():
+        postings_run.flush()
+        positions_run.flush()
+        outlinks_run.flush()
+
+    def insert_batches(sql: str, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= INSERT_BATCH:
+                cursor.executemany(sql, batch)
+                batch.clear()
+        if batch:
+            cursor.executemany(sql, batch)
 
-        # --- Asignar doc_id ---
-        doc_id = N + 1
-        url_to_docid[normalized_doc_url] = doc_id
-        docid_to_url[doc_id] = normalized_doc_url
-        raw_html_store[doc_id] = raw_text
+    # Contadores globales
+    N = 0
+    total_len = 0
 
-        # --- Guardar en docs ---
-        doc_title = title if title else filename
-        cursor.execute(
-            "INSERT INTO docs(doc_id, url, title, path, length) VALUES (?, ?, ?, ?, ?)",
-            (doc_id, normalized_doc_url, doc_title, path, len(filtered))
-        )
-        print(f">>> Indexando doc_id={doc_id} ({filename})")
+    # Huellas SimHash de los documentos indexados y lo que ahorran los
+    # casi duplicados descartados (postings y bytes de doc_text)
+    fingerprints = SimHashIndex()
+    near_dups = {"near_duplicates": 0, "near_duplicate_postings": 0, "near_duplicate_bytes": 0}
 
-        # --- Guardar postings y contar DF ---
-        tf: Dict[str, int] = {}
-        for term in filtered:
-            tf[term] = tf.get(term, 0) + 1
+    # --- Recorrer todos los .txt en raw_dir y sus subdirectorios, y el almacén ---
+    print(">>> Recorriendo raw_dir recursivamente:", raw_dir)
 
-        for term, freq in tf.items():
+    txt_files = list_raw_documents(raw_dir) if documents is None else documents
+    print(">>> Documentos encontrados:", len(txt_files))
+
+    # Fila de manifest (path, size, mtime_ns, sha1, doc_id) para el modo incremental
+    def add_manifest(path: str, signature, sha1: Optional[str], doc_id: Optional[int]):
+        if signature:
             cursor.execute(
-                "INSERT INTO postings(term, doc_id, tf) VALUES (?, ?, ?)",
-                (term, doc_id, freq)
+                "INSERT OR REPLACE INTO manifest(path, size, mtime_ns, sha1, doc_id) VALUES (?, ?, ?, ?, ?)",
+                (path, *signature, sha1, doc_id)
             )
-            df_counts[term] = df_counts.get(term, 0) + 1
 
-        N += 1
-        total_len += len(filtered)
+    try:
+        # --- conservar PageRank por URL para el arranque en caliente ---
+        cursor.execute("""
+            INSERT OR REPLACE INTO pagerank_prev(url, rank)
+            SELECT d.url, p.rank FROM pagerank p JOIN docs d ON d.doc_id = p.doc_id
+        """)
+
+        # --- borrar índice viejo (solo datos), pero no estructura de tablas ---
+        for table in REBUILT_TABLES:
+            cursor.execute(f"DELETE FROM {table};")
+        cursor.execute("DELETE FROM meta WHERE key != 'generation';")
+
+        # --- Primera pasada: docs, texto y manifest a SQLite; postings y enlaces a los runs ---
+        analyzed = zip(txt_files, iter_analyzed_documents(txt_files, workers, positions))
+        for i, (path, doc) in enumerate(analyzed):
+            # Progreso del trabajo en segundo plano (y punto de cancelación)
+            report_progress("index", i, len(txt_files), indexed_docs=N,
+                            near_duplicates=near_dups["near_duplicates"])
+            signature = file_signature(path)
+
+            if doc is None:
+                add_manifest(path, signature, None, None)
+                continue
 
-    # ----------------------------------------------------------------
-    # Segunda pasada: extraer enlaces y guardarlos en links
-    # ----------------------------------------------------------------
+            normalized_doc_url = doc["url"]
+            filename = doc["filename"]
 
-    for doc_id, raw_html in raw_html_store.items():
-        base_url = docid_to_url[doc_id]
-        for href in extract_links(raw_html, base_url):
-            try:
-                normalized_link = normalize_url(urljoin(base_url, href))
-            except Exception:
+            # --- Evitar indexar dos veces la misma URL (índice único de docs.url) ---
+            if url_indexed(cursor, normalized_doc_url):
+                print(f"[SKIP] URL ya indexada: {normalized_doc_url}")
+                add_manifest(path, signature, doc["sha1"], None)
                 continue
 
-            if normalized_link in url_to_docid:
-                to_doc_id = url_to_docid[normalized_link]
+            # --- Casi duplicado de un documento ya indexado: se asocia su URL al documento ---
+            simhash = doc["simhash"]
+            canonical = fingerprints.find(simhash) if simhash is not None else None
+            if canonical is not None:
+                print(f"[SKIP] Casi duplicado de doc_id={canonical}: {normalized_doc_url}")
+                add_manifest(path, signature, doc["sha1"], None)
                 cursor.execute(
-                    "INSERT INTO links(from_doc_id, to_doc_id) VALUES (?, ?)",
-                    (doc_id, to_doc_id)
+                    "INSERT INTO near_duplicates(url, doc_id, path, simhash) VALUES (?, ?, ?, ?)",
+                    (normalized_doc_url, canonical, path, to_signed(simhash))
                 )
+                count_near_duplicate(near_dups, doc)
+                continue
+
+            # --- Asignar doc_id (en un shard, la posición en documents) ---
+            doc_id = first_doc_id + (N if documents is None else i)
+            add_manifest(path, signature, doc["sha1"], doc_id)
+            if simhash is not None:
+                fingerprints.add(simhash, doc_id)
+
+            # --- Guardar en docs ---
+            doc_title = doc["title"] if doc["title"] else filename
+            cursor.execute(
+                "INSERT INTO docs(doc_id, url, title, path, length, simhash) VALUES (?, ?, ?, ?, ?, ?)",
+                (doc_id, normalized_doc_url, doc_title, doc["path"], doc["length"],
+                 to_signed(simhash) if simhash is not None else None)
+            )
+            store_doc_text(cursor, doc_id, doc["text"], doc["token_offset"])
+            print(f">>> Indexando doc_id={doc_id} ({filename})")
+
+            # --- Postings, posiciones (opcional) y enlaces salientes a los runs ---
+            tf = doc["tf"]
+            postings_run.extend((term, doc_id, freq) for term, freq in tf.items())
+            buffered_bytes += len(tf) * RUN_TUPLE_BYTES + sum(map(len, tf))
+            if positions:
+                positions_run.extend((term, doc_id, data) for term, data in doc["positions"].items())
+                buffered_bytes += sum(RUN_TUPLE_BYTES + len(data) for data in doc["positions"].values())
+            outlinks_run.extend((link, doc_id) for link in doc["links"])
+            buffered_bytes += sum(RUN_TUPLE_BYTES + len(link) for link in doc["links"])
+
+            if memory_budget is not None and buffered_bytes >= memory_budget:
+                flush_runs()
+                buffered_bytes = 0
+
+            N += 1
+            total_len += doc["length"]
+
+        # ----------------------------------------------------------------
+        # Fusión de runs: postings en orden (term, doc_id). Cada término
+        # recibe el siguiente term_id (así el orden de term_id es el
+        # alfabético) y su df se cuenta sobre la marcha
+        # ----------------------------------------------------------------
+
+        terms_batch = []
+        postings_batch = []
+        for term_id, (term, group) in enumerate(groupby(postings_run.merged(), key=itemgetter(0)), 1):
+            report_progress("postings", term_id - 1, indexed_docs=N)
+            doc_freq = 0
+            for _, doc_id, tf in group:
+                postings_batch.append((term_id, doc_id, tf))
+                doc_freq += 1
+                if len(postings_batch) >= INSERT_BATCH:
+                    cursor.executemany("INSERT INTO postings(term_id, doc_id, tf) VALUES (?, ?, ?)", postings_batch)
+                    postings_batch.clear()
+            terms_batch.append((term_id, term, doc_freq))
+            if len(terms_batch) >= INSERT_BATCH:
+                cursor.executemany("INSERT INTO terms(term_id, term, df) VALUES (?, ?, ?)", terms_batch)
+                terms_batch.clear()
+        cursor.executemany("INSERT INTO postings(term_id, doc_id, tf) VALUES (?, ?, ?)", postings_batch)
+        cursor.executemany("INSERT INTO terms(term_id, term, df) VALUES (?, ?, ?)", terms_batch)
+
+        # Posiciones: salen en el mismo orden de término que terms por
+        # term_id (join por mezcla, sin diccionario término → term_id)
+        terms_by_id = con.execute("SELECT term, term_id FROM terms ORDER BY term_id")
+        insert_batches(
+            "INSERT INTO positions(term_id, doc_id, data) VALUES (?, ?, ?)",
+            join_term_ids(positions_run.merged(), terms_by_id)
+        )
+        terms_by_id.close()
 
-    # ----------------------------------------------------------------
-    # Finalmente: insertar DF y estadísticas meta (N y avgdl)
-    # ----------------------------------------------------------------
+        # ----------------------------------------------------------------
+        # Segunda pasada: resolver enlaces. Los runs de enlaces salen
+        # ordenados por URL destino y se cruzan con docs (y las URLs casi
+        # duplicadas de cada doc) ordenada por url (join por mezcla, sin
+        # diccionario URL → doc_id en memoria)
+        # ----------------------------------------------------------------
 
-    for term, df_val in df_counts.items():
+        # Casi duplicados que descartó el crawler: su URL apunta a la página guardada
+        add_crawl_near_duplicates(cursor, raw_dir)
+
+        docs_by_url = con.execute(
+            "SELECT url, doc_id FROM docs UNION ALL SELECT url, doc_id FROM near_duplicates ORDER BY url"
+        )
+        target = next(docs_by_url, None)
+        links_batch = []
+        outlinks_batch = []
+        for n_links, (url, from_doc_id) in enumerate(outlinks_run.merged()):
+            report_progress("links", n_links, indexed_docs=N)
+            while target is not None and target[0] < url:
+                target = next(docs_by_url, None)
+            # Enlaces sin resolver, necesarios para update_index
+            outlinks_batch.append((from_doc_id, url))
+            if target is not None and target[0] == url:
+                links_batch.append((from_doc_id, target[1]))
+            if len(outlinks_batch) >= INSERT_BATCH:
+                cursor.executemany("INSERT INTO outlinks(from_doc_id, url) VALUES (?, ?)", outlinks_batch)
+                cursor.executemany("INSERT INTO links(from_doc_id, to_doc_id) VALUES (?, ?)", links_batch)
+                outlinks_batch.clear()
+                links_batch.clear()
+        cursor.executemany("INSERT INTO outlinks(from_doc_id, url) VALUES (?, ?)", outlinks_batch)
+        cursor.executemany("INSERT INTO links(from_doc_id, to_doc_id) VALUES (?, ?)", links_batch)
+        # la lectura de docs puede quedar a medias (bloquearía el checkpoint)
+        docs_by_url.close()
+
+        # ----------------------------------------------------------------
+        # Finalmente: estadísticas meta (N y avgdl)
+        # ----------------------------------------------------------------
+
+        avgdl = (total_len / N) if N > 0 else 0.0
         cursor.execute(
-            "INSERT OR REPLACE INTO df(term, doc_freq) VALUES (?, ?)",
-            (term, df_val)
+            "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+            ("N", N)
+        )
+        cursor.execute(
+            "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+            ("avgdl", avgdl)
+        )
+        cursor.execute(
+            "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+            ("positions", int(positions))
         )
 
-    avgdl = (total_len / N) if N > 0 else 0.0
-    cursor.execute(
-        "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
-        ("N", N)
-    )
-    cursor.execute(
-        "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
-        ("avgdl", avgdl)
-    )
+        # --- Cotas por término para la recuperación con WAND ---
+        refresh_score_bounds(con)
+
+        # --- Publicar nueva generación (invalida la caché de /search) ---
+        bump_generation(cursor)
 
-    # --- Commit final y consolidar WAL ---
-    con.commit()
+        # --- Commit final (con la carga masiva, tras crear los índices secundarios) ---
+        if bulk:
+            end_bulk_load(con)
+        else:
+            con.commit()
+    except BaseException:
+        con.rollback()
+        if bulk:
+            restore_pragmas(con)
+        con.close()
+        raise
+    finally:
+        remove_run_dir(run_dir)
+
+    # --- Consolidar WAL ---
     con.execute("PRAGMA wal_checkpoint(FULL);")
     con.close()
 
-    return {"indexed_docs": N, "avgdl": avgdl}
\ No newline at end of file
+    print(
+        f"[index_documents] casi duplicados descartados={near_dups['near_duplicates']} "
+        f"(postings ahorrados={near_dups['near_duplicate_postings']}, "
+        f"bytes de texto ahorrados={near_dups['near_duplicate_bytes']})"
+    )
+
+    return {"indexed_docs": N, "avgdl": avgdl, **near_dups}
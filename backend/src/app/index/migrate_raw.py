@@ -0,0 +1,37 @@
+"""
+Migración de data/raw del formato de buckets (NNNNNN.txt +
+NNNNNN.meta.json) al almacén de segmentos (app/core/rawstore.py).
+
+Los documentos conservan su doc_id del crawler. Después se actualizan
+las rutas del índice (relocate_documents) para que la siguiente
+indexación incremental no reanalice nada. Con --keep no se borran los
+ficheros de los buckets ni se toca el índice.
+
+Uso:
+    python -m app.index.migrate_raw [raw_dir] [ruta_db] [--keep]
+"""
+import sys
+import time
+
+from app.core.paths import data_raw_dir
+from app.core.rawstore import list_segments, migrate_buckets, open_raw_store
+from . import storage
+from .incremental import relocate_documents
+
+if __name__ == "__main__":
+    keep = "--keep" in sys.argv
+    args = [a for a in sys.argv[1:] if a != "--keep"]
+    raw_dir = args[0] if args else data_raw_dir()
+    if len(args) > 1:
+        storage.DB_PATH = args[1]
+
+    t0 = time.perf_counter()
+    moved = migrate_buckets(raw_dir, delete=not keep)
+    store = open_raw_store(raw_dir)
+    print(
+        f"Migrados {len(moved)} documentos en {time.perf_counter() - t0:.1f}s: "
+        f"{len(store)} en el almacén, {len(list_segments(store.dir))} segmentos"
+    )
+
+    if moved and not keep:
+        print(f"Rutas actualizadas en el índice: {relocate_documents(moved)}")
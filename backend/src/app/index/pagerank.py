@@ -1,21 +1,10 @@
-import sqlite3
-import os
-from app.core.paths import data_index_dir
+import time
+from itertools import chain
+from typing import Dict, List, Optional, Tuple
 
-# === DEFINICIÓN DE RUTA GLOBAL A LA BASE DE DATOS ===
-DB_PATH = os.path.join(data_index_dir(), "ri_index.db")
+import numpy as np
 
-def get_connection():
-    """
-    Conexión SQLite a la base de datos de índice.
-    """
-    # Asegura que existe la carpeta de índice
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-
-    con = sqlite3.connect(DB_PATH)
-    # Puedes habilitar WAL si lo deseas también aquí:
-    # con.execute("PRAGMA journal_mode=WAL;")
-    return con
+from .storage import get_connection, bump_generation
 
 def load_graph():
     """
@@ -42,47 +31,169 @@ def load_graph():
     con.close()
     return graph
 
-def compute_pagerank(graph, damping=0.85, max_iter=100, tol=1.0e-6):
+def build_edge_arrays(doc_ids: np.ndarray, edges: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Calcula PageRank para el grafo dado.
+    Convierte aristas (from_doc_id, to_doc_id) en índices de nodo
+    (posiciones en doc_ids, que debe estar ordenado).
+    - descarta aristas cuyo origen o destino no está en doc_ids
+    - elimina aristas repetidas (varios <a> al mismo destino cuentan una vez)
+    Devuelve (src, dst) como arrays int64.
     """
-    nodes = list(graph.keys())
-    N = len(nodes)
-    if N == 0:
-        return {}
+    n = len(doc_ids)
+    if n == 0 or len(edges) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
 
-    # inicializa PageRank uniformemente
-    pr = {node: 1.0 / N for node in nodes}
-    base = (1.0 - damping) / N
+    src = np.searchsorted(doc_ids, edges[:, 0])
+    dst = np.searchsorted(doc_ids, edges[:, 1])
+    src_ok = (src < n) & (doc_ids[np.minimum(src, n - 1)] == edges[:, 0])
+    dst_ok = (dst < n) & (doc_ids[np.minimum(dst, n - 1)] == edges[:, 1])
+    keep = src_ok & dst_ok
 
-    for iteration in range(max_iter):
-        diff = 0.0
-        new_pr = {}
+    keys = np.unique(src[keep] * n + dst[keep])
+    return keys // n, keys % n
 
-        # calcula el nuevo PageRank
-        for node in nodes:
-            rank_sum = 0.0
-            # recorrer cada nodo posible v que enlaza a node
-            for v in nodes:
-                if node in graph[v]:
-                    outdeg = len(graph[v])
-                    if outdeg > 0:
-                        rank_sum += pr[v] / outdeg
+def load_graph_arrays() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Lee el grafo de `docs`/`links` directamente en arrays NumPy.
+    Devuelve (doc_ids ordenados, src, dst) con src/dst como índices en doc_ids.
+    """
+    con = get_connection()
+    cur = con.cursor()
 
-            new_pr[node] = base + damping * rank_sum
-            diff += abs(new_pr[node] - pr[node])
+    doc_ids = np.fromiter(
+        chain.from_iterable(cur.execute("SELECT doc_id FROM docs ORDER BY doc_id")),
+        dtype=np.int64
+    )
+    flat = np.fromiter(
+        chain.from_iterable(cur.execute("SELECT from_doc_id, to_doc_id FROM links")),
+        dtype=np.int64
+    )
+    con.close()
+
+    src, dst = build_edge_arrays(doc_ids, flat.reshape(-1, 2))
+    return doc_ids, src, dst
+
+def pagerank_arrays(
+    n: int,
+    src: np.ndarray,
+    dst: np.ndarray,
+    damping: float = 0.85,
+    max_iter: int = 100,
+    tol: float = 1.0e-6,
+    init: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, dict]:
+    """
+    PageRank por iteración de potencia sobre el grafo en forma de
+    arrays de aristas (src[i] -> dst[i], índices 0..n-1).
 
+    Cada iteración es un producto matriz dispersa-vector: la masa
+    pr[v]/outdeg(v) de cada arista se acumula en su destino con
+    np.bincount, O(aristas). La masa de los nodos colgantes (sin
+    enlaces salientes) se reparte uniformemente entre todos los nodos,
+    así que el vector siempre suma 1.
+
+    init: vector inicial opcional (se normaliza a suma 1).
+    Devuelve (pr, info) con info = {iterations, residual, converged,
+    residuals (L1 por iteración)}.
+    """
+    if n == 0:
+        return np.zeros(0), {"iterations": 0, "residual": 0.0, "converged": True, "residuals": []}
+
+    outdeg = np.bincount(src, minlength=n).astype(np.float64)
+    dangling = outdeg == 0
+    inv_out = np.divide(1.0, outdeg, out=np.zeros(n), where=~dangling)
+
+    if init is None:
+        pr = np.full(n, 1.0 / n)
+    else:
+        pr = np.asarray(init, dtype=np.float64)
+        pr = pr / pr.sum()
+
+    base = (1.0 - damping) / n
+    residuals: List[float] = []
+    converged = False
+
+    for _ in range(max_iter):
+        # masa que recibe cada nodo a través de sus enlaces entrantes
+        incoming = np.bincount(dst, weights=(pr * inv_out)[src], minlength=n)
+        dangling_mass = pr[dangling].sum()
+
+        new_pr = base + damping * (incoming + dangling_mass / n)
+
+        # convergencia en norma L1
+        diff = float(np.abs(new_pr - pr).sum())
+        residuals.append(diff)
         pr = new_pr
-        # si la diferencia total < tol → convergencia
         if diff < tol:
-            # print(f"[PageRank] Convergencia tras {iteration+1} iteraciones")
+            converged = True
             break
 
-    return pr
+    return pr, {
+        "iterations": len(residuals),
+        "residual": residuals[-1] if residuals else 0.0,
+        "converged": converged,
+        "residuals": residuals,
+    }
+
+def load_warm_start(doc_ids: np.ndarray) -> Tuple[Optional[np.ndarray], int]:
+    """
+    Construye el vector inicial a partir del PageRank guardado:
+    - primero por doc_id (tabla pagerank)
+    - si no, por URL (pagerank_prev, que sobrevive a la reindexación)
+    Los nodos sin valor previo son nuevos y reciben la masa media 1/N;
+    los conocidos conservan sus proporciones y reparten el resto.
+    Devuelve (init, nuevos) o (None, N) si no hay nada guardado.
+    """
+    n = len(doc_ids)
+    con = get_connection()
+    previous = dict(con.execute("SELECT doc_id, rank FROM pagerank"))
+    by_url = dict(con.execute("""
+        SELECT d.doc_id, pp.rank FROM pagerank_prev pp JOIN docs d ON d.url = pp.url
+    """))
+    con.close()
+
+    init = np.zeros(n)
+    known = np.zeros(n, dtype=bool)
+    for i, doc_id in enumerate(doc_ids.tolist()):
+        rank = previous.get(doc_id, by_url.get(doc_id))
+        if rank is not None and rank > 0:
+            init[i] = rank
+            known[i] = True
+
+    k = int(known.sum())
+    if k == 0:
+        return None, n
+
+    init[known] *= (k / n) / init[known].sum()
+    init[~known] = 1.0 / n
+    return init, n - k
+
+def compute_pagerank(graph, damping=0.85, max_iter=100, tol=1.0e-6):
+    """
+    Calcula PageRank para el grafo dado ({doc_id: [doc_id destino]}).
+    Usa el motor de arrays (pagerank_arrays); se mantiene esta interfaz
+    de diccionario por comodidad y para grafos pequeños.
+    """
+    nodes = sorted(graph.keys())
+    N = len(nodes)
+    if N == 0:
+        return {}
+
+    doc_ids = np.array(nodes, dtype=np.int64)
+    edges = np.array(
+        [(v, node) for v in nodes for node in graph[v]],
+        dtype=np.int64
+    ).reshape(-1, 2)
+    src, dst = build_edge_arrays(doc_ids, edges)
+
+    pr, _ = pagerank_arrays(N, src, dst, damping=damping, max_iter=max_iter, tol=tol)
+    return dict(zip(nodes, pr.tolist()))
 
 def save_pagerank(pr_scores):
     """
-    Guarda los valores de PageRank en la tabla `pagerank`.
+    Guarda los valores de PageRank en la tabla `pagerank`
+    (sustituye por completo el cálculo anterior).
     """
     con = get_connection()
     cur = con.cursor()
@@ -95,22 +206,58 @@ def save_pagerank(pr_scores):
     );
     """)
 
-    # Insertar o actualizar el ranking
-    for doc_id, score in pr_scores.items():
-        cur.execute("""
-        INSERT OR REPLACE INTO pagerank(doc_id, rank)
-        VALUES (?,?)
-        """, (doc_id, score))
+    cur.execute("DELETE FROM pagerank")
+    cur.execute("DELETE FROM pagerank_prev")
+    cur.executemany(
+        "INSERT OR REPLACE INTO pagerank(doc_id, rank) VALUES (?, ?)",
+        pr_scores.items()
+    )
+    bump_generation(cur)
+
+    con.commit()
+    con.close()
 
+def save_pagerank_stats(info: dict):
+    """
+    Guarda en `meta` el resumen de la última ejecución de PageRank.
+    """
+    con = get_connection()
+    con.executemany(
+        "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+        [
+            ("pagerank_iterations", info["iterations"]),
+            ("pagerank_residual", info["residual"]),
+            ("pagerank_seconds", info["seconds"]),
+            ("pagerank_warm_start", int(info["warm_start"])),
+            ("pagerank_new_nodes", info["new_nodes"]),
+        ]
+    )
     con.commit()
     con.close()
 
-def run_pagerank(verbose: bool = False):
+def pagerank_stats() -> Dict[str, float]:
+    """
+    Devuelve el resumen de la última ejecución de PageRank
+    (iteraciones, residuo L1 final, segundos de cálculo, si arrancó
+    en caliente y cuántos nodos no tenían valor previo).
+    """
+    con = get_connection()
+    rows = con.execute(
+        "SELECT key, value FROM meta WHERE key LIKE 'pagerank_%'"
+    ).fetchall()
+    con.close()
+    return {key[len("pagerank_"):]: value for key, value in rows}
+
+def run_pagerank(verbose: bool = False, warm_start: bool = False):
     """
     Función principal para ejecutar todo el flujo de PageRank:
       1) Cargar grafo
       2) Calcular PageRank si hay datos
       3) Guardar resultados en la base de datos
+
+    warm_start: parte del PageRank guardado (ver load_warm_start) en
+    lugar del vector uniforme; tras un recrawl pequeño converge en
+    muchas menos iteraciones.
     """
 
     try:
@@ -118,26 +265,42 @@ def run_pagerank(verbose: bool = False):
         if verbose:
             print("[PageRank] Cargando grafo de enlaces desde la base de datos...")
 
-        graph = load_graph()
+        doc_ids, src, dst = load_graph_arrays()
 
         # === 2) Chequeo de nodos antes de calcular ===
-        if not graph:
+        if len(doc_ids) == 0:
             if verbose:
                 print("[PageRank] No hay nodos en el grafo. Saltando cálculo.")
             return {}
-        
+
         if verbose:
-            print(f"[PageRank] Número de nodos en grafo: {len(graph)}")
+            print(f"[PageRank] Número de nodos en grafo: {len(doc_ids)}, aristas: {len(src)}")
             print("[PageRank] Calculando PageRank…")
 
         # === 3) Calcular PageRank ===
-        pr_scores = compute_pagerank(graph)
+        t0 = time.perf_counter()
+        init, new_nodes = load_warm_start(doc_ids) if warm_start else (None, len(doc_ids))
+        pr, info = pagerank_arrays(len(doc_ids), src, dst, init=init)
+        info["seconds"] = time.perf_counter() - t0
+        info["warm_start"] = init is not None
+        info["new_nodes"] = new_nodes
+
+        if verbose:
+            estado = "convergencia" if info["converged"] else "sin convergencia"
+            arranque = f"en caliente, {new_nodes} nodos nuevos" if init is not None else "en frío"
+            print(
+                f"[PageRank] {estado} tras {info['iterations']} iteraciones "
+                f"(arranque {arranque}, residuo L1={info['residual']:.2e}, {info['seconds']:.3f}s)"
+            )
+
+        pr_scores = dict(zip(doc_ids.tolist(), pr.tolist()))
 
         # === 4) Guardar en la base de datos ===
         if verbose:
             print("[PageRank] Guardando PageRank en la base de datos…")
 
         save_pagerank(pr_scores)
+        save_pagerank_stats(info)
 
         if verbose:
             print("[PageRank] Proceso finalizado con éxito.")
@@ -149,4 +312,4 @@ def run_pagerank(verbose: bool = False):
         if verbose:
             print(f"[PageRank] Error al ejecutar PageRank: {e}")
         # Devolver diccionario vacío para no romper
-        return {}
\ No newline at end of file
+        return {}
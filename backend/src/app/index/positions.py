@@ -0,0 +1,167 @@
+"""
+Capa opcional de postings posicionales (tabla positions).
+
+Para cada (término, documento) se guardan las posiciones del término
+en la secuencia de tokens del texto indexado (título, h1, descripción
+y texto visible, antes de quitar stopwords), como huecos entre
+posiciones consecutivas codificados en varint. Las stopwords no tienen
+posiciones, pero ocupan su hueco: "sistema de información" guarda
+sistema → p y información → p + 2.
+
+Sobre esta capa se evalúan frases ("...") y proximidad (a NEAR/k b).
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Las posiciones se guardan por term_id; las consultas llegan con el término
+TERM_ID = "(SELECT term_id FROM terms WHERE term=?)"
+
+def encode_positions(positions: List[int]) -> bytes:
+    """
+    Codifica una lista creciente de posiciones como huecos en varint.
+    """
+    out = bytearray()
+    prev = 0
+    for p in positions:
+        gap = p - prev
+        prev = p
+        while gap >= 0x80:
+            out.append((gap & 0x7F) | 0x80)
+            gap >>= 7
+        out.append(gap)
+    return bytes(out)
+
+def decode_positions(blob: bytes) -> List[int]:
+    """
+    Inversa de encode_positions.
+    """
+    positions = []
+    pos = 0
+    value = 0
+    shift = 0
+    for byte in blob:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        pos += value
+        positions.append(pos)
+        value = 0
+        shift = 0
+    return positions
+
+def term_positions(tokens: List[str], keep: Set[str]) -> Dict[str, bytes]:
+    """
+    Posiciones codificadas de cada término de keep dentro de tokens.
+    """
+    found: Dict[str, List[int]] = {}
+    for i, token in enumerate(tokens):
+        if token in keep:
+            found.setdefault(token, []).append(i)
+    return {term: encode_positions(plist) for term, plist in found.items()}
+
+def has_positions(cursor) -> bool:
+    """
+    Indica si el índice actual se construyó con posiciones.
+    """
+    row = cursor.execute("SELECT value FROM meta WHERE key='positions'").fetchone()
+    return bool(row and row[0])
+
+def load_positions(cursor, term: str, doc_ids: Optional[Iterable[int]] = None) -> Dict[int, List[int]]:
+    """
+    {doc_id: posiciones} del término, opcionalmente sólo en doc_ids.
+    """
+    if doc_ids is None:
+        rows = cursor.execute(f"SELECT doc_id, data FROM positions WHERE term_id={TERM_ID}", (term,))
+    else:
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return {}
+        placeholders = ",".join("?" * len(doc_ids))
+        rows = cursor.execute(
+            f"SELECT doc_id, data FROM positions WHERE term_id={TERM_ID} AND doc_id IN ({placeholders})",
+            [term, *doc_ids]
+        )
+    return {doc_id: decode_positions(blob) for doc_id, blob in rows.fetchall()}
+
+def load_doc_positions(cursor, doc_ids: List[int], terms: List[str]) -> Dict[int, List[int]]:
+    """
+    {doc_id: posiciones ordenadas de cualquiera de terms} para una
+    página de resultados, en una sola consulta (para los snippets).
+    """
+    if not doc_ids or not terms:
+        return {}
+    rows = cursor.execute(
+        f"SELECT doc_id, data FROM positions "
+        f"WHERE doc_id IN ({','.join('?' * len(doc_ids))}) "
+        f"AND term_id IN (SELECT term_id FROM terms WHERE term IN ({','.join('?' * len(terms))}))",
+        [*doc_ids, *terms]
+    ).fetchall()
+
+    result: Dict[int, List[int]] = {}
+    for doc_id, blob in rows:
+        result.setdefault(doc_id, []).extend(decode_positions(blob))
+    for plist in result.values():
+        plist.sort()
+    return result
+
+def phrase_docs(cursor, phrase: List[Tuple[str, int]]) -> Set[int]:
+    """
+    Documentos que contienen la frase, dada como [(término, desplazamiento
+    relativo)]. Se parte del término con menos documentos y se comprueban
+    los demás sólo en los documentos supervivientes.
+    """
+    if not phrase:
+        return set()
+
+    counts = {
+        term: cursor.execute(f"SELECT COUNT(*) FROM positions WHERE term_id={TERM_ID}", (term,)).fetchone()[0]
+        for term, _ in phrase
+    }
+    ordered = sorted(phrase, key=lambda item: counts[item[0]])
+
+    first_term, first_offset = ordered[0]
+    # inicios de frase posibles por documento
+    starts = {
+        doc_id: {p - first_offset for p in plist}
+        for doc_id, plist in load_positions(cursor, first_term).items()
+    }
+
+    for term, offset in ordered[1:]:
+        if not starts:
+            break
+        found = load_positions(cursor, term, starts.keys())
+        surviving = {}
+        for doc_id, candidates in starts.items():
+            if doc_id not in found:
+                continue
+            matched = candidates & {p - offset for p in found[doc_id]}
+            if matched:
+                surviving[doc_id] = matched
+        starts = surviving
+
+    return set(starts)
+
+def near_docs(cursor, left: str, right: str, k: int) -> Set[int]:
+    """
+    Documentos donde left y right aparecen a k posiciones o menos
+    (en cualquier orden).
+    """
+    left_pos = load_positions(cursor, left)
+    if not left_pos:
+        return set()
+    right_pos = load_positions(cursor, right, left_pos.keys())
+
+    result = set()
+    for doc_id, rights in right_pos.items():
+        lefts = left_pos[doc_id]
+        i = j = 0
+        # recorrido de mezcla de las dos listas ordenadas
+        while i < len(lefts) and j < len(rights):
+            if abs(lefts[i] - rights[j]) <= k:
+                result.add(doc_id)
+                break
+            if lefts[i] < rights[j]:
+                i += 1
+            else:
+                j += 1
+    return result
@@ -0,0 +1,89 @@
+"""
+Análisis de la consulta de /search con operadores posicionales:
+
+- "frase exacta"      → los términos, consecutivos y en orden
+                        (las stopwords de la frase cuentan como hueco)
+- palabra NEAR/k otra → ambas a k posiciones o menos, en cualquier orden
+                        (NEAR sin /k usa NEAR_DEFAULT)
+
+El resto del texto se procesa como siempre. Todos los términos, también
+los de frases y NEAR, participan en el ranking BM25; los operadores sólo
+restringen qué documentos pueden aparecer.
+"""
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.core.textproc import get_analyzer, remove_stopwords
+from .positions import phrase_docs, near_docs
+
+PHRASE_RE = re.compile(r'"([^"]*)"')
+NEAR_RE = re.compile(r"NEAR(?:/(\d+))?")
+
+# Distancia de NEAR cuando no se indica /k
+NEAR_DEFAULT = 10
+
+def analyze_query_text(text: str) -> List[str]:
+    """
+    Tokens de un fragmento de consulta (sin quitar stopwords).
+    """
+    return get_analyzer().tokens(text)
+
+def is_query_term(token: str) -> bool:
+    """
+    Mismo criterio que remove_stopwords, para un token suelto.
+    """
+    return bool(remove_stopwords([token]))
+
+def parse_query(query: str) -> Dict[str, list]:
+    """
+    Devuelve {terms, phrases, nears}:
+    - terms: términos para BM25 (como antes, sin stopwords)
+    - phrases: [[(término, desplazamiento relativo), ...], ...]
+    - nears: [(término, término, k), ...]
+    """
+    phrase_terms: List[str] = []
+    phrases: List[List[Tuple[str, int]]] = []
+    for text in PHRASE_RE.findall(query):
+        tokens = analyze_query_text(text)
+        phrase = [(t, i) for i, t in enumerate(tokens) if is_query_term(t)]
+        if phrase:
+            first = phrase[0][1]
+            phrases.append([(t, i - first) for t, i in phrase])
+            phrase_terms.extend(t for t, _ in phrase)
+    rest = PHRASE_RE.sub(" ", query)
+
+    # NEAR une la palabra anterior y la siguiente (admite cadenas: a NEAR b NEAR c)
+    words = rest.split()
+    nears: List[Tuple[str, str, int]] = []
+    for i, word in enumerate(words):
+        match = NEAR_RE.fullmatch(word)
+        if not match or i == 0 or i == len(words) - 1:
+            continue
+        left = [t for t in analyze_query_text(words[i - 1]) if is_query_term(t)]
+        right = [t for t in analyze_query_text(words[i + 1]) if is_query_term(t)]
+        if left and right:
+            k = int(match.group(1)) if match.group(1) else NEAR_DEFAULT
+            nears.append((left[-1], right[0], k))
+    rest = " ".join(w for w in words if not NEAR_RE.fullmatch(w))
+
+    terms = remove_stopwords(analyze_query_text(rest)) + phrase_terms
+    return {"terms": terms, "phrases": phrases, "nears": nears}
+
+def has_operators(parsed: Dict[str, list]) -> bool:
+    return bool(parsed["phrases"] or parsed["nears"])
+
+def matching_docs(cursor, parsed: Dict[str, list]) -> Optional[Set[int]]:
+    """
+    Documentos que cumplen todas las frases y NEAR de la consulta
+    (intersección), o None si la consulta no tiene operadores.
+    """
+    result: Optional[Set[int]] = None
+    constraints = [(phrase_docs, (phrase,)) for phrase in parsed["phrases"]]
+    constraints += [(near_docs, near) for near in parsed["nears"]]
+
+    for fn, args in constraints:
+        docs = fn(cursor, *args)
+        result = docs if result is None else result & docs
+        if not result:
+            return set()
+    return result
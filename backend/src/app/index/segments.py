@@ -0,0 +1,394 @@
+"""
+Formato binario alternativo del índice invertido ("segmentos").
+
+La tabla `postings` repite el término en cada fila y necesita un
+recorrido de B-tree por lista. Un segmento guarda lo mismo de forma
+compacta en un directorio (por defecto data/index/segments):
+
+- postings.seg: por cada término, dos bloques contiguos codificados en
+  varint (7 bits por byte, bit alto = continúa):
+    * doc_ids en forma de deltas (el primero respecto a 0)
+    * tf de cada posting
+- terms.bin: términos en orden (UTF-8, separados por NUL)
+- lexicon.npy: una fila por término (df, offset, bytes de doc_ids,
+  bytes de tf, max_score) en el mismo orden que terms.bin
+- doclen.npy: longitud de cada documento indexada por doc_id
+- segment.json: N, avgdl, bound_avgdl, versión del formato,
+  generación del índice de la que sale y un identificador de la
+  conversión (build_id)
+
+postings.seg se abre con mmap y los bloques se leen con
+np.frombuffer sobre el mapa (sin copiar); la decodificación varint
+está vectorizada con NumPy.
+"""
+import json
+import mmap
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from itertools import groupby
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from . import storage
+
+SEGMENT_VERSION = 1
+
+LEXICON_DTYPE = np.dtype([
+    ("df", np.int64),
+    ("offset", np.int64),
+    ("doc_bytes", np.int64),
+    ("tf_bytes", np.int64),
+    ("max_score", np.float64),
+])
+
+# Postings leídos de SQLite por lote durante la conversión
+CONVERT_BATCH = 100_000
+
+def default_segment_dir() -> str:
+    """
+    Directorio de segmentos junto a la base de datos actual
+    (se evalúa en cada llamada, como storage.DB_PATH).
+    """
+    return os.path.join(os.path.dirname(storage.DB_PATH), "segments")
+
+# ======================================================
+# Codificación varint vectorizada
+# ======================================================
+
+def varint_encode(values: np.ndarray) -> bytes:
+    """
+    Codifica enteros no negativos en varint (little-endian, 7 bits por
+    byte). Vectorizado: una pasada por cada byte posible, no por valor.
+    """
+    v = np.asarray(values, dtype=np.uint64)
+    if len(v) == 0:
+        return b""
+
+    nbytes = np.ones(len(v), dtype=np.int64)
+    for k in range(1, 10):
+        nbytes += v >= np.uint64(1 << (7 * k))
+
+    starts = np.zeros(len(v), dtype=np.int64)
+    np.cumsum(nbytes[:-1], out=starts[1:])
+    out = np.empty(int(nbytes.sum()), dtype=np.uint8)
+
+    for k in range(int(nbytes.max())):
+        mask = nbytes > k
+        chunk = (v[mask] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (nbytes[mask] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[mask] + k] = (chunk | more).astype(np.uint8)
+
+    return out.tobytes()
+
+def varint_decode(buf: np.ndarray) -> np.ndarray:
+    """
+    Decodifica un array uint8 de varints a int64. Cada valor termina en
+    el primer byte con el bit alto a 0; los trozos de 7 bits se
+    desplazan según su posición y se suman por valor con reduceat.
+    """
+    if len(buf) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    ends = buf < 0x80
+    value_starts = np.zeros(int(ends.sum()), dtype=np.int64)
+    value_starts[1:] = np.flatnonzero(ends)[:-1] + 1
+
+    if len(value_starts) == len(buf):
+        # caso habitual: todos los valores caben en un byte
+        return buf.astype(np.int64)
+
+    owner = np.zeros(len(buf), dtype=np.int64)
+    owner[value_starts[1:]] = 1
+    np.cumsum(owner, out=owner)
+    shift = (np.arange(len(buf), dtype=np.int64) - value_starts[owner]) * 7
+
+    parts = (buf & 0x7F).astype(np.int64) << shift
+    return np.add.reduceat(parts, value_starts)
+
+# ======================================================
+# Escritura (conversión desde SQLite)
+# ======================================================
+
+def convert_db_to_segments(out_dir: Optional[str] = None, con=None) -> Dict[str, float]:
+    """
+    Convierte el índice SQLite actual (terms, postings, docs, meta) en un
+    segmento. Se escribe en un directorio temporal; al terminar el
+    anterior se aparta a <out_dir>.old, el nuevo ocupa su sitio con
+    os.replace y sólo entonces se borra el viejo, así los lectores nunca
+    ven uno a medias (en el instante entre los dos renombrados
+    get_segment_reader lee el apartado).
+    Devuelve {terms, postings, bytes, seconds}.
+    """
+    out_dir = out_dir or default_segment_dir()
+    tmp_dir = out_dir + ".tmp"
+    old_dir = out_dir + ".old"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    own_connection = con is None
+    if own_connection:
+        con = storage.get_connection()
+    cur = con.cursor()
+    t0 = time.perf_counter()
+
+    stats = dict(cur.execute("SELECT key, value FROM meta"))
+    # generación que tendrá el índice al publicar el segmento (ver abajo)
+    generation = int(stats.get("generation", 0)) + 1
+
+    # --- longitudes de documento indexadas por doc_id ---
+    lengths = cur.execute("SELECT doc_id, length FROM docs").fetchall()
+    max_doc = max((doc_id for doc_id, _ in lengths), default=0)
+    doclen = np.zeros(max_doc + 1, dtype=np.float64)
+    for doc_id, length in lengths:
+        doclen[doc_id] = length or 0
+    np.save(os.path.join(tmp_dir, "doclen.npy"), doclen)
+
+    # --- postings en orden (term_id, doc_id): la clave primaria ---
+    terms = []
+    lexicon = []
+    offset = 0
+    n_postings = 0
+
+    def rows():
+        q = cur.execute("""
+            SELECT t.term, p.doc_id, p.tf, t.max_score
+            FROM postings p JOIN terms t ON t.term_id = p.term_id
+            ORDER BY p.term_id, p.doc_id
+        """)
+        while True:
+            batch = q.fetchmany(CONVERT_BATCH)
+            if not batch:
+                return
+            yield from batch
+
+    with open(os.path.join(tmp_dir, "postings.seg"), "wb") as f:
+        for term, group in groupby(rows(), key=lambda r: r[0]):
+            group = list(group)
+            doc_ids = np.fromiter((r[1] for r in group), dtype=np.int64, count=len(group))
+            tfs = np.fromiter((r[2] for r in group), dtype=np.int64, count=len(group))
+
+            doc_block = varint_encode(np.diff(doc_ids, prepend=0))
+            tf_block = varint_encode(tfs)
+            f.write(doc_block)
+            f.write(tf_block)
+
+            max_score = group[0][3]
+            terms.append(term)
+            lexicon.append((
+                len(group), offset, len(doc_block), len(tf_block),
+                np.nan if max_score is None else max_score
+            ))
+            offset += len(doc_block) + len(tf_block)
+            n_postings += len(group)
+
+    if own_connection:
+        con.close()
+
+    with open(os.path.join(tmp_dir, "terms.bin"), "wb") as f:
+        f.write("\0".join(terms).encode("utf-8"))
+    np.save(os.path.join(tmp_dir, "lexicon.npy"), np.array(lexicon, dtype=LEXICON_DTYPE))
+
+    with open(os.path.join(tmp_dir, "segment.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "version": SEGMENT_VERSION,
+            "N": stats.get("N", 0),
+            "avgdl": stats.get("avgdl", 1),
+            "bound_avgdl": stats.get("bound_avgdl"),
+            "terms": len(terms),
+            "postings": n_postings,
+            "generation": generation,
+            "build_id": uuid.uuid4().hex,
+        }, f)
+
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    # el nuevo segmento cambia los resultados de source="segments"
+    con = storage.get_connection()
+    storage.bump_generation(con.cursor())
+    con.commit()
+    con.close()
+
+    return {
+        "terms": len(terms),
+        "postings": n_postings,
+        "bytes": segment_size(out_dir),
+        "seconds": time.perf_counter() - t0,
+    }
+
+def segment_size(seg_dir: str) -> int:
+    """
+    Tamaño total en disco de los archivos del segmento.
+    """
+    return sum(
+        os.path.getsize(os.path.join(seg_dir, name))
+        for name in os.listdir(seg_dir)
+    )
+
+# ======================================================
+# Lectura
+# ======================================================
+
+class SegmentReader:
+    """
+    Acceso de sólo lectura a un segmento. postings.seg queda mapeado en
+    memoria y doclen.npy se abre con mmap_mode='r'; el diccionario de
+    términos se carga en un dict término -> fila de lexicon.
+    Los lectores de get_segment_reader se comparten entre hilos con un
+    contador de referencias: se cierran con el último release().
+    """
+
+    def __init__(self, seg_dir: str):
+        self.seg_dir = seg_dir
+        self._refs = 1
+
+        with open(os.path.join(seg_dir, "segment.json"), encoding="utf-8") as f:
+            self.info = json.load(f)
+        if self.info.get("version") != SEGMENT_VERSION:
+            raise ValueError(f"Versión de segmento no soportada: {self.info.get('version')}")
+
+        self.N = self.info["N"]
+        self.avgdl = self.info["avgdl"]
+        self.generation = self.info.get("generation", 0)
+        self.build_id = self.info.get("build_id")
+
+        self.lexicon = np.load(os.path.join(seg_dir, "lexicon.npy"))
+        with open(os.path.join(seg_dir, "terms.bin"), "rb") as f:
+            raw = f.read().decode("utf-8")
+        self.terms = {term: i for i, term in enumerate(raw.split("\0"))} if raw else {}
+
+        self.doclen = np.load(os.path.join(seg_dir, "doclen.npy"), mmap_mode="r")
+
+        self._file = open(os.path.join(seg_dir, "postings.seg"), "rb")
+        if os.fstat(self._file.fileno()).st_size > 0:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._data = np.frombuffer(self._map, dtype=np.uint8)
+        else:
+            self._map = None
+            self._data = np.zeros(0, dtype=np.uint8)
+
+    def doc_freq(self, term: str) -> Optional[int]:
+        i = self.terms.get(term)
+        return None if i is None else int(self.lexicon["df"][i])
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (doc_id, tf, dl) del término, ordenados por doc_id, con los mismos
+        tipos que bm25.fetch_postings. Los bloques se leen como vistas
+        del mmap; sólo la decodificación crea arrays nuevos.
+        """
+        i = self.terms.get(term)
+        if i is None:
+            empty = np.zeros(0)
+            return empty.astype(np.int64), empty, empty
+
+        row = self.lexicon[i]
+        start = int(row["offset"])
+        mid = start + int(row["doc_bytes"])
+        end = mid + int(row["tf_bytes"])
+
+        doc_ids = np.cumsum(varint_decode(self._data[start:mid]))
+        tf = varint_decode(self._data[mid:end]).astype(np.float64)
+        dl = np.asarray(self.doclen[doc_ids])
+        return doc_ids, tf, dl
+
+    def release(self):
+        """
+        Suelta una referencia; la última cierra el lector.
+        """
+        with _readers_lock:
+            self._refs -= 1
+            last = self._refs == 0
+        if last:
+            self.close()
+
+    def close(self):
+        # las vistas de NumPy deben soltarse antes de cerrar el mmap
+        self._data = None
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+# directorio -> lector vigente (el registro guarda una referencia)
+_readers: Dict[str, SegmentReader] = {}
+_readers_lock = threading.Lock()
+
+def read_build_id(seg_dir: str) -> Optional[str]:
+    """
+    build_id de segment.json, o None si el directorio no tiene segmento.
+    """
+    try:
+        with open(os.path.join(seg_dir, "segment.json"), encoding="utf-8") as f:
+            return json.load(f).get("build_id")
+    except FileNotFoundError:
+        return None
+
+def get_segment_reader(seg_dir: Optional[str] = None, generation: Optional[int] = None) -> SegmentReader:
+    """
+    Lector compartido por proceso, con una referencia para el llamador
+    (hay que devolverla con release()). Se reabre si el build_id de
+    segment.json cambió (nueva conversión) y el anterior se cierra
+    cuando lo suelta su último usuario.
+    generation: generación actual del índice; si el segmento es de una
+    anterior (se reindexó sin regenerarlo) lanza ValueError, porque sus
+    doc_id ya no corresponden a los de docs.
+    Lanza FileNotFoundError si no hay segmento.
+    """
+    seg_dir = seg_dir or default_segment_dir()
+    # durante la sustitución el segmento vigente puede estar apartado en .old
+    path = seg_dir
+    build_id = read_build_id(seg_dir)
+    if build_id is None:
+        path = seg_dir + ".old"
+        build_id = read_build_id(path)
+    if build_id is None:
+        raise FileNotFoundError(f"No hay segmento en {seg_dir}")
+
+    with _readers_lock:
+        reader = _readers.get(seg_dir)
+        if reader is not None and reader.build_id == build_id:
+            reader._refs += 1
+        else:
+            reader = None
+    if reader is None:
+        fresh = SegmentReader(path)
+        with _readers_lock:
+            reader = _readers.get(seg_dir)
+            if reader is not None and reader.build_id == build_id:
+                # otro hilo lo abrió mientras tanto
+                reader._refs += 1
+                stale, fresh = fresh, None
+            else:
+                stale, reader = reader, fresh
+                _readers[seg_dir] = reader
+                reader._refs += 1
+        if stale is not None:
+            stale.release()
+
+    if generation is not None and reader.generation < generation:
+        segment_generation = reader.generation
+        reader.release()
+        raise ValueError(
+            f"El segmento de {seg_dir} es de una generación anterior del índice "
+            f"({segment_generation} < {generation}): regenéralo con \"segments\": true en /index "
+            f"o con python -m app.index.segments"
+        )
+    return reader
+
+if __name__ == "__main__":
+    # python -m app.index.segments [ruta_db] [directorio_salida]
+    if len(sys.argv) > 1:
+        storage.DB_PATH = sys.argv[1]
+    result = convert_db_to_segments(sys.argv[2] if len(sys.argv) > 2 else None)
+    print(
+        f"Segmento escrito: {result['terms']} términos, {result['postings']} postings, "
+        f"{result['bytes']} bytes en {result['seconds']:.1f}s"
+    )
@@ -0,0 +1,495 @@
+"""
+Índice repartido en shards por rangos de doc_id.
+
+El corpus se divide en N shards de buckets consecutivos del crawler
+(BUCKET_SIZE doc_id por bucket) y cada shard es una base de datos
+independiente con el esquema de siempre (shards/shard-NNN.db junto a
+ri_index.db):
+
+- build_shards: construye los shards en paralelo, un proceso por shard
+  (index_documents sobre su parte de list_raw_documents). Los doc_id
+  son globales: cada documento recibe su posición en el corpus, así
+  que conservan el orden del índice único
+- reconcile_shards: cada proceso sólo ve sus documentos; después se
+  quitan de cada shard las URLs repetidas y los casi duplicados de
+  documentos de shards anteriores, y se indexan los casi duplicados que
+  dejan de serlo, como en un índice sin repartir
+- run_shards_pagerank: PageRank sobre el grafo de todos los shards (los
+  enlaces entre shards se resuelven por URL)
+- bm25_score_shards: consulta los shards en paralelo (hilos) con N,
+  avgdl y df de toda la colección y fusiona sus top-k, así que las
+  puntuaciones son las del índice sin repartir
+
+Los shards no admiten indexación incremental: se reconstruyen enteros.
+
+Uso:
+    python -m app.index.shards raw_dir n_shards [directorio_shards]
+"""
+import glob
+import heapq
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.core.crawler import BUCKET_SIZE
+from app.core.jobs import PROGRESS_INTERVAL, report_progress
+from app.core.rawstore import parse_store_key
+from app.core.simhash import SimHashIndex, to_unsigned
+from . import storage
+from .bm25 import BM25_B, BM25_K1, bm25_score, lookup_terms, refresh_score_bounds
+from .incremental import add_document, remove_document
+from .indexer import INDEX_MEMORY_BUDGET, analyze_document, index_documents, list_raw_documents
+from .pagerank import build_edge_arrays, pagerank_arrays
+from .positions import has_positions
+from .query import matching_docs
+from .storage import ReadConnection, bump_generation, get_connection, get_read_connection
+
+SHARD_PATTERN = "shard-*.db"
+
+# Hilos que consultan shards a la vez (compartidos por todas las consultas)
+SHARD_QUERY_WORKERS = os.cpu_count() or 4
+
+def default_shard_dir() -> str:
+    """
+    Directorio de shards junto a la base de datos actual
+    (se evalúa en cada llamada, como storage.DB_PATH).
+    """
+    return os.path.join(os.path.dirname(storage.DB_PATH), "shards")
+
+def shard_path(shard_dir: str, shard_no: int) -> str:
+    return os.path.join(shard_dir, f"shard-{shard_no:03d}.db")
+
+def shard_paths(shard_dir: Optional[str] = None) -> List[str]:
+    """
+    Bases de datos de los shards, en orden de doc_id.
+    """
+    return sorted(glob.glob(os.path.join(shard_dir or default_shard_dir(), SHARD_PATTERN)))
+
+# ======================================================
+# Construcción
+# ======================================================
+
+def crawler_doc_id(path: str) -> Optional[int]:
+    """
+    doc_id del crawler de un documento: el del almacén de segmentos o el
+    número del fichero NNNNNN.txt. None si no se puede saber.
+    """
+    stored = parse_store_key(path)
+    if stored is not None:
+        return stored[1]
+    stem = os.path.basename(path).split(".")[0]
+    return int(stem) if stem.isdigit() else None
+
+def plan_shards(documents: List[str], n_shards: int) -> List[dict]:
+    """
+    Reparte documents (en orden de list_raw_documents) en como mucho
+    n_shards rangos de buckets consecutivos con un número parecido de
+    documentos. Un bucket nunca se parte entre dos shards.
+    Devuelve [{documents, first_doc_id, first_bucket, last_bucket}].
+    """
+    # grupos de documentos consecutivos del mismo bucket
+    groups: List[Tuple[int, List[str]]] = []
+    bucket = 0
+    for path in documents:
+        doc_id = crawler_doc_id(path)
+        if doc_id is not None:
+            bucket = doc_id // BUCKET_SIZE
+        if not groups or groups[-1][0] != bucket:
+            groups.append((bucket, []))
+        groups[-1][1].append(path)
+
+    shards: List[dict] = []
+    target = len(documents) / max(1, n_shards)
+    assigned = 0
+    for bucket, paths in groups:
+        # bucket al shard siguiente si más de la mitad cae tras el objetivo del actual
+        if not shards or (assigned + len(paths) / 2 > target * len(shards) and len(shards) < n_shards):
+            shards.append({
+                "documents": [], "first_doc_id": assigned + 1,
+                "first_bucket": bucket, "last_bucket": bucket,
+            })
+        shards[-1]["documents"].extend(paths)
+        shards[-1]["last_bucket"] = bucket
+        assigned += len(paths)
+    return shards
+
+def build_shard(task: dict) -> dict:
+    """
+    Construye un shard (se ejecuta en un proceso del pool de build_shards).
+    """
+    t0 = time.perf_counter()
+    storage.DB_PATH = task["db_path"]
+    storage.init_db()
+    stats = index_documents(
+        task["raw_dir"], bulk=task["bulk"], positions=task["positions"],
+        memory_budget=task["memory_budget"], documents=task["documents"],
+        first_doc_id=task["first_doc_id"]
+    )
+    return {**stats, "db_path": task["db_path"], "seconds": time.perf_counter() - t0}
+
+def remove_shard_files(path: str):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def build_shards(raw_dir: str, n_shards: int, processes: Optional[int] = None, bulk: bool = True,
+                 positions: bool = False, memory_budget: Optional[int] = INDEX_MEMORY_BUDGET,
+                 shard_dir: Optional[str] = None) -> dict:
+    """
+    Construye el índice por shards de raw_dir en shard_dir (por defecto
+    default_shard_dir()), con hasta `processes` shards a la vez (None =
+    uno por núcleo). memory_budget es el total: cada proceso recibe su
+    parte. Se reutilizan los ficheros de una construcción anterior (su
+    generación sigue creciendo) y se borran los shards que sobren.
+    """
+    shard_dir = shard_dir or default_shard_dir()
+    os.makedirs(shard_dir, exist_ok=True)
+    t0 = time.perf_counter()
+
+    plan = plan_shards(list_raw_documents(raw_dir), n_shards)
+    paths = [shard_path(shard_dir, i) for i in range(len(plan))]
+    for stale in shard_paths(shard_dir)[len(plan):]:
+        remove_shard_files(stale)
+
+    processes = min(processes or os.cpu_count() or 1, max(1, len(plan)))
+    tasks = [
+        {
+            "raw_dir": raw_dir, "db_path": path, "documents": shard["documents"],
+            "first_doc_id": shard["first_doc_id"], "bulk": bulk, "positions": positions,
+            "memory_budget": memory_budget // processes if memory_budget else memory_budget,
+        }
+        for path, shard in zip(paths, plan)
+    ]
+    print(f">>> Construyendo {len(tasks)} shards con {processes} procesos")
+
+    # spawn: los procesos no heredan la conexión del trabajo en segundo plano
+    results: Dict[str, dict] = {}
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        pending = pool.imap_unordered(build_shard, tasks)
+        while len(results) < len(tasks):
+            report_progress("shards", len(results), len(tasks))
+            try:
+                result = pending.next(timeout=PROGRESS_INTERVAL)
+            except multiprocessing.TimeoutError:
+                continue
+            results[result["db_path"]] = result
+            print(f">>> Shard {os.path.basename(result['db_path'])}: {result['indexed_docs']} documentos")
+
+    report_progress("reconcile", 0)
+    reconciled = reconcile_shards(paths, plan)
+
+    shards = []
+    for path, shard in zip(paths, plan):
+        shards.append({
+            "path": path,
+            "buckets": [shard["first_bucket"], shard["last_bucket"]],
+            "first_doc_id": shard["first_doc_id"],
+            "indexed_docs": reconciled["docs"][path],
+            "seconds": results[path]["seconds"],
+        })
+    N = sum(shard["indexed_docs"] for shard in shards)
+    return {
+        "indexed_docs": N,
+        "avgdl": reconciled["total_len"] / N if N else 0.0,
+        "shards": shards,
+        "cross_shard_duplicates": reconciled["removed"],
+        "restored_near_duplicates": reconciled["restored"],
+        "near_duplicates": sum(r["near_duplicates"] for r in results.values()) + reconciled["near_duplicates"],
+        "seconds": time.perf_counter() - t0,
+    }
+
+def reconcile_shards(paths: List[str], plan: List[dict]) -> dict:
+    """
+    Repite, shard a shard y en el orden del corpus, las decisiones de
+    index_documents sobre un índice sin repartir: cada proceso sólo vio
+    sus documentos, así que se vuelven a comparar con todos los
+    anteriores (URLs y huellas SimHash de los documentos conservados):
+    - un documento cuya URL o huella ya está en un shard anterior se
+      quita: su URL pasa a near_duplicates del documento canónico
+    - un casi duplicado se vuelve a buscar entre las huellas anteriores
+      (SimHash no es transitivo: si su documento canónico del shard se
+      quitó puede no parecerse a ningún otro) y, si ya no encaja con
+      ninguno, se analiza de nuevo y se indexa en el doc_id que dejó libre
+    Actualiza N, avgdl, df y las cotas WAND de cada shard tocado.
+    plan: el de plan_shards (documentos y primer doc_id de cada shard).
+    Devuelve {removed, restored, near_duplicates, docs: {ruta: N}, total_len}.
+    """
+    seen: Dict[str, int] = {}
+    fingerprints = SimHashIndex()
+    removed = 0
+    restored = 0
+    near_duplicates = 0
+    docs: Dict[str, int] = {}
+    total = 0
+
+    for path, shard in zip(paths, plan):
+        con = get_connection(path)
+        cursor = con.cursor()
+        meta = dict(cursor.execute("SELECT key, value FROM meta WHERE key IN ('N', 'avgdl')"))
+        N = int(meta.get("N", 0))
+        total_len = round(meta.get("avgdl", 0.0) * N)
+        positions = has_positions(cursor)
+
+        indexed = {doc_id: (url, simhash) for doc_id, url, simhash in cursor.execute(
+            "SELECT doc_id, url, simhash FROM docs")}
+        dropped = {doc_path: (url, doc_id, simhash) for url, doc_id, doc_path, simhash in cursor.execute(
+            "SELECT url, doc_id, path, simhash FROM near_duplicates WHERE simhash IS NOT NULL")}
+        touched: Set[int] = set()
+
+        for position, doc_path in enumerate(shard["documents"]):
+            doc_id = shard["first_doc_id"] + position
+
+            if doc_id in indexed:
+                url, simhash = indexed[doc_id]
+                canonical = seen.get(url)
+                # URL ya indexada: index_documents la salta sin anotarla
+                redirects = [] if canonical is not None else [(url, doc_path, simhash)]
+                if canonical is None and simhash is not None:
+                    canonical = fingerprints.find(to_unsigned(simhash))
+                if canonical is None:
+                    if simhash is not None:
+                        fingerprints.add(to_unsigned(simhash), doc_id)
+                    continue
+
+                print(f"[SKIP] {url} (doc_id={doc_id}) repetida en otro shard: doc_id={canonical}")
+                # los descartados por el crawler siguen al documento; los
+                # casi duplicados del shard se revisan en su posición
+                redirects += cursor.execute(
+                    "SELECT url, path, simhash FROM near_duplicates WHERE doc_id=? AND simhash IS NULL", (doc_id,)
+                ).fetchall()
+                total_len -= remove_document(cursor, doc_id, touched)
+                cursor.execute("UPDATE manifest SET doc_id=NULL WHERE doc_id=?", (doc_id,))
+                N -= 1
+                removed += 1
+                near_duplicates += bool(redirects) and redirects[0][0] == url
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO near_duplicates(url, doc_id, path, simhash) VALUES (?, ?, ?, ?)",
+                    [(dup_url, canonical, dup_path, dup_simhash) for dup_url, dup_path, dup_simhash in redirects]
+                )
+                continue
+
+            if doc_path not in dropped:
+                continue
+            url, shard_canonical, simhash = dropped[doc_path]
+            if url in seen:
+                cursor.execute("DELETE FROM near_duplicates WHERE url=?", (url,))
+                near_duplicates -= 1
+                continue
+            canonical = fingerprints.find(to_unsigned(simhash))
+            if canonical is not None:
+                # si su documento del shard se quitó, remove_document borró la fila
+                if canonical != shard_canonical:
+                    cursor.execute(
+                        "INSERT OR REPLACE INTO near_duplicates(url, doc_id, path, simhash) VALUES (?, ?, ?, ?)",
+                        (url, canonical, doc_path, simhash)
+                    )
+                continue
+
+            # ya no es casi duplicado de nada anterior: se indexa
+            cursor.execute("DELETE FROM near_duplicates WHERE url=?", (url,))
+            near_duplicates -= 1
+            doc = analyze_document(doc_path, positions=positions)
+            if doc is None:
+                continue
+            print(f">>> Indexando doc_id={doc_id} ({doc['filename']}): su casi duplicado se quitó del shard")
+            touched.update(add_document(cursor, doc_id, doc))
+            cursor.execute("UPDATE manifest SET doc_id=? WHERE path=?", (doc_id, doc_path))
+            fingerprints.add(to_unsigned(simhash), doc_id)
+            N += 1
+            total_len += doc["length"]
+            restored += 1
+
+        if touched:
+            avgdl = (total_len / N) if N > 0 else 0.0
+            cursor.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", ("N", N))
+            cursor.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", ("avgdl", avgdl))
+            refresh_score_bounds(con, touched)
+            bump_generation(cursor)
+        con.commit()
+
+        # los shards siguientes se comparan con éste
+        seen.update(cursor.execute("SELECT url, doc_id FROM docs"))
+        seen.update(cursor.execute("SELECT url, doc_id FROM near_duplicates"))
+        con.close()
+
+        docs[path] = N
+        total += total_len
+
+    return {"removed": removed, "restored": restored, "near_duplicates": near_duplicates,
+            "docs": docs, "total_len": total}
+
+def run_shards_pagerank(paths: List[str], verbose: bool = False) -> dict:
+    """
+    PageRank sobre todos los shards: nodos = documentos de todos ellos;
+    aristas = enlaces salientes (outlinks) resueltos por URL contra los
+    documentos y casi duplicados de cualquier shard. Cada shard guarda
+    en pagerank el valor de sus documentos.
+    """
+    doc_ids = []
+    by_url: Dict[str, int] = {}
+    edges = []
+    for path in paths:
+        con = get_connection(path)
+        doc_ids.extend(doc_id for (doc_id,) in con.execute("SELECT doc_id FROM docs"))
+        by_url.update(con.execute("SELECT url, doc_id FROM near_duplicates"))
+        by_url.update(con.execute("SELECT url, doc_id FROM docs"))
+        con.close()
+    for path in paths:
+        con = get_connection(path)
+        for from_doc_id, url in con.execute("SELECT from_doc_id, url FROM outlinks"):
+            to_doc_id = by_url.get(url)
+            if to_doc_id is not None:
+                edges.append((from_doc_id, to_doc_id))
+        con.close()
+
+    nodes = np.array(sorted(doc_ids), dtype=np.int64)
+    src, dst = build_edge_arrays(nodes, np.array(edges, dtype=np.int64).reshape(-1, 2))
+    t0 = time.perf_counter()
+    pr, info = pagerank_arrays(len(nodes), src, dst)
+    info["seconds"] = time.perf_counter() - t0
+    if verbose:
+        print(f"[PageRank] shards: {len(nodes)} nodos, {len(src)} aristas, "
+              f"{info['iterations']} iteraciones ({info['seconds']:.3f}s)")
+
+    ranks = dict(zip(nodes.tolist(), pr.tolist()))
+    for path in paths:
+        con = get_connection(path)
+        cur = con.cursor()
+        cur.execute("DELETE FROM pagerank")
+        cur.executemany(
+            "INSERT INTO pagerank(doc_id, rank) VALUES (?, ?)",
+            ((doc_id, ranks[doc_id]) for (doc_id,) in cur.execute("SELECT doc_id FROM docs").fetchall())
+        )
+        bump_generation(cur)
+        con.commit()
+        con.close()
+
+    return {key: info[key] for key in ("iterations", "residual", "converged", "seconds")}
+
+# ======================================================
+# Consulta
+# ======================================================
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+def shard_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SHARD_QUERY_WORKERS, thread_name_prefix="shard")
+    return _executor
+
+def _on_shard(fn, path: str, args: tuple):
+    return fn(get_read_connection(path), *args)
+
+def scatter(fn, paths: List[str], *args) -> list:
+    """
+    fn(ReadConnection del shard, *args) en cada shard a la vez, con la
+    conexión de lectura que cada hilo del pool guarda por shard.
+    Resultados en el orden de paths.
+    """
+    futures = [shard_executor().submit(_on_shard, fn, path, args) for path in paths]
+    return [future.result() for future in futures]
+
+def merge_shard_stats(stats: List[dict]) -> dict:
+    """
+    N, avgdl, capa posicional y PageRank máximo de toda la colección a
+    partir de los de cada shard (ReadConnection.stats). avgdl se
+    recompone desde las longitudes totales, como en el índice único.
+    """
+    N = sum(int(s["N"]) for s in stats)
+    total_len = sum(round(s["avgdl"] * s["N"]) for s in stats)
+    return {
+        "N": N,
+        "avgdl": total_len / N if N else 1,
+        "positions": bool(stats) and all(s["positions"] for s in stats),
+        "max_pagerank": max((s["max_pagerank"] for s in stats), default=1.0),
+    }
+
+def shard_terms(reader: ReadConnection, terms: List[str]) -> Tuple[dict, Dict[str, int]]:
+    found = lookup_terms(reader.con.cursor(), terms)
+    return reader.stats, {term: doc_freq for term, (_, doc_freq, _) in found.items()}
+
+def shard_bm25(reader: ReadConnection, query_terms, k1, b, topk, algorithm, doc_filter, stats, doc_freqs):
+    return bm25_score(query_terms, k1=k1, b=b, topk=topk, con=reader.con, algorithm=algorithm,
+                      doc_filter=doc_filter, stats=stats, doc_freqs=doc_freqs)
+
+def bm25_score_shards(query_terms: List[str], k1=BM25_K1, b=BM25_B, topk=10, algorithm: str = "exhaustive",
+                      doc_filter: Optional[Set[int]] = None,
+                      shard_dir: Optional[str] = None) -> List[Tuple[int, float]]:
+    """
+    bm25_score sobre el índice por shards, en dos rondas en paralelo:
+    1) N, avgdl y df de los términos de cada shard → estadísticas globales
+    2) top-k de cada shard con esas estadísticas (exhaustivo o WAND)
+    y fusión de los top-k (empates: gana el doc_id menor, como en top_k).
+    """
+    paths = shard_paths(shard_dir)
+    if not paths:
+        raise FileNotFoundError(f"No hay índice por shards en {shard_dir or default_shard_dir()}")
+
+    terms = list(dict.fromkeys(query_terms))
+    per_shard = scatter(shard_terms, paths, terms)
+    stats = merge_shard_stats([shard_stats for shard_stats, _ in per_shard])
+    if stats["N"] == 0:
+        return []
+    doc_freqs = {term: sum(dfs.get(term, 0) for _, dfs in per_shard) for term in terms}
+
+    ranked = scatter(shard_bm25, paths, query_terms, k1, b, topk, algorithm, doc_filter,
+                     (stats["N"], stats["avgdl"]), doc_freqs)
+    return heapq.nlargest(topk, chain.from_iterable(ranked), key=lambda item: (item[1], -item[0]))
+
+class ShardSet:
+    """
+    Lectura del índice por shards para /search, con las conexiones del
+    hilo actual: estadísticas globales, generación (la de cada shard) y
+    en qué shard está cada documento.
+    """
+
+    def __init__(self, shard_dir: Optional[str] = None):
+        self.paths = shard_paths(shard_dir)
+        if not self.paths:
+            raise FileNotFoundError(f"No hay índice por shards en {shard_dir or default_shard_dir()}")
+        self.readers = [get_read_connection(path) for path in self.paths]
+        self.generation = tuple(reader.generation for reader in self.readers)
+        self.stats = merge_shard_stats([reader.stats for reader in self.readers])
+
+    def matching_docs(self, parsed: Dict[str, list]) -> Optional[Set[int]]:
+        """
+        Unión de los documentos de cada shard que cumplen frases y NEAR.
+        """
+        found = scatter(lambda reader: matching_docs(reader.con, parsed), self.paths)
+        if all(docs is None for docs in found):
+            return None
+        return set().union(*(docs for docs in found if docs))
+
+    def owners(self, doc_ids: List[int]) -> Dict[int, sqlite3.Connection]:
+        """
+        {doc_id: conexión del shard que lo guarda}.
+        """
+        result = {}
+        if not doc_ids:
+            return result
+        placeholders = ",".join("?" * len(doc_ids))
+        for reader in self.readers:
+            for (doc_id,) in reader.con.execute(
+                f"SELECT doc_id FROM docs WHERE doc_id IN ({placeholders})", doc_ids
+            ):
+                result[doc_id] = reader.con
+        return result
+
+if __name__ == "__main__":
+    raw_dir, n_shards = sys.argv[1], int(sys.argv[2])
+    shard_dir = sys.argv[3] if len(sys.argv) > 3 else None
+    result = build_shards(raw_dir, n_shards, shard_dir=shard_dir)
+    info = run_shards_pagerank([shard["path"] for shard in result["shards"]], verbose=True)
+    print(
+        f"Índice por shards: {result['indexed_docs']} documentos en {len(result['shards'])} shards "
+        f"({result['cross_shard_duplicates']} duplicados entre shards) en {result['seconds']:.1f}s; "
+        f"PageRank en {info['iterations']} iteraciones"
+    )
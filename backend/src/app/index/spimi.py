@@ -0,0 +1,105 @@
+"""
+Runs ordenados en disco para la indexación SPIMI (index_documents).
+
+index_documents ya no guarda en memoria postings, df ni enlaces de todo
+el corpus: los acumula en RunBuffer hasta agotar el presupuesto de
+memoria, los vuelca ordenados a un fichero temporal (run) y al final
+fusiona los runs con heapq.merge. La fusión produce las tuplas en orden
+global (postings por (term, doc_id), enlaces por URL destino), así que
+df se cuenta sobre la marcha y los enlaces se resuelven con un join
+por mezcla contra docs ordenada por url.
+
+Formato de un run: listas de RUN_CHUNK tuplas serializadas con pickle
+una detrás de otra. Con más de MERGE_FAN_IN runs se fusionan antes por
+grupos, para que los buffers de lectura abiertos a la vez estén acotados.
+"""
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+from typing import Iterable, Iterator, List
+
+from . import storage
+
+RUN_CHUNK = 2048
+MERGE_FAN_IN = 64
+
+def make_run_dir() -> str:
+    """
+    Directorio temporal para los runs, junto a la base de datos (/tmp
+    puede estar en memoria, lo que anularía el presupuesto).
+    """
+    return tempfile.mkdtemp(prefix="spimi-", dir=os.path.dirname(storage.DB_PATH) or ".")
+
+def remove_run_dir(run_dir: str):
+    shutil.rmtree(run_dir, ignore_errors=True)
+
+def write_run(path: str, items: Iterable[tuple]):
+    with open(path, "wb") as f:
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= RUN_CHUNK:
+                pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+                chunk = []
+        if chunk:
+            pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+
+def read_run(path: str) -> Iterator[tuple]:
+    with open(path, "rb") as f:
+        while True:
+            try:
+                chunk = pickle.load(f)
+            except EOFError:
+                return
+            yield from chunk
+
+class RunBuffer:
+    """
+    Tuplas pendientes de un tipo (postings, posiciones o enlaces). flush()
+    las escribe ordenadas como un run nuevo; merged() devuelve todas las
+    tuplas en orden, leyendo los runs (o solo la memoria si nunca se
+    volcó nada).
+    """
+
+    def __init__(self, run_dir: str, name: str):
+        self.run_dir = run_dir
+        self.name = name
+        self.items: List[tuple] = []
+        self.runs: List[str] = []
+        self.run_count = 0
+
+    def extend(self, items: Iterable[tuple]):
+        self.items.extend(items)
+
+    def _new_run_path(self) -> str:
+        self.run_count += 1
+        return os.path.join(self.run_dir, f"{self.name}-{self.run_count:05d}.run")
+
+    def flush(self):
+        if not self.items:
+            return
+        self.items.sort()
+        path = self._new_run_path()
+        write_run(path, self.items)
+        self.runs.append(path)
+        self.items = []
+
+    def merged(self) -> Iterator[tuple]:
+        if not self.runs:
+            self.items.sort()
+            items, self.items = self.items, []
+            return iter(items)
+
+        self.flush()
+        # fusión en varios niveles si hay demasiados runs
+        while len(self.runs) > MERGE_FAN_IN:
+            group, rest = self.runs[:MERGE_FAN_IN], self.runs[MERGE_FAN_IN:]
+            self.runs = rest
+            path = self._new_run_path()
+            write_run(path, heapq.merge(*map(read_run, group)))
+            for old in group:
+                os.remove(old)
+            self.runs.append(path)
+        return heapq.merge(*map(read_run, self.runs))
@@ -1,5 +1,8 @@
 import sqlite3
 import os
+import threading
+from urllib.parse import quote
+from typing import Dict, List, Optional
 
 from app.core.paths import data_index_dir
 
@@ -10,21 +13,125 @@ DATA_INDEX_DIRECTORY = data_index_dir()
 DB_PATH = os.path.join(DATA_INDEX_DIRECTORY, "ri_index.db")
 # ============================================================
 
-def get_connection():
+# Índices secundarios que la carga masiva elimina y reconstruye al final
+SECONDARY_INDEXES = {
+    "idx_links_from":    "CREATE INDEX IF NOT EXISTS idx_links_from ON links(from_doc_id);",
+    "idx_links_to":      "CREATE INDEX IF NOT EXISTS idx_links_to   ON links(to_doc_id);",
+    "idx_postings_doc":  "CREATE INDEX IF NOT EXISTS idx_postings_doc  ON postings(doc_id);",
+    "idx_outlinks_from": "CREATE INDEX IF NOT EXISTS idx_outlinks_from ON outlinks(from_doc_id);",
+    "idx_outlinks_url":  "CREATE INDEX IF NOT EXISTS idx_outlinks_url  ON outlinks(url);",
+    "idx_positions_doc": "CREATE INDEX IF NOT EXISTS idx_positions_doc ON positions(doc_id);",
+}
+
+# Términos por consulta al traducir términos a term_id (límite de variables de SQLite)
+TERM_LOOKUP_BATCH = 500
+
+# Caché de páginas durante la carga masiva (valor negativo = KiB → 256 MB)
+BULK_CACHE_SIZE = -262144
+
+# Sentencias preparadas que guarda cada conexión de lectura del pool
+READ_CACHED_STATEMENTS = 256
+
+# Caché de páginas de cada conexión de lectura (KiB → 64 MB)
+READ_CACHE_SIZE = -65536
+
+def get_connection(db_path: Optional[str] = None):
     """
     Devuelve una conexión SQLite a la base de datos
-    ri_index.db en la ruta global de índice.
+    ri_index.db en la ruta global de índice (o a db_path, p. ej. un shard).
     """
     # Aseguramos que exista el directorio primero
     os.makedirs(DATA_INDEX_DIRECTORY, exist_ok=True)
 
-    con = sqlite3.connect(DB_PATH)
+    con = sqlite3.connect(db_path or DB_PATH)
     # Opciones de rendimiento
     con.execute("PRAGMA journal_mode=WAL;")
     con.execute("PRAGMA synchronous=NORMAL;")
     con.execute("PRAGMA foreign_keys=ON;")
     return con
 
+def get_generation(con) -> int:
+    """
+    Generación actual del índice publicado (meta.generation). Cambia cada
+    vez que se indexa o se recalcula PageRank; la caché de /search la
+    usa para saber si sus resultados siguen siendo válidos.
+    """
+    row = con.execute("SELECT value FROM meta WHERE key='generation'").fetchone()
+    return int(row[0]) if row else 0
+
+def bump_generation(cursor):
+    """
+    Publica una nueva generación (se confirma con el commit del llamador).
+    """
+    cursor.execute(
+        "INSERT INTO meta(key, value) VALUES ('generation', 1) "
+        "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+    )
+
+class ReadConnection:
+    """
+    Conexión de sólo lectura (URI mode=ro) de un hilo, con las
+    estadísticas globales ya cargadas:
+    - N, avgdl: colección (BM25)
+    - max_pagerank: máximo de PageRank (normalización en /search)
+    - positions: si el índice tiene capa posicional
+    - generation: generación del índice con la que se abrió
+    Las sentencias preparadas quedan en la caché de sqlite3
+    (cached_statements), así que cada SQL repetido se compila una vez.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.con = sqlite3.connect(
+            f"file:{quote(db_path)}?mode=ro",
+            uri=True,
+            cached_statements=READ_CACHED_STATEMENTS,
+        )
+        self.con.execute(f"PRAGMA cache_size={READ_CACHE_SIZE};")
+        self.generation = get_generation(self.con)
+        self.stats = self._load_stats()
+
+    def _load_stats(self) -> Dict[str, float]:
+        meta = dict(self.con.execute(
+            "SELECT key, value FROM meta WHERE key IN ('N', 'avgdl', 'positions')"
+        ))
+        row = self.con.execute("SELECT MAX(rank) FROM pagerank").fetchone()
+        return {
+            "N": meta.get("N", 0),
+            "avgdl": meta.get("avgdl", 1),
+            "positions": bool(meta.get("positions")),
+            "max_pagerank": row[0] if row and row[0] not in (None, 0) else 1.0,
+        }
+
+    def close(self):
+        self.con.close()
+
+_read_local = threading.local()
+
+def get_read_connection(db_path: Optional[str] = None) -> ReadConnection:
+    """
+    Conexión de lectura del hilo actual (los endpoints síncronos de
+    FastAPI se ejecutan en un pool de hilos, así que cada trabajador
+    reutiliza la suya entre peticiones). Se recicla si se publicó una
+    nueva generación del índice o si cambió DB_PATH. No hay que cerrarla.
+    db_path: otra base de datos (un shard); cada hilo guarda una
+    conexión por ruta.
+    """
+    path = db_path or DB_PATH
+    readers: Dict[Optional[str], ReadConnection] = getattr(_read_local, "readers", None)
+    if readers is None:
+        readers = _read_local.readers = {}
+    reader = readers.get(db_path)
+
+    if reader is not None:
+        if reader.db_path == path and get_generation(reader.con) == reader.generation:
+            return reader
+        reader.close()
+
+    reader = ReadConnection(path)
+    readers[db_path] = reader
+    return reader
+
 def init_db():
     """
     Inicializa la base de datos creando todas las tablas
@@ -33,6 +140,10 @@ def init_db():
     con = get_connection()
     cur = con.cursor()
 
+    # === Índices con postings por término en texto: pasar a term_id ===
+    if has_legacy_postings(con):
+        migrate_term_dictionary(con)
+
     # === Crear esquema base si no existe ===
     cur.executescript("""
     CREATE TABLE IF NOT EXISTS docs(
@@ -40,20 +151,26 @@ def init_db():
         url TEXT UNIQUE,
         title TEXT,
         path TEXT UNIQUE,
-        length INTEGER
+        length INTEGER,
+        simhash INTEGER
+    );
+
+    -- Diccionario de términos: df y cota BM25 (max_score) de cada uno
+    CREATE TABLE IF NOT EXISTS terms(
+        term_id INTEGER PRIMARY KEY,
+        term TEXT NOT NULL UNIQUE,
+        df INTEGER,
+        max_score REAL
     );
 
+    -- Agrupadas por (term_id, doc_id): la lista de un término es un
+    -- rango contiguo de la clave primaria, sin índice aparte
     CREATE TABLE IF NOT EXISTS postings(
-        term TEXT,
+        term_id INTEGER,
         doc_id INTEGER,
         tf INTEGER,
-        PRIMARY KEY (term, doc_id)
-    );
-
-    CREATE TABLE IF NOT EXISTS df(
-        term TEXT PRIMARY KEY,
-        doc_freq INTEGER
-    );
+        PRIMARY KEY (term_id, doc_id)
+    ) WITHOUT ROWID;
 
     CREATE TABLE IF NOT EXISTS meta(
         key TEXT PRIMARY KEY,
@@ -72,16 +189,64 @@ def init_db():
         rank REAL,
         FOREIGN KEY(doc_id) REFERENCES docs(doc_id)
     );
-    """)
 
-    # === Índices para acelerar consultas sobre el grafo ===
-    cur.executescript("""
-    CREATE INDEX IF NOT EXISTS idx_links_from ON links(from_doc_id);
-    CREATE INDEX IF NOT EXISTS idx_links_to   ON links(to_doc_id);
-    CREATE INDEX IF NOT EXISTS idx_postings_term ON postings(term);
-    CREATE INDEX IF NOT EXISTS idx_postings_doc  ON postings(doc_id);
+    -- Texto visible normalizado de cada documento (zlib), para snippets.
+    -- token_offset: posición (en positions) de su primera palabra
+    CREATE TABLE IF NOT EXISTS doc_text(
+        doc_id INTEGER PRIMARY KEY,
+        text BLOB,
+        token_offset INTEGER DEFAULT 0,
+        FOREIGN KEY(doc_id) REFERENCES docs(doc_id)
+    );
+
+    -- Postings posicionales opcionales (ver positions.py)
+    CREATE TABLE IF NOT EXISTS positions(
+        term_id INTEGER,
+        doc_id INTEGER,
+        data BLOB,
+        PRIMARY KEY (term_id, doc_id)
+    ) WITHOUT ROWID;
+
+    -- PageRank anterior por URL: sobrevive a la reindexación
+    -- (que renumera doc_id) y sirve de arranque en caliente
+    CREATE TABLE IF NOT EXISTS pagerank_prev(
+        url TEXT PRIMARY KEY,
+        rank REAL
+    );
+
+    -- Enlaces salientes sin resolver (URL destino), para poder
+    -- reconstruir links cuando aparece o vuelve un documento
+    CREATE TABLE IF NOT EXISTS outlinks(
+        from_doc_id INTEGER,
+        url TEXT
+    );
+
+    -- Estado de cada archivo de raw_dir en la última indexación.
+    -- doc_id es NULL si el archivo no produjo documento (vacío,
+    -- sin tokens útiles o URL repetida).
+    CREATE TABLE IF NOT EXISTS manifest(
+        path TEXT PRIMARY KEY,
+        size INTEGER,
+        mtime_ns INTEGER,
+        sha1 TEXT,
+        doc_id INTEGER
+    );
+
+    -- URLs casi duplicadas de un documento indexado (SimHash, ver
+    -- app/core/simhash.py): no se indexan, pero los enlaces hacia
+    -- ellas cuentan para doc_id. path es NULL si la descartó el crawler
+    CREATE TABLE IF NOT EXISTS near_duplicates(
+        url TEXT PRIMARY KEY,
+        doc_id INTEGER,
+        path TEXT,
+        simhash INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_near_duplicates_doc ON near_duplicates(doc_id);
     """)
 
+    # === Índices para acelerar consultas sobre el grafo y postings ===
+    cur.executescript("\n".join(SECONDARY_INDEXES.values()))
+
     con.commit()
 
     # === Asegurar columnas adicionales si faltan ===
@@ -89,6 +254,55 @@ def init_db():
 
     con.close()
 
+def begin_bulk_load(con, memory_budget: Optional[int] = None):
+    """
+    Prepara la conexión para una construcción masiva del índice:
+    - relaja la durabilidad y amplía la caché mientras dura la carga
+    - abre la transacción de la carga y elimina en ella los índices
+      secundarios (se reconstruyen en end_bulk_load)
+    Con memory_budget (bytes) la caché no pasa de ese tamaño y las
+    ordenaciones temporales (CREATE INDEX) van a disco, para que la carga
+    no crezca con el tamaño del índice.
+    Nada se confirma hasta end_bulk_load: si la carga se cancela o falla,
+    con.rollback() deja el índice anterior con sus índices secundarios.
+    """
+    cur = con.cursor()
+    cache_size, temp_store = BULK_CACHE_SIZE, "MEMORY"
+    if memory_budget is not None:
+        cache_size, temp_store = max(BULK_CACHE_SIZE, -(memory_budget // 1024)), "FILE"
+
+    # los PRAGMA no se pueden cambiar dentro de una transacción
+    con.commit()
+    cur.execute("PRAGMA synchronous=OFF;")
+    cur.execute(f"PRAGMA cache_size={cache_size};")
+    cur.execute(f"PRAGMA temp_store={temp_store};")
+
+    cur.execute("BEGIN;")
+    for name in SECONDARY_INDEXES:
+        cur.execute(f"DROP INDEX IF EXISTS {name};")
+
+def end_bulk_load(con):
+    """
+    Cierra una construcción masiva: crea los índices secundarios
+    de una sola vez (ordenando en bloque), confirma la transacción de la
+    carga y restaura los PRAGMA habituales de get_connection().
+    """
+    cur = con.cursor()
+    for ddl in SECONDARY_INDEXES.values():
+        cur.execute(ddl)
+    con.commit()
+    restore_pragmas(con)
+
+def restore_pragmas(con):
+    """
+    PRAGMA habituales de get_connection() (tras una carga masiva,
+    también si se deshizo).
+    """
+    cur = con.cursor()
+    cur.execute("PRAGMA synchronous=NORMAL;")
+    cur.execute("PRAGMA cache_size=-2000;")
+    cur.execute("PRAGMA temp_store=DEFAULT;")
+
 def ensure_columns(con):
     """
     Comprueba columnas extras y las agrega si faltan.
@@ -105,7 +319,8 @@ def ensure_columns(con):
         "url": "TEXT",
         "title": "TEXT",
         "path": "TEXT",
-        "length": "INTEGER"
+        "length": "INTEGER",
+        "simhash": "INTEGER"
     }
 
     for col, col_type in required_cols.items():
@@ -121,7 +336,128 @@ def ensure_columns(con):
         print(">>> Agregando columna 'rank' a pagerank")
         cursor.execute("ALTER TABLE pagerank ADD COLUMN rank REAL;")
 
+    # ---- Revisar columnas en doc_text ----
+    cursor.execute("PRAGMA table_info(doc_text);")
+    text_cols = [row[1] for row in cursor.fetchall()]
+
+    if "token_offset" not in text_cols:
+        print(">>> Agregando columna 'token_offset' a doc_text")
+        cursor.execute("ALTER TABLE doc_text ADD COLUMN token_offset INTEGER DEFAULT 0;")
+
+    # ---- Revisar columnas en near_duplicates ----
+    cursor.execute("PRAGMA table_info(near_duplicates);")
+    dup_cols = [row[1] for row in cursor.fetchall()]
+
+    if "simhash" not in dup_cols:
+        print(">>> Agregando columna 'simhash' a near_duplicates")
+        cursor.execute("ALTER TABLE near_duplicates ADD COLUMN simhash INTEGER;")
+
+    con.commit()
+
+def table_columns(con, table: str) -> List[str]:
+    return [row[1] for row in con.execute(f"PRAGMA table_info({table});")]
+
+def has_legacy_postings(con) -> bool:
+    """
+    Indica si el índice tiene el esquema anterior a terms: postings,
+    positions y df con el término como texto en cada fila.
+    """
+    return "term" in table_columns(con, "postings")
+
+def migrate_term_dictionary(con):
+    """
+    Pasa un índice del esquema anterior (postings/positions por `term
+    TEXT`, tabla df) al actual: crea terms con un term_id por término,
+    en orden alfabético (el mismo que asigna index_documents), y reescribe
+    postings y positions como tablas WITHOUT ROWID por (term_id, doc_id).
+    Todo en una transacción; el espacio liberado se recupera con VACUUM
+    (python -m app.index.migrate_terms).
+    """
+    cur = con.cursor()
+    df_cols = table_columns(con, "df")
+    max_score = "max_score" if "max_score" in df_cols else "NULL"
+    has_positions_table = bool(table_columns(con, "positions"))
+
+    cur.execute("BEGIN")
+    cur.execute("DROP INDEX IF EXISTS idx_postings_term;")
+    cur.execute("DROP INDEX IF EXISTS idx_postings_doc;")
+    cur.execute("DROP INDEX IF EXISTS idx_positions_doc;")
+    cur.execute("""
+    CREATE TABLE terms(
+        term_id INTEGER PRIMARY KEY,
+        term TEXT NOT NULL UNIQUE,
+        df INTEGER,
+        max_score REAL
+    );
+    """)
+    if df_cols:
+        cur.execute(f"""
+            INSERT INTO terms(term, df, max_score)
+            SELECT term, doc_freq, {max_score} FROM df ORDER BY term
+        """)
+    # términos con postings que no estuvieran en df
+    cur.execute("""
+        INSERT INTO terms(term, df)
+        SELECT term, COUNT(*) FROM postings
+        WHERE term NOT IN (SELECT term FROM terms)
+        GROUP BY term ORDER BY term
+    """)
+
+    cur.execute("""
+    CREATE TABLE postings_new(
+        term_id INTEGER,
+        doc_id INTEGER,
+        tf INTEGER,
+        PRIMARY KEY (term_id, doc_id)
+    ) WITHOUT ROWID;
+    """)
+    cur.execute("""
+        INSERT INTO postings_new(term_id, doc_id, tf)
+        SELECT t.term_id, p.doc_id, p.tf FROM postings p JOIN terms t ON t.term = p.term
+        ORDER BY t.term_id, p.doc_id
+    """)
+    cur.execute("DROP TABLE postings;")
+    cur.execute("ALTER TABLE postings_new RENAME TO postings;")
+
+    cur.execute("""
+    CREATE TABLE positions_new(
+        term_id INTEGER,
+        doc_id INTEGER,
+        data BLOB,
+        PRIMARY KEY (term_id, doc_id)
+    ) WITHOUT ROWID;
+    """)
+    if has_positions_table:
+        cur.execute("""
+            INSERT INTO positions_new(term_id, doc_id, data)
+            SELECT t.term_id, p.doc_id, p.data FROM positions p JOIN terms t ON t.term = p.term
+            ORDER BY t.term_id, p.doc_id
+        """)
+        cur.execute("DROP TABLE positions;")
+    cur.execute("ALTER TABLE positions_new RENAME TO positions;")
+
+    if df_cols:
+        cur.execute("DROP TABLE df;")
+    for ddl in SECONDARY_INDEXES.values():
+        cur.execute(ddl)
+    bump_generation(cur)
     con.commit()
+    print(">>> Índice migrado a term_id (tabla terms)")
+
+def lookup_term_ids(cursor, terms) -> Dict[str, int]:
+    """
+    {término: term_id} de los términos que están en el diccionario
+    (los que no, no aparecen).
+    """
+    terms = list(terms)
+    result: Dict[str, int] = {}
+    for i in range(0, len(terms), TERM_LOOKUP_BATCH):
+        batch = terms[i:i + TERM_LOOKUP_BATCH]
+        result.update(cursor.execute(
+            f"SELECT term, term_id FROM terms WHERE term IN ({','.join('?' * len(batch))})",
+            batch
+        ).fetchall())
+    return result
 
 def reset_db():
     """
@@ -134,13 +470,20 @@ def reset_db():
     cur.executescript("""
     -- Primero las tablas dependientes
     DELETE FROM postings;
+    DELETE FROM positions;
     DELETE FROM links;
+    DELETE FROM outlinks;
+    DELETE FROM pagerank;
+    DELETE FROM doc_text;
 
     -- Luego las tablas independientes
     DELETE FROM docs;
-    DELETE FROM df;
-    DELETE FROM meta;
+    DELETE FROM terms;
+    DELETE FROM meta WHERE key != 'generation';
+    DELETE FROM manifest;
+    DELETE FROM near_duplicates;
     """)
+    bump_generation(cur)
 
     con.commit()
     con.close()
@@ -5,6 +5,7 @@ from app.api import routes_crawl
 from app.api import routes_preprocess
 from app.api import routes_index
 from app.api import routes_search
+from app.api import routes_jobs
 from app.index.storage import init_db
 
 app = FastAPI(title="Practica Final RI")
@@ -24,6 +25,7 @@ app.include_router(routes_crawl.router)
 app.include_router(routes_preprocess.router)
 app.include_router(routes_index.router)
 app.include_router(routes_search.router)
+app.include_router(routes_jobs.router)
 
 @app.get("/")
 def root():